@@ -9,16 +9,24 @@ from fastapi_cache import FastAPICache
 from starlette.middleware.cors import CORSMiddleware
 
 from consts import CACHE_CLEANUP_INTERVAL, ALLOW_ORIGINS, MAX_CONTENT_LENGTH, \
-    MAX_HEADER_LENGTH, ALLOW_METHODS, ALLOW_HEADERS
+    MAX_HEADER_LENGTH, ALLOW_METHODS, ALLOW_HEADERS, PARTITION_CHECK_INTERVAL
+from crud.transaction_partitions import create_upcoming_partitions
+from db import get_engine
 from logger import GGLogger
 from clients.memory_cache import InMemoryCache
-from db import Base, engine
 from middleware.auth import AuthMiddleware
+from middleware.metrics import MetricsMiddleware
+from middleware.sql_profiler import SQLProfilerMiddleware
 from middleware.rate_limit import RateLimitMiddleware
 from routers.auth import router as auth_router
 from routers.transactions import router as transaction_router
 from routers.players import router as player_router
+from routers.metrics import router as metrics_router
+from routers.ingest import router as ingest_router
+from routers.stats import router as stats_router
+from routers.events import router as events_router
 from utils.auth_utils import get_current_user
+from utils.sql_profiler import get_profiler_settings
 from middleware.request_size_limit import RequestSizeLimitMiddleware
 
 logger = GGLogger(__name__)
@@ -32,27 +40,41 @@ async def lifespan(app: FastAPI):
     async def cleanup_expired_keys():
         while True:
             try:
-                logger.info(cache._store.items())
                 await asyncio.sleep(CACHE_CLEANUP_INTERVAL)
                 await cache.cleanup_expired()
-                logger.info("Cache cleanup completed")
+                logger.debug("Cache cleanup completed, %s keys cached", len(cache._store))
             except asyncio.CancelledError:
                 logger.info("Cache cleanup task cancelled")
                 break
             except Exception as e:
-                logger.error(f"Error during cache cleanup: {e}")
+                logger.error("Error during cache cleanup: %s", e)
                 await asyncio.sleep(60)  # Wait a bit before retrying
 
-    cleanup_task = asyncio.create_task(cleanup_expired_keys())
+    async def create_partitions_ahead():
+        # The bootstrap created them at deploy time; this keeps them ahead while the app runs for months
+        while True:
+            try:
+                await asyncio.sleep(PARTITION_CHECK_INTERVAL)
+                created = await asyncio.to_thread(create_upcoming_partitions, get_engine())
+                logger.debug("Partition check completed, created %s", created)
+            except asyncio.CancelledError:
+                logger.info("Partition task cancelled")
+                break
+            except Exception as e:
+                logger.error("Error creating upcoming partitions: %s", e)
+
+    tasks = [asyncio.create_task(cleanup_expired_keys()), asyncio.create_task(create_partitions_ahead())]
 
     try:
         yield
     finally:
-        cleanup_task.cancel()
-        try:
-            await cleanup_task
-        except asyncio.CancelledError:
-            pass
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
 
 app = FastAPI(lifespan=lifespan)
@@ -72,12 +94,19 @@ app.add_middleware(CORSMiddleware,
                    allow_headers=ALLOW_HEADERS,
                    expose_headers=["*"]
                    )
+if get_profiler_settings().sql_profile:
+    app.add_middleware(SQLProfilerMiddleware)
+# Outermost, so latency covers the whole stack
+app.add_middleware(MetricsMiddleware)
 
 
 app.include_router(auth_router)
 app.include_router(transaction_router)
 app.include_router(player_router)
-Base.metadata.create_all(bind=engine)
+app.include_router(metrics_router)
+app.include_router(ingest_router)
+app.include_router(stats_router)
+app.include_router(events_router)
 
 @app.get("/keves")
 def get_keves(_ = Depends(get_current_user)):
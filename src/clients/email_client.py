@@ -1,13 +1,41 @@
 import os
+import re
+import select
+import time
 import email
 import imaplib
-from email.header import decode_header
+from email.header import decode_header, make_header
+from email.message import Message
 from datetime import datetime, timedelta
 import logging
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from email.utils import parseaddr
 
+from dotenv import load_dotenv
+from pydantic import SecretStr
+from pydantic_settings import BaseSettings
+
+from clients.imap_utils import MessagePart, parse_fetch_response, walk_bodystructure
+from clients.mailbox_state import MailboxSyncState
+
+
+class EmailSettings(BaseSettings):
+    email_address: str
+    email_password: SecretStr
+    email_imap_server: str = "imap.gmail.com"
+    email_folder: str = "INBOX"
+    email_sender: Optional[str] = "support@clubgg.com"
+    email_download_folder: Path = Path("email_attachments")
+    email_idle_timeout: float = 29 * 60
+    email_poll_interval: float = 60
+
+
+@lru_cache
+def get_email_settings() -> EmailSettings:
+    load_dotenv()
+    return EmailSettings()
 
 
 class EmailClient:
@@ -37,6 +65,14 @@ class EmailClient:
         # Test connection
         self.connect()
 
+    @classmethod
+    def from_settings(cls, settings: Optional[EmailSettings] = None) -> "EmailClient":
+        settings = settings or get_email_settings()
+        return cls(email_address=settings.email_address,
+                   password=settings.email_password.get_secret_value(),
+                   imap_server=settings.email_imap_server,
+                   download_folder=str(settings.email_download_folder))
+
     def setup_logging(self):
         """Configure logging"""
         logging.basicConfig(
@@ -65,6 +101,71 @@ class EmailClient:
         except Exception as e:
             self.logger.error(f"Error during disconnect: {str(e)}")
 
+    HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)]'
+
+    def _fetch(self, message_ids: List[bytes], items: str, by_uid: bool = False) -> Dict[str, Dict]:
+        """
+        Fetch `items` for all messages in a single FETCH (or UID FETCH) command
+
+        Returns:
+            Dictionary of message number (or UID) to its parsed FETCH items
+        """
+        if not message_ids:
+            return {}
+        message_set = b','.join(message_ids).decode()
+        if not by_uid:
+            _, data = self.mail.fetch(message_set, f'({items})')
+            return dict(parse_fetch_response(data))
+
+        # UID FETCH responses are still keyed by sequence number, the UID comes back as an item
+        _, data = self.mail.uid('FETCH', message_set, f'(UID {items})')
+        return {str(fields['UID']): fields for _, fields in parse_fetch_response(data) if 'UID' in fields}
+
+    @staticmethod
+    def _headers(fields: Dict) -> Message:
+        header_bytes = next((value for key, value in fields.items() if key.startswith('BODY[HEADER')), b'')
+        return email.message_from_bytes(header_bytes or b'')
+
+    def _summaries(self, message_ids: List[bytes],
+                   by_uid: bool = False) -> List[Tuple[bytes, Message, List[MessagePart]]]:
+        """Headers and MIME structure of the messages, without downloading any message body"""
+        fetched = self._fetch(message_ids, f'BODYSTRUCTURE {self.HEADER_FIELDS}', by_uid)
+        summaries = []
+        for num in message_ids:
+            fields = fetched.get(num.decode())
+            if fields is None:
+                continue
+            parts = walk_bodystructure(fields.get('BODYSTRUCTURE') or [])
+            summaries.append((num, self._headers(fields), parts))
+        return summaries
+
+    def _fetch_parts(self, parts_by_message: Dict[bytes, List[MessagePart]],
+                     by_uid: bool = False) -> Dict[Tuple[bytes, str], bytes]:
+        """
+        Download and decode only the given MIME parts
+
+        Messages asking for the same sections share one FETCH command.
+
+        Returns:
+            Dictionary of (message number, part number) to the decoded part content
+        """
+        by_sections: Dict[Tuple[str, ...], List[bytes]] = {}
+        for num, parts in parts_by_message.items():
+            if parts:
+                by_sections.setdefault(tuple(part.part for part in parts), []).append(num)
+
+        contents = {}
+        for sections, message_ids in by_sections.items():
+            items = ' '.join(f'BODY.PEEK[{section}]' for section in sections)
+            fetched = self._fetch(message_ids, items, by_uid)
+            for num in message_ids:
+                fields = fetched.get(num.decode(), {})
+                for part in parts_by_message[num]:
+                    payload = fields.get(f'BODY[{part.part}]')
+                    if isinstance(payload, bytes):
+                        contents[(num, part.part)] = part.decode(payload)
+        return contents
+
     def get_emails(self,
                    folder: str = "INBOX",
                    days: int = 1,
@@ -73,6 +174,8 @@ class EmailClient:
         """
         Fetch emails from specified folder
 
+        Only headers and BODYSTRUCTURE are transferred, attachments are listed without being downloaded.
+
         Args:
             folder: Email folder to search
             days: Number of days to look back
@@ -108,35 +211,14 @@ class EmailClient:
             _, message_numbers = self.mail.search(None, search_string)
 
             emails = []
-            for num in message_numbers[0].split():
-                _, msg_data = self.mail.fetch(num, '(RFC822)')
-                email_body = msg_data[0][1]
-                message = email.message_from_bytes(email_body)
-
+            for num, message, parts in self._summaries(message_numbers[0].split()):
                 # Get email metadata
-                subject = decode_header(message["subject"])[0][0]
-                if isinstance(subject, bytes):
-                    subject = subject.decode()
-
-                from_ = decode_header(message["from"])[0][0]
-                if isinstance(from_, bytes):
-                    from_ = from_.decode()
-
+                subject = self.decode_email_string(message["subject"] or "")
+                from_ = self.decode_email_string(message["from"] or "")
                 date_ = email.utils.parsedate_to_datetime(message["date"])
 
                 # Get attachments info
-                attachments = []
-                for part in message.walk():
-                    if part.get_content_maintype() == 'multipart':
-                        continue
-                    if part.get('Content-Disposition') is None:
-                        continue
-
-                    filename = part.get_filename()
-                    if filename:
-                        if isinstance(filename, bytes):
-                            filename = filename.decode()
-                        attachments.append(filename)
+                attachments = [part.filename for part in parts if part.is_attachment]
 
                 emails.append({
                     'id': num,
@@ -156,47 +238,53 @@ class EmailClient:
 
     def download_attachments(self,
                              email_id: bytes,
-                             file_extensions: Optional[List[str]] = None) -> List[Path]:
+                             file_extensions: Optional[List[str]] = None,
+                             by_uid: bool = False) -> List[Path]:
         """
         Download attachments from specific email
 
+        The message structure is fetched first and only the matching attachment parts are downloaded.
+
         Args:
             email_id: Email ID to download attachments from
             file_extensions: List of file extensions to download (e.g., ['.csv', '.xlsx'])
+            by_uid: Whether email_id is a UID (as returned by sync_new_emails) rather than a sequence number
 
         Returns:
             List of paths to downloaded files
         """
         try:
-            _, msg_data = self.mail.fetch(email_id, '(RFC822)')
-            email_body = msg_data[0][1]
-            message = email.message_from_bytes(email_body)
-
-            downloaded_files = []
+            summaries = self._summaries([email_id], by_uid)
+            if not summaries:
+                return []
+            _, _, parts = summaries[0]
 
-            for part in message.walk():
-                if part.get_content_maintype() == 'multipart':
-                    continue
-                if part.get('Content-Disposition') is None:
+            wanted = []
+            for part in parts:
+                if not part.is_attachment:
                     continue
+                # Check file extension if filter is provided
+                if file_extensions:
+                    if not any(part.filename.lower().endswith(ext.lower())
+                               for ext in file_extensions):
+                        continue
+                wanted.append(part)
 
-                filename = part.get_filename()
-                if filename:
-                    if isinstance(filename, bytes):
-                        filename = filename.decode()
+            contents = self._fetch_parts({email_id: wanted}, by_uid)
 
-                    # Check file extension if filter is provided
-                    if file_extensions:
-                        if not any(filename.lower().endswith(ext.lower())
-                                   for ext in file_extensions):
-                            continue
+            downloaded_files = []
+            for part in wanted:
+                content = contents.get((email_id, part.part))
+                if content is None:
+                    self.logger.warning(f"Could not download attachment: {part.filename}")
+                    continue
 
-                    filepath = self.download_folder / filename
-                    with open(filepath, 'wb') as f:
-                        f.write(part.get_payload(decode=True))
+                filepath = self.download_folder / Path(part.filename).name
+                with open(filepath, 'wb') as f:
+                    f.write(content)
 
-                    downloaded_files.append(filepath)
-                    self.logger.info(f"Downloaded: {filename}")
+                downloaded_files.append(filepath)
+                self.logger.info(f"Downloaded: {part.filename}")
 
             return downloaded_files
 
@@ -231,18 +319,24 @@ class EmailClient:
             # Search for emails from sender
             _, message_numbers = self.mail.search(None, f'FROM "{sender_address}"')
 
-            emails = []
             message_numbers = message_numbers[0].split()
 
             # Apply limit if specified
             if limit:
                 message_numbers = message_numbers[-limit:]
 
-            for num in message_numbers:
-                _, msg_data = self.mail.fetch(num, '(RFC822)')
-                email_body = msg_data[0][1]
-                message = email.message_from_bytes(email_body)
+            summaries = self._summaries(message_numbers)
 
+            # Download only the text parts, and only when the body was asked for
+            body_contents = {}
+            if include_body:
+                body_contents = self._fetch_parts({
+                    num: [part for part in parts if not part.is_attachment and part.content_type.startswith('text/')]
+                    for num, _, parts in summaries
+                })
+
+            emails = []
+            for num, message, parts in summaries:
                 # Get basic email info
                 subject = self.decode_email_string(message["subject"] or "")
                 from_header = self.decode_email_string(message["from"] or "")
@@ -256,31 +350,7 @@ class EmailClient:
                     date = None
 
                 # Get attachments info
-                attachments = []
-                body_content = ""
-
-                for part in message.walk():
-                    # Handle attachments
-                    if part.get_content_maintype() == 'multipart':
-                        continue
-                    if part.get('Content-Disposition') is not None:
-                        filename = part.get_filename()
-                        if filename:
-                            if isinstance(filename, bytes):
-                                filename = filename.decode()
-                            attachments.append(filename)
-
-                    # Handle email body
-                    elif include_body and part.get_content_maintype() == 'text':
-                        try:
-                            content = part.get_payload(decode=True).decode()
-                            if part.get_content_subtype() == 'plain':
-                                body_content += content + "\n"
-                            elif part.get_content_subtype() == 'html' and not body_content:
-                                # Only use HTML if we don't have plain text
-                                body_content += content + "\n"
-                        except:
-                            self.logger.warning(f"Could not decode email body for message {num}")
+                attachments = [part.filename for part in parts if part.is_attachment]
 
                 email_data = {
                     'id': num,
@@ -293,7 +363,7 @@ class EmailClient:
                 }
 
                 if include_body:
-                    email_data['body'] = body_content.strip()
+                    email_data['body'] = self._body_text(num, parts, body_contents)
 
                 emails.append(email_data)
 
@@ -304,10 +374,162 @@ class EmailClient:
         finally:
             self.disconnect()
 
-    def mark_as_read(self, email_id: bytes):
+    def _body_text(self, num: bytes, parts: List[MessagePart], contents: Dict[Tuple[bytes, str], bytes]) -> str:
+        body_content = ""
+        for part in parts:
+            content = contents.get((num, part.part))
+            if content is None:
+                continue
+            try:
+                text = content.decode(part.charset or 'utf-8')
+            except (LookupError, UnicodeDecodeError):
+                self.logger.warning(f"Could not decode email body for message {num}")
+                continue
+            if part.content_type == 'text/plain':
+                body_content += text + "\n"
+            elif part.content_type == 'text/html' and not body_content:
+                # Only use HTML if we don't have plain text
+                body_content += text + "\n"
+        return body_content.strip()
+
+    @staticmethod
+    def decode_email_string(value: str) -> str:
+        """Decode RFC 2047 encoded header values"""
+        return str(make_header(decode_header(value)))
+
+    def _uidvalidity(self, folder: str) -> int:
+        _, data = self.mail.status(folder, '(UIDVALIDITY)')
+        match = re.search(rb'UIDVALIDITY (\d+)', data[0] or b'')
+        if not match:
+            raise ValueError(f"Server did not report UIDVALIDITY for {folder}")
+        return int(match.group(1))
+
+    def sync_new_emails(self,
+                        state: MailboxSyncState,
+                        folder: str = "INBOX",
+                        sender_address: Optional[str] = None,
+                        subject_filter: Optional[str] = None,
+                        initial_days: int = 7,
+                        advance: bool = True) -> List[Dict]:
+        """
+        List only the emails that arrived since the last sync
+
+        The last seen UID is kept per folder in `state`, so the cost of a poll is proportional to the new mail
+        rather than to a look-back window. The first sync (or one after the server reset the folder's UIDs)
+        falls back to the last `initial_days` days.
+
+        Args:
+            state: Persisted per-folder high-water mark
+            folder: Email folder to sync
+            sender_address: Only list emails from this sender
+            subject_filter: Only list emails whose subject contains this text
+            initial_days: Look-back window when there is no usable high-water mark
+            advance: Move the high-water mark past the listed emails and save it. Pass False to advance only
+                     after the emails were processed, with state.advance(folder, email['uidvalidity'], email['uid'])
+
+        Returns:
+            List of email dictionaries with metadata, oldest first. 'id' is the UID, use by_uid=True with it.
+        """
+        try:
+            self.mail.select(folder)
+            uidvalidity = self._uidvalidity(folder)
+            last_uid = state.last_uid(folder, uidvalidity)
+
+            search_criteria = []
+            if last_uid is None:
+                date = (datetime.now() - timedelta(days=initial_days)).strftime("%d-%b-%Y")
+                search_criteria.append(f'SINCE {date}')
+            else:
+                search_criteria.append(f'UID {last_uid + 1}:*')
+            if sender_address:
+                search_criteria.append(f'FROM "{sender_address}"')
+            if subject_filter:
+                search_criteria.append(f'SUBJECT "{subject_filter}"')
+
+            _, data = self.mail.uid('SEARCH', None, ' '.join(search_criteria))
+            # "n:*" always matches the newest message, even when its UID is below n
+            uids = sorted(int(uid) for uid in data[0].split() if last_uid is None or int(uid) > last_uid)
+
+            emails = []
+            for uid, message, parts in self._summaries([str(uid).encode() for uid in uids], by_uid=True):
+                attachments = [part.filename for part in parts if part.is_attachment]
+                try:
+                    date_ = email.utils.parsedate_to_datetime(message["date"])
+                except (TypeError, ValueError):
+                    date_ = None
+                emails.append({
+                    'id': uid,
+                    'uid': int(uid),
+                    'uidvalidity': uidvalidity,
+                    'folder': folder,
+                    'subject': self.decode_email_string(message["subject"] or ""),
+                    'from': self.decode_email_string(message["from"] or ""),
+                    'date': date_,
+                    'has_attachments': bool(attachments),
+                    'attachments': attachments
+                })
+
+            if advance and uids:
+                state.advance(folder, uidvalidity, uids[-1])
+                state.save()
+
+            self.logger.info(f"Found {len(emails)} new emails in {folder}")
+            return emails
+
+        except Exception as e:
+            self.logger.error(f"Error syncing emails: {str(e)}")
+            raise
+
+    def wait_for_new_mail(self, timeout: float = 29 * 60, poll_interval: float = 60) -> bool:
+        """
+        Block until the selected folder reports new mail, using IMAP IDLE when the server supports it
+
+        Without IDLE support this just sleeps for `poll_interval` and lets the caller poll.
+        Servers drop IDLE after 30 minutes, keep `timeout` below that and call again.
+
+        Returns:
+            True when new mail was announced (or when polling), False on timeout
+        """
+        if 'IDLE' not in self.mail.capabilities:
+            time.sleep(poll_interval)
+            return True
+
+        tag = self.mail._new_tag()
+        self.mail.send(tag + b' IDLE\r\n')
+        response = self.mail.readline()
+        if not response.startswith(b'+'):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {response!r}")
+
+        new_mail = False
+        sock = self.mail.socket()
+        deadline = time.monotonic() + timeout
+        try:
+            while not new_mail:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Data may already sit decrypted in the SSL buffer, where select() cannot see it
+                pending = getattr(sock, 'pending', lambda: 0)()
+                if not pending and not select.select([sock], [], [], remaining)[0]:
+                    break
+                new_mail = self.mail.readline().rstrip().endswith(b'EXISTS')
+        finally:
+            self.mail.send(b'DONE\r\n')
+            # Drain until IDLE completes, an EXISTS can still arrive in between
+            while True:
+                line = self.mail.readline()
+                if line.startswith(tag):
+                    break
+                new_mail = new_mail or line.rstrip().endswith(b'EXISTS')
+        return new_mail
+
+    def mark_as_read(self, email_id: bytes, by_uid: bool = False):
         """Mark email as read"""
         try:
-            self.mail.store(email_id, '+FLAGS', '\\Seen')
+            if by_uid:
+                self.mail.uid('STORE', email_id, '+FLAGS', '\\Seen')
+            else:
+                self.mail.store(email_id, '+FLAGS', '\\Seen')
         except Exception as e:
             self.logger.error(f"Error marking email as read: {str(e)}")
 
@@ -320,25 +542,34 @@ if __name__ == "__main__":
         download_folder="email_attachments"
     )
 
+    sync_state = MailboxSyncState(client.download_folder / ".mailbox_state.json")
+
     try:
-        # Get recent emails with CSV attachments
-        emails = client.get_emails_from_sender("support@clubgg.com")
-
-        # Download CSV attachments from each email
-        for email in emails:
-            print(f"\nProcessing email: {email['subject']}")
-            print(f"From: {email['from']}")
-            print(f"Date: {email['date']}")
-
-            if email['has_attachments']:
-                files = client.download_attachments(
-                    email['id'],
-                    file_extensions=['.csv']
-                )
-                print(f"Downloaded files: {[f.name for f in files]}")
-
-                # Mark email as read
-                client.mark_as_read(email['id'])
+        while True:
+            # Only emails newer than the last synced UID are listed
+            emails = client.sync_new_emails(sync_state, sender_address="support@clubgg.com", advance=False)
+
+            # Download xlsx attachments from each email
+            for email in emails:
+                print(f"\nProcessing email: {email['subject']}")
+                print(f"From: {email['from']}")
+                print(f"Date: {email['date']}")
+
+                if email['has_attachments']:
+                    files = client.download_attachments(
+                        email['id'],
+                        file_extensions=['.xlsx'],
+                        by_uid=True
+                    )
+                    print(f"Downloaded files: {[f.name for f in files]}")
+
+                    # Mark email as read
+                    client.mark_as_read(email['id'], by_uid=True)
+
+                sync_state.advance(email['folder'], email['uidvalidity'], email['uid'])
+                sync_state.save()
+
+            client.wait_for_new_mail()
 
     finally:
         # Clean up
@@ -0,0 +1,126 @@
+"""
+In-process pub/sub of balance and ledger changes, fanned out to the /events streams.
+
+Writers publish once they committed, from the event loop or from any other thread such as an ingest worker.
+Each event is serialized once into a server-sent event frame, and the frames of a publish reach each event
+loop's subscribers in a single callback. Topics are the response cache tags (utils/cache_utils.py): an event
+is published to the topics of the player it is about, and a stream subscribes to those it may see.
+
+Every subscriber has a bounded queue. One that falls behind loses its backlog for a single `resync` event,
+telling the client to reload what it shows, so a slow client neither holds memory nor slows the writers.
+Events are not kept: clients load the current state once a stream is open. Only writes made by this process
+are published, not those of the CLI scripts.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Set, Tuple
+
+from pydantic import BaseModel
+
+from consts import EVENT_QUEUE_SIZE
+from logger import GGLogger
+from utils.metrics import event_streams_active, events_total
+
+logger = GGLogger(__name__)
+
+
+class Event(NamedTuple):
+    name: str
+    data: BaseModel
+    topics: Sequence[str]
+
+
+def sse_frame(name: str, data: bytes = b"{}") -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + data + b"\n\n"
+
+
+RESYNC_FRAME = sse_frame("resync")
+
+
+@dataclass(eq=False)
+class Subscription:
+    topics: Tuple[str, ...]
+    queue: asyncio.Queue
+    loop: asyncio.AbstractEventLoop
+    dropped: int = field(default=0)
+
+    def deliver(self, frame: bytes):
+        """Queue a frame, on the subscription's loop"""
+        if self.queue.full():
+            self.dropped += self.queue.qsize()
+            events_total.inc("dropped", amount=self.queue.qsize())
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+            return
+        self.queue.put_nowait(frame)
+
+
+def _deliver(deliveries: List[Tuple[Subscription, bytes]]):
+    for subscription, frame in deliveries:
+        subscription.deliver(frame)
+
+
+class EventHub:
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        """Subscribe the running event loop to `topics`; unsubscribe when the stream ends"""
+        subscription = Subscription(tuple(dict.fromkeys(topics)), asyncio.Queue(self.queue_size),
+                                    asyncio.get_running_loop())
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscriptions[topic].add(subscription)
+        event_streams_active.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscriptions.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[topic]
+        event_streams_active.dec()
+        if subscription.dropped:
+            logger.info('Event stream closed after dropping %s events', subscription.dropped)
+
+    def publish(self, events: Iterable[Event]):
+        """
+        Hand the events to their subscribers, a subscriber of several of an event's topics getting it once.
+        `events` is only iterated, and its payloads serialized, when there is a subscriber at all.
+        """
+        if not self._subscriptions:
+            return
+        deliveries: Dict[asyncio.AbstractEventLoop, List[Tuple[Subscription, bytes]]] = defaultdict(list)
+        with self._lock:
+            for event in events:
+                subscribers = set()
+                for topic in event.topics:
+                    subscribers.update(self._subscriptions.get(topic, ()))
+                if not subscribers:
+                    continue
+                frame = sse_frame(event.name, event.data.model_dump_json().encode())
+                for subscription in subscribers:
+                    deliveries[subscription.loop].append((subscription, frame))
+                events_total.inc("published", amount=len(subscribers))
+        for loop, frames in deliveries.items():
+            try:
+                # Thread safe, and queued behind earlier publishes, so each stream keeps the order of the writes
+                loop.call_soon_threadsafe(_deliver, frames)
+            except RuntimeError:
+                # The loop was closed, its streams with it
+                pass
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len({subscription for subscribers in self._subscriptions.values() for subscription in subscribers})
+
+
+event_hub = EventHub()
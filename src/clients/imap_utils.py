@@ -0,0 +1,213 @@
+import base64
+import quopri
+from dataclasses import dataclass
+from email.header import decode_header, make_header
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import unquote
+
+ImapValue = Union[None, str, bytes, list]
+
+# Returned by the tokenizer for separators, never part of the parsed values
+_SKIP = object()
+
+
+def join_response(data: list) -> List[bytes]:
+    """
+    Reassemble imaplib's untagged response list into one raw byte string per response.
+
+    imaplib splits a response at every literal: each `{n}` line becomes a (line, literal) tuple and the
+    text following the last literal is appended as a plain bytes item, which also closes the response.
+    """
+    responses, current = [], b""
+    for item in data:
+        if isinstance(item, tuple):
+            current += item[0] + b"\r\n" + item[1]
+        elif item is not None:
+            responses.append(current + item)
+            current = b""
+    if current:
+        responses.append(current)
+    return responses
+
+
+class _Tokenizer:
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.pos = 0
+
+    def parse(self) -> list:
+        values = []
+        while self.pos < len(self.raw):
+            value = self._value()
+            if value is not _SKIP:
+                values.append(value)
+        return values
+
+    def _value(self) -> ImapValue:
+        char = self.raw[self.pos:self.pos + 1]
+        if char in (b" ", b"\r", b"\n"):
+            self.pos += 1
+            return _SKIP
+        if char == b"(":
+            self.pos += 1
+            items = []
+            while self.raw[self.pos:self.pos + 1] != b")":
+                if self.pos >= len(self.raw):
+                    raise ValueError("Unbalanced parenthesis in IMAP response")
+                value = self._value()
+                if value is not _SKIP:
+                    items.append(value)
+            self.pos += 1
+            return items
+        if char == b'"':
+            return self._quoted()
+        if char == b"{":
+            return self._literal()
+        return self._atom()
+
+    def _quoted(self) -> bytes:
+        self.pos += 1
+        out = bytearray()
+        while True:
+            char = self.raw[self.pos:self.pos + 1]
+            if char == b"\\":
+                out += self.raw[self.pos + 1:self.pos + 2]
+                self.pos += 2
+            elif char == b'"':
+                self.pos += 1
+                return bytes(out)
+            elif not char:
+                raise ValueError("Unterminated quoted string in IMAP response")
+            else:
+                out += char
+                self.pos += 1
+
+    def _literal(self) -> bytes:
+        end = self.raw.index(b"}", self.pos)
+        size = int(self.raw[self.pos + 1:end])
+        if size < 0:
+            raise ValueError("Negative literal size in IMAP response")
+        start = end + 3  # skip "}\r\n"
+        self.pos = start + size
+        return self.raw[start:start + size]
+
+    def _atom(self) -> ImapValue:
+        start = self.pos
+        depth = 0
+        while self.pos < len(self.raw):
+            char = self.raw[self.pos:self.pos + 1]
+            # Section specs such as BODY[HEADER.FIELDS (SUBJECT)] are a single atom, brackets included
+            if char == b"[":
+                depth += 1
+            elif char == b"]":
+                depth -= 1
+            elif depth == 0 and char in (b" ", b"(", b")", b"\r", b"\n"):
+                break
+            self.pos += 1
+        if self.pos == start:
+            # A ")" with no "(" to close, which would otherwise never be consumed
+            raise ValueError("Unexpected %r in IMAP response" % self.raw[start:start + 1])
+        atom = self.raw[start:self.pos].decode("ascii", errors="replace")
+        return None if atom.upper() == "NIL" else atom
+
+
+def parse_fetch_response(data: list) -> Iterator[Tuple[str, Dict[str, ImapValue]]]:
+    """Yield (message number, {item name: value}) for every message in a FETCH / UID FETCH response."""
+    for raw in join_response(data):
+        tokens = _Tokenizer(raw).parse()
+        if len(tokens) < 2 or not isinstance(tokens[-1], list):
+            continue
+        number, items = tokens[0], tokens[-1]
+        fields = {}
+        for key, value in zip(items[0::2], items[1::2]):
+            # The server echoes BODY.PEEK[...] back as BODY[...]
+            fields[str(key).upper()] = value
+        yield str(number), fields
+
+
+def _text(value: ImapValue) -> Optional[str]:
+    if value is None:
+        return None
+    text = value.decode("utf-8", errors="replace") if isinstance(value, bytes) else str(value)
+    return str(make_header(decode_header(text))) if "=?" in text else text
+
+
+def _params(value: ImapValue) -> Dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    return {(_text(key) or "").lower(): _text(val) or "" for key, val in zip(value[0::2], value[1::2])}
+
+
+def _param_filename(params: Dict[str, str], name: str) -> Optional[str]:
+    if params.get(name):
+        return params[name]
+    # RFC 2231 extended form: filename*=utf-8''encoded%20name
+    extended = params.get(f"{name}*")
+    if extended:
+        return unquote(extended.split("'", 2)[-1])
+    return None
+
+
+@dataclass
+class MessagePart:
+    part: str
+    content_type: str
+    encoding: str
+    size: int
+    charset: Optional[str] = None
+    filename: Optional[str] = None
+    disposition: Optional[str] = None
+
+    @property
+    def is_attachment(self) -> bool:
+        return self.disposition is not None and bool(self.filename)
+
+    def decode(self, payload: bytes) -> bytes:
+        encoding = self.encoding.lower()
+        if encoding == "base64":
+            return base64.b64decode(payload)
+        if encoding == "quoted-printable":
+            return quopri.decodestring(payload)
+        return payload
+
+
+def walk_bodystructure(structure: list, prefix: str = "") -> List[MessagePart]:
+    """Flatten a BODYSTRUCTURE into its leaf parts, each with the section number to fetch it by."""
+    if structure and isinstance(structure[0], list):
+        # Child parts come first, followed by the subtype and the multipart extension data
+        parts = []
+        for index, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            parts.extend(walk_bodystructure(child, f"{prefix}{index + 1}."))
+        return parts
+
+    main_type, sub_type = (_text(structure[0]) or "").lower(), (_text(structure[1]) or "").lower()
+    type_params = _params(structure[2])
+    encoding = _text(structure[5]) or "7bit"
+    size = int(structure[6]) if str(structure[6]).isdigit() else 0
+
+    # Extension data follows the type specific fields: text adds a line count, message/rfc822 adds
+    # envelope, body and line count
+    extension_start = 7
+    if main_type == "text":
+        extension_start = 8
+    elif (main_type, sub_type) == ("message", "rfc822"):
+        extension_start = 10
+
+    disposition, disposition_params = None, {}
+    if len(structure) > extension_start + 1 and isinstance(structure[extension_start + 1], list):
+        disposition_value = structure[extension_start + 1]
+        disposition = (_text(disposition_value[0]) or "").lower()
+        disposition_params = _params(disposition_value[1]) if len(disposition_value) > 1 else {}
+
+    filename = _param_filename(disposition_params, "filename") or _param_filename(type_params, "name")
+    return [MessagePart(
+        part=prefix.rstrip(".") or "1",
+        content_type=f"{main_type}/{sub_type}",
+        encoding=encoding,
+        size=size,
+        charset=type_params.get("charset"),
+        filename=filename,
+        disposition=disposition,
+    )]
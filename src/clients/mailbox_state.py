@@ -0,0 +1,38 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class MailboxSyncState:
+    """
+    Per-folder UID high-water mark, persisted as JSON.
+
+    IMAP UIDs only grow within a folder as long as its UIDVALIDITY stays the same, so
+    (uidvalidity, last_uid) is enough to ask the server for new messages only.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._folders: Dict[str, Dict[str, int]] = {}
+        if self.path.exists():
+            self._folders = json.loads(self.path.read_text())
+
+    def last_uid(self, folder: str, uidvalidity: int) -> Optional[int]:
+        """Last processed UID, or None when the folder was never synced or its UIDs were reassigned."""
+        state = self._folders.get(folder)
+        if state is None or state["uidvalidity"] != uidvalidity:
+            return None
+        return state["last_uid"]
+
+    def advance(self, folder: str, uidvalidity: int, uid: int):
+        state = self._folders.get(folder)
+        if state is None or state["uidvalidity"] != uidvalidity or uid > state["last_uid"]:
+            self._folders[folder] = {"uidvalidity": uidvalidity, "last_uid": uid}
+
+    def save(self):
+        # Write then rename, so a crash never leaves a truncated state file behind
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(self._folders, indent=2))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,107 @@
+import gzip
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from hashlib import md5
+from typing import Dict, Iterable, Optional, Tuple
+
+from consts import RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, GZIP_MIN_SIZE
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    tags: Tuple[str, ...]
+    version: int
+    expires_at: float
+    # Response headers that belong to the body, such as a pagination cursor
+    headers: Dict[str, str] = field(default_factory=dict)
+    _gzipped: Optional[bytes] = field(default=None, repr=False)
+
+    @property
+    def compressible(self) -> bool:
+        return len(self.body) >= GZIP_MIN_SIZE
+
+    @property
+    def gzipped(self) -> bytes:
+        # Compressed lazily, once per entry, and only for clients that ask for it
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+class ResponseCache:
+    """
+    In-process cache of serialized responses with tag based invalidation.
+
+    Every invalidation advances a logical clock and stamps the invalidated tags with it.
+    An entry records the clock value from *before* its data was read from the database
+    and is only served while none of its tags were invalidated after that point, so a write
+    racing with a cache fill can never leave stale data behind.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: int = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._invalidated_at: Dict[str, int] = {}
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def version(self) -> int:
+        """Snapshot to take before reading the data that is about to be cached."""
+        return self._clock
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic() or not self._is_fresh(entry):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, body: bytes, tags: Iterable[str], version: int,
+            headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        headers = headers or {}
+        digest = md5(body)
+        for name, value in sorted(headers.items()):
+            digest.update(f"\n{name}: {value}".encode())
+        entry = CachedResponse(
+            body=body,
+            etag=f'W/"{digest.hexdigest()}"',
+            tags=tuple(tags),
+            version=version,
+            expires_at=time.monotonic() + self.ttl,
+            headers=headers,
+        )
+        with self._lock:
+            if self._is_fresh(entry):
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, *tags: str):
+        with self._lock:
+            self._clock += 1
+            for tag in tags:
+                self._invalidated_at[tag] = self._clock
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _is_fresh(self, entry: CachedResponse) -> bool:
+        return all(self._invalidated_at.get(tag, 0) <= entry.version for tag in entry.tags)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache()
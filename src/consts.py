@@ -31,3 +31,21 @@ MAX_HEADER_LENGTH = 1024 * 1024
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 2
 
+RESPONSE_CACHE_TTL = 60 * 5
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+GZIP_MIN_SIZE = 1024 * 4
+
+DOWNLINE_PAGE_SIZE = 100
+DOWNLINE_MAX_PAGE_SIZE = 1000
+
+EVENT_QUEUE_SIZE = 256
+EVENT_HEARTBEAT_INTERVAL = 15
+EVENT_RETRY_MS = 5000
+
+PARTITION_MONTHS_AHEAD = 2
+PARTITION_CACHE_TTL = 60
+PARTITION_LOCK_TIMEOUT = 5
+PARTITION_CHECK_INTERVAL = 60 * 60 * 6
+
+# Ring game rows created before this migration ran hold the sum of a table's daily parts, see crud/transactions.py
+RING_GAMES_BY_DAY_MIGRATION = "0007_ring_games_by_day"
@@ -0,0 +1,20 @@
+from sqlalchemy.orm import Session
+
+from logger import GGLogger
+from models import IngestedFile
+
+logger = GGLogger(__name__)
+
+
+def is_ingested(db: Session, content_hash: str) -> bool:
+    return db.get(IngestedFile, content_hash) is not None
+
+
+def mark_ingested(db: Session, content_hash: str, club_id: str, filename: str, source: str,
+                  players: int = 0, transactions: int = 0) -> IngestedFile:
+    # merge, so a forced re-ingest of the same content refreshes the record
+    ingested_file = db.merge(IngestedFile(content_hash=content_hash, club_id=club_id, filename=filename,
+                                          source=source, players=players, transactions=transactions))
+    db.commit()
+    logger.info('Ingested %s from %s: %s players, %s transactions', filename, source, players, transactions)
+    return ingested_file
@@ -0,0 +1,111 @@
+import datetime as dt
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import Date, cast, delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from enums import TransactionType
+from logger import GGLogger
+from models import PlayerDailyStats, Transaction
+
+logger = GGLogger(__name__)
+
+STAT_FIELDS = ('hands', 'rake', 'total_buyin', 'total_cashout', 'bad_beat_contribution', 'bad_beat_cashout')
+GROUP_BY_FIELDS = ('date', 'transaction_type', 'username')
+
+StatsKey = Tuple[str, dt.date, TransactionType]
+
+
+def stats_key(transaction) -> StatsKey:
+    # Undated transactions are counted on the day they were written, as the backfill does with created_at
+    return transaction.username, transaction.date or dt.datetime.now(dt.UTC).date(), transaction.transaction_type
+
+
+def stats_delta(transaction, previous=None) -> Dict[str, int]:
+    """The rollup change of writing `transaction`, over the `previous` values of the same row if it existed"""
+    delta = {field: (getattr(transaction, field) or 0) - (getattr(previous, field, 0) or 0) for field in STAT_FIELDS}
+    delta['transactions'] = 0 if previous is not None else 1
+    return delta
+
+
+class StatsDeltas:
+    """Rollup changes summed per (username, date, transaction type), written with a single upsert"""
+
+    def __init__(self):
+        self._deltas: Dict[StatsKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, transaction, previous: Optional[Transaction] = None):
+        """
+        `previous` is the stored row `transaction` overwrites, before it is updated.
+        An overwrite keeps the stored date and type, so the change is counted on the stored row's day.
+        """
+        totals = self._deltas[stats_key(previous if previous is not None else transaction)]
+        for field, value in stats_delta(transaction, previous).items():
+            totals[field] += value
+
+    def add_frame(self, deltas: pd.DataFrame):
+        """Changes already computed per row, with the key columns, 'transactions' and the STAT_FIELDS"""
+        key = ['username', 'date', 'transaction_type']
+        totals = deltas.groupby(key, observed=True, sort=False)[['transactions', *STAT_FIELDS]].sum()
+        for row_key, values in zip(totals.index, totals.to_numpy().tolist()):
+            row_totals = self._deltas[row_key]
+            for field, value in zip(('transactions', *STAT_FIELDS), values):
+                row_totals[field] += value
+
+    def apply(self, db: Session):
+        """Add the deltas to the rollup without committing, so they land in the caller's transaction"""
+        rows = [
+            {'username': username, 'date': date, 'transaction_type': transaction_type, **totals}
+            for (username, date, transaction_type), totals in self._deltas.items() if any(totals.values())
+        ]
+        if not rows:
+            return
+        # An executemany, which the driver sends in pages, rather than one statement compiled with every row
+        statement = pg_insert(PlayerDailyStats.__table__)
+        columns = PlayerDailyStats.__table__.c
+        statement = statement.on_conflict_do_update(
+            index_elements=[columns.username, columns.date, columns.transaction_type],
+            set_={field: columns[field] + statement.excluded[field] for field in ('transactions', *STAT_FIELDS)},
+        )
+        db.execute(statement, rows)
+        self._deltas.clear()
+
+
+def get_stats(db: Session, usernames: Sequence[str], from_date: dt.date, to_date: dt.date,
+              group_by: Sequence[str] = ()) -> List[Dict]:
+    """Totals of the rollup over a date range (inclusive), optionally grouped by date, type and/or username"""
+    columns = PlayerDailyStats.__table__.c
+    group_columns = [columns[field] for field in group_by]
+    query = (
+        select(*group_columns,
+               *(func.coalesce(func.sum(columns[field]), 0).label(field) for field in ('transactions', *STAT_FIELDS)))
+        .where(columns.username.in_(usernames), columns.date.between(from_date, to_date))
+        .group_by(*group_columns)
+        .order_by(*group_columns)
+    )
+    return [dict(row._mapping) for row in db.execute(query)]
+
+
+def rebuild_stats(db: Session) -> int:
+    """Recompute the whole rollup from `transactions`, returning the number of rows"""
+    rows = rebuild_stats_rows(db)
+    db.commit()
+    logger.info('Rebuilt player daily stats: %s rows', rows)
+    return rows
+
+
+def rebuild_stats_rows(db) -> int:
+    """The rebuild itself, on a session or a connection, without committing"""
+    day = func.coalesce(Transaction.date, cast(Transaction.created_at, Date))
+    source = (
+        select(Transaction.username, day, Transaction.transaction_type, func.count(),
+               *(func.coalesce(func.sum(getattr(Transaction, field)), 0) for field in STAT_FIELDS))
+        .group_by(Transaction.username, day, Transaction.transaction_type)
+    )
+    db.execute(delete(PlayerDailyStats))
+    result = db.execute(insert(PlayerDailyStats).from_select(
+        ['username', 'date', 'transaction_type', 'transactions', *STAT_FIELDS], source))
+    return result.rowcount
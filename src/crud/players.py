@@ -1,26 +1,70 @@
-from typing import Type, List
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type
 
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.orm import Session, SessionTransaction
 
-from crud.users import update_role
+from crud.users import update_role, update_roles
 from schemas.client_users import ClientUserResponse
 from logger import  GGLogger
 from gg_exceptions.players import PlayerNotFound
-from sqlalchemy import select, or_
+from sqlalchemy import BigInteger, Row, String, column, func, select, or_, tuple_, update, values
 
+from schemas.events import BalanceEvent
 from schemas.players import PlayerCreate
 from models.players import Player
-from enums import UserRole
+from models.player_daily_stats import PlayerDailyStats
+from enums import GAME_TRANSACTION_TYPES, UserRole
+from clients.event_hub import Event, event_hub
+from clients.response_cache import response_cache
+from utils.cache_utils import player_tag, roster_tag
 
 
 
 logger = GGLogger(__name__)
 
+# Key of the session's username -> Player map in `Session.info`; None marks a username known not to exist
+PLAYER_CACHE = 'players_by_username'
+
+
+def _player_cache(db: Session) -> Dict[str, Optional[Player]]:
+    return db.info.setdefault(PLAYER_CACHE, {})
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_players(db: Session, transaction: SessionTransaction):
+    """
+    The cache lives as long as the transaction it was read in: a commit expires the players and another
+    session may have changed them since, a rollback may undo players this session created.
+    The subtransactions of a flush end with it and are ignored.
+    """
+    if transaction.parent is None or transaction.nested:
+        db.info.pop(PLAYER_CACHE, None)
+
+
+def load_players(db: Session, usernames: Iterable[str]) -> Dict[str, Player]:
+    """
+    The existing players among `usernames`, with one IN query for the ones this session has not looked up yet.
+    Later lookups in the same transaction, get_player_by_username included, are answered from the session.
+    """
+    usernames = set(usernames)
+    cache = _player_cache(db)
+    missing = usernames - cache.keys()
+    if missing:
+        found = {player.username: player
+                 for player in db.execute(select(Player).where(Player.username.in_(missing))).scalars()}
+        cache.update((username, found.get(username)) for username in missing)
+        logger.debug('Loaded %s of %s players', len(found), len(missing))
+    return {username: cache[username] for username in usernames if cache[username] is not None}
+
+
 def create_player(db: Session, player: PlayerCreate) -> Type[Player]:
     player = player.to_orm(Player)
     db.add(player)
+    cache_tags = get_player_cache_tags(player)
     db.commit()
-    logger.info(f'Created Player: {player.username}')
+    response_cache.invalidate(*cache_tags)
+    logger.info('Created Player: %s', player.username)
     return player
 
 
@@ -40,6 +84,8 @@ def update_player(db: Session, player: PlayerCreate) -> Type[Player]:
 
     # Track if any changes were made
     has_changes = False
+    previous_agent_id = db_player.agent_id
+    previous_balance = db_player.balance
 
     # Update only if values are different
     for field, new_value in update_data.items():
@@ -50,18 +96,120 @@ def update_player(db: Session, player: PlayerCreate) -> Type[Player]:
 
     # Commit only if there were changes
     if has_changes:
+        cache_tags = get_player_cache_tags(db_player, previous_agent_id)
+        events = list(balance_events([db_player])) if db_player.balance != previous_balance else []
         db.commit()
+        response_cache.invalidate(*cache_tags)
+        event_hub.publish(events)
         update_role(db, player.username, player.role)
 
     return db_player
 
 
+def bulk_update_players(db: Session, players: List[PlayerCreate]) -> Tuple[int, int]:
+    """
+    update_player for a whole roster: one lookup, one commit and one cache invalidation.
+    A roster carries no balances, so existing balances are never overwritten.
+
+    Returns:
+        Number of created and updated players
+    """
+    players_by_username = {player.username: player for player in players}
+    existing = load_players(db, players_by_username)
+
+    cache_tags, changed_roles = set(), {}
+    created = updated = 0
+    for username, player in players_by_username.items():
+        db_player = existing.get(username)
+        if db_player is None:
+            db_player = player.to_orm(Player)
+            db.add(db_player)
+            cache_tags.update(get_player_cache_tags(db_player))
+            created += 1
+            continue
+
+        previous_agent_id = db_player.agent_id
+        has_changes = False
+        for field, new_value in player.model_dump(exclude_unset=True, exclude={'balance'}).items():
+            if getattr(db_player, field) != new_value:
+                setattr(db_player, field, new_value)
+                has_changes = True
+        if has_changes:
+            cache_tags.update(get_player_cache_tags(db_player, previous_agent_id))
+            changed_roles[username] = player.role
+            updated += 1
+
+    if created or updated:
+        db.commit()
+        response_cache.invalidate(*cache_tags)
+        update_roles(db, changed_roles)
+    logger.info('Bulk updated players: %s created, %s updated', created, updated)
+    return created, updated
+
+
+def delete_player(db: Session, username: str):
+    player = get_player_by_username(db, username)
+    cache_tags = get_player_cache_tags(player)
+    db.delete(player)
+    db.commit()
+    response_cache.invalidate(*cache_tags)
+    logger.info('Deleted Player: %s', username)
+
+
+def get_player_cache_tags(player: Player, *previous_agent_ids: str) -> List[str]:
+    """
+    Tags of the cached responses showing this player: its own view and the rosters of everyone above it.
+    Read them before committing, so the invalidation does not have to reload the expired player.
+    Any row with the player's username, id and agent_id will do.
+    """
+    agent_ids = {player.agent_id, *previous_agent_ids} - {None}
+    return [player_tag(player.username), roster_tag(), roster_tag(player.id),
+            *(roster_tag(agent_id) for agent_id in agent_ids)]
+
+
+def get_player_event_topics(player: Player) -> List[str]:
+    """
+    Topics of the /events streams showing this player: its own and the rosters above it, as with
+    get_player_cache_tags. Managers and masters are not listed below one another, so only on their own stream.
+    """
+    topics = [player_tag(player.username)]
+    if player.agent_id is not None:
+        topics.append(roster_tag(player.agent_id))
+    if player.role not in (UserRole.MASTER, UserRole.MANAGER):
+        topics.append(roster_tag())
+    return topics
+
+
+def get_stream_topics(db: Session, player: Player) -> List[str]:
+    """Topics of the player's own /events stream: itself, and the rosters its downline listing shows"""
+    if player.role == UserRole.PLAYER:
+        return [player_tag(player.username)]
+    return [player_tag(player.username), *get_downline_page_cache_tags(db, player)]
+
+
+def balance_events(players: Iterable[Player]) -> Iterator[Event]:
+    """A balance event per player; any row with its username, agent_id, role and balance will do"""
+    for player in players:
+        yield Event('balance', BalanceEvent(username=player.username, balance=player.balance),
+                    get_player_event_topics(player))
+
+
+def get_downline_cache_tags(player: Player, downlines: List[Player]) -> List[str]:
+    """
+    Tags a cached downline listing depends on.
+    A super agent's listing also shows the players of its agents, so it depends on their rosters as well.
+    """
+    if player.role in (UserRole.MASTER, UserRole.MANAGER):
+        return [roster_tag()]
+    return [roster_tag(player.id), *(roster_tag(p.id) for p in downlines if p.role == UserRole.AGENT)]
+
+
 def get_player_by_username(db: Session, username) -> Type[Player]:
-    player = db.query(Player).filter(Player.username == username).first()
+    player = load_players(db, [username]).get(username)
     if not player:
-        logger.warning(f'Player not found: {username}')
+        logger.warning('Player not found: %s', username)
         raise PlayerNotFound
-    logger.info(f'Retrieved Player: {player.username}')
+    logger.debug('Retrieved Player: %s', username, sample=100)
     return player
 
 
@@ -69,10 +217,43 @@ def get_downlines(db: Session, user: ClientUserResponse) -> List[Player]:
     player =  get_player_by_username(db, user.username)
 
     downlines = db.execute(get_downline_query(player)).scalars().all()
-    logger.info(f'Retrieved {len(downlines)} Downlines')
+    _player_cache(db).update((downline.username, downline) for downline in downlines)
+    logger.debug('Retrieved %s Downlines', len(downlines))
     return [player, *downlines]
 
 
+# Columns a downline listing can be projected to
+DOWNLINE_FIELDS = ('id', 'username', 'agent_id', 'agent_name', 'role', 'balance', 'created_at', 'updated_at')
+
+
+def get_downline_page(db: Session, player: Player, fields: Iterable[str], limit: int, after: Optional[str] = None,
+                      role: Optional[UserRole] = None, agent_id: Optional[str] = None) -> List[Row]:
+    """
+    Up to `limit` downlines ordered by username, after the username `after`, selecting only `fields`.
+    The username is always selected, as it is the cursor of the next page.
+    """
+    fields = ['username', *(field for field in dict.fromkeys(fields) if field != 'username')]
+    query = (get_downline_query(player)
+             .with_only_columns(*(getattr(Player, field) for field in fields))
+             .order_by(Player.username)
+             .limit(limit))
+    if after is not None:
+        query = query.where(Player.username > after)
+    if role is not None:
+        query = query.where(Player.role == role)
+    if agent_id is not None:
+        query = query.where(Player.agent_id == agent_id)
+    return db.execute(query).all()
+
+
+def get_downline_page_cache_tags(db: Session, player: Player) -> List[str]:
+    """get_downline_cache_tags without the listing at hand: a super agent's agents are looked up"""
+    if player.role != UserRole.SUPER_AGENT:
+        return get_downline_cache_tags(player, [])
+    agent_ids = db.execute(select(Player.id).where(Player.role == UserRole.AGENT, Player.agent_id == player.id))
+    return [roster_tag(player.id), *(roster_tag(agent_id) for agent_id in agent_ids.scalars())]
+
+
 def get_downline_query(player: Type[Player]):
     query = select(Player)
 
@@ -105,7 +286,87 @@ def get_downline_query(player: Type[Player]):
 
     return query
 
-def update_balance(db: Session, username: str, amount: float):
-    player = get_player_by_username(db, username)
-    player.balance += amount
-    db.commit()
\ No newline at end of file
+def apply_balance_deltas(db: Session, deltas: Dict[str, int]) -> List[Row]:
+    """
+    Add each amount of cents to its player's balance without committing, in a single UPDATE.
+    Raises PlayerNotFound when a username has no player; the caller rolls back.
+    Returns the updated players' username, id, agent_id, role and new balance, also for zero amounts, as the
+    players' game totals changed regardless: their cache tags are invalidated and their balance events
+    published once the caller commits.
+    """
+    if not deltas:
+        return []
+    amounts = (values(column('username', String), column('amount', BigInteger), name='amounts')
+               .data(list(deltas.items())))
+    players = db.execute(
+        update(Player)
+        .where(Player.username == amounts.c.username)
+        .values(balance=func.coalesce(Player.balance, 0) + amounts.c.amount)
+        .returning(Player.username, Player.id, Player.agent_id, Player.role, Player.balance)
+    ).all()
+    missing = deltas.keys() - {player.username for player in players}
+    if missing:
+        # Their transactions would be written without a balance to land in
+        logger.error('Balance update for unknown players: %s', ', '.join(sorted(missing)))
+        raise PlayerNotFound
+    return players
+
+
+def get_downline_aggregates(db: Session, player: Player, from_date: date, to_date: date) -> List[Row]:
+    """
+    Balance and game totals over a date range per downline, plus a subtree total row, in one statement.
+
+    Game totals come from the daily rollup, summed per player before the join so each downline is one row
+    and the balances are not multiplied. ROLLUP adds the total row, the one with `is_total` set.
+    """
+    downlines = get_downline_query(player).subquery()
+    period = (
+        select(PlayerDailyStats.username,
+               func.sum(PlayerDailyStats.transactions).label('transactions'),
+               func.sum(PlayerDailyStats.hands).label('hands'),
+               func.sum(PlayerDailyStats.rake).label('rake'),
+               # Games only: transfers, rakeback and adjustments move balances but are not winnings
+               func.sum(PlayerDailyStats.total_cashout - PlayerDailyStats.total_buyin)
+               .filter(PlayerDailyStats.transaction_type.in_(GAME_TRANSACTION_TYPES)).label('net_winnings'))
+        .where(PlayerDailyStats.date.between(from_date, to_date),
+               PlayerDailyStats.username.in_(select(downlines.c.username)))
+        .group_by(PlayerDailyStats.username)
+        .subquery()
+    )
+    identity = (downlines.c.username, downlines.c.id, downlines.c.role, downlines.c.agent_id, downlines.c.agent_name)
+    query = (
+        select(*identity,
+               func.grouping(downlines.c.username).label('is_total'),
+               func.count(downlines.c.username).label('players'),
+               func.coalesce(func.sum(downlines.c.balance), 0).label('balance'),
+               func.coalesce(func.sum(period.c.transactions), 0).label('transactions'),
+               func.coalesce(func.sum(period.c.hands), 0).label('hands'),
+               func.coalesce(func.sum(period.c.rake), 0).label('rake'),
+               func.coalesce(func.sum(period.c.net_winnings), 0).label('net_winnings'))
+        .select_from(downlines)
+        .outerjoin(period, period.c.username == downlines.c.username)
+        .group_by(func.rollup(tuple_(*identity)))
+        .order_by(func.grouping(downlines.c.username), downlines.c.username)
+    )
+    return db.execute(query).all()
+
+
+def update_balance(db: Session, username: str, amount: int) -> Row:
+    """
+    Add `amount` cents to the player's balance, as an addition in the database so concurrent updates all count.
+    Returns the player's username, id, agent_id, role and new balance.
+    """
+    player = db.execute(
+        update(Player)
+        .where(Player.username == username)
+        .values(balance=func.coalesce(Player.balance, 0) + amount)
+        .returning(Player.username, Player.id, Player.agent_id, Player.role, Player.balance)
+    ).one_or_none()
+    if player is None:
+        logger.warning('Player not found: %s', username)
+        raise PlayerNotFound
+    cache_tags = get_player_cache_tags(player)
+    db.commit()
+    response_cache.invalidate(*cache_tags)
+    event_hub.publish(balance_events([player]))
+    return player
@@ -0,0 +1,23 @@
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from enums import RakebackType
+from logger import GGLogger
+from models import RakebackSetting
+
+logger = GGLogger(__name__)
+
+
+def get_rakeback_settings(db: Session) -> List[RakebackSetting]:
+    return db.execute(select(RakebackSetting).where(RakebackSetting.percentage > 0)).scalars().all()
+
+
+def set_rakeback(db: Session, username: str, rakeback_type: RakebackType, percentage: float) -> RakebackSetting:
+    if not 0 <= percentage <= 1:
+        raise ValueError("Rakeback percentage must be a fraction between 0 and 1")
+    setting = db.merge(RakebackSetting(username=username, rakeback_type=rakeback_type, percentage=percentage))
+    db.commit()
+    logger.info('Set %s rakeback of %s to %s', rakeback_type.value, username, percentage)
+    return setting
@@ -0,0 +1,122 @@
+"""
+What a long running ingest process knows of the stored ledger, so the rows of a snapshot that did not change
+are settled in memory and never reach Postgres.
+
+Rows dated within the last `window_days` are held exactly: sorted 64-bit hashes of their match key (see
+MATCH_FIELDS) and their hands, 16 bytes a row, loaded with one query per window. The table ids of the older months, archived ones
+included, go into a Bloom filter, which answers "certainly never stored" or "maybe". A report row is then
+- unchanged, when held with at least as many hands, and skipped
+- new, when not held and its table id was certainly never stored, and inserted without a lookup
+- looked up as before otherwise: held with more hands, or a "maybe" of the filter
+
+The index only learns of writes made through it, after they are committed. A row another process inserted
+since the load makes the insert fail; the caller then resets the index and retries with lookups. Two keys
+sharing a 64-bit hash would make a new row look stored; with a million held rows that is about one report row
+in 10^13.
+"""
+import datetime as dt
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import distinct, func, select
+
+from enums import TransactionType
+from logger import GGLogger
+from models import Transaction
+from utils.bloom import BloomFilter, hash_values
+
+logger = GGLogger(__name__)
+
+KEY_FIELDS = ['id', 'username']
+# A ring game table that runs past midnight is reported in each day's export with that day's part of the game,
+# and every part is a row of its own; other games are reported once. So ring games are matched on their date as
+# well, the others on (id, username) alone, with SINGLE_PART in place of the date.
+MATCH_FIELDS = [*KEY_FIELDS, 'part']
+SINGLE_PART = dt.date.min
+
+
+def part_dates(transaction_types: pd.Series, dates: pd.Series) -> np.ndarray:
+    """The 'part' column of MATCH_FIELDS"""
+    ring_games = (transaction_types == TransactionType.RING_GAME).to_numpy(dtype=bool)
+    return np.where(ring_games, np.asarray(dates, dtype=object), SINGLE_PART)
+
+
+def key_hashes(keys: pd.DataFrame) -> np.ndarray:
+    """uint64 hash of every match key; categorical and plain string columns hash alike"""
+    return pd.util.hash_pandas_object(keys[MATCH_FIELDS], index=False).to_numpy()
+
+
+class KnownTransactions:
+    def __init__(self, window_days: int = 35, false_positive_rate: float = 0.01):
+        self.window_days = window_days
+        self.false_positive_rate = false_positive_rate
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything; the next classify loads the window again"""
+        self._since: Optional[dt.date] = None
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._hands = np.empty(0, dtype=np.int64)
+        self._history = BloomFilter(0, self.false_positive_rate)
+
+    def _window_start(self, closed_before: Optional[dt.date]) -> dt.date:
+        since = dt.datetime.now(dt.UTC).date() - dt.timedelta(days=self.window_days)
+        # Archived months are never written again
+        return max(since, closed_before) if closed_before else since
+
+    def _load(self, db, since: dt.date):
+        rows = db.execute(select(Transaction.id, Transaction.username, Transaction.transaction_type, Transaction.date,
+                                 func.coalesce(Transaction.hands, 0))
+                          .where(Transaction.date >= since)).all()
+        window = pd.DataFrame.from_records(rows, columns=[*KEY_FIELDS, 'transaction_type', 'date', 'hands'])
+        window['part'] = part_dates(window['transaction_type'], window['date'])
+        hashes, hands = key_hashes(window), window['hands'].to_numpy(dtype=np.int64)
+        # By hash, most hands first, so a key stored on two dates is held with the most hands
+        order = np.lexsort((-hands, hashes))
+        self._hashes, first = np.unique(hashes[order], return_index=True)
+        self._hands = hands[order][first]
+
+        # Archived months too, so a row stored there is looked up and rejected rather than inserted again
+        ids = db.execute(select(distinct(Transaction.id)).where(Transaction.date < since)).scalars().all()
+        self._history = BloomFilter(len(ids), self.false_positive_rate)
+        self._history.add(hash_values(ids))
+        self._since = since
+        logger.info('Loaded known transactions since %s: %s rows (%s KB), %s older tables (%s KB)', since,
+                    len(self._hashes), (self._hashes.nbytes + self._hands.nbytes) // 1024, len(ids),
+                    self._history.nbytes // 1024)
+
+    def classify(self, db, keys: pd.DataFrame, closed_before: Optional[dt.date]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        For each row with MATCH_FIELDS: its stored hands, -1 when not held, and whether a row that is not held
+        may still be stored. The window is (re)loaded on `db` when it moved since the last call.
+        """
+        with self._lock:
+            since = self._window_start(closed_before)
+            if since != self._since:
+                self._load(db, since)
+            hashes = key_hashes(keys)
+            stored_hands = np.full(len(hashes), -1, dtype=np.int64)
+            if len(self._hashes):
+                positions = np.minimum(np.searchsorted(self._hashes, hashes), len(self._hashes) - 1)
+                held = self._hashes[positions] == hashes
+                stored_hands[held] = self._hands[positions[held]]
+            maybe_stored = (stored_hands < 0) & self._history.might_contain(hash_values(keys['id'].to_numpy()))
+            return stored_hands, maybe_stored
+
+    def remember(self, keys: pd.DataFrame, hands: np.ndarray):
+        """Hold rows that were just committed, with their current hands"""
+        with self._lock:
+            self._remember(key_hashes(keys), np.asarray(hands, dtype=np.int64))
+
+    def _remember(self, hashes: np.ndarray, hands: np.ndarray):
+        # np.unique keeps the first occurrence, so the new values replace the held ones
+        hashes = np.concatenate([hashes, self._hashes])
+        hands = np.concatenate([hands, self._hands])
+        self._hashes, first = np.unique(hashes, return_index=True)
+        self._hands = hands[first]
+
+    def __len__(self) -> int:
+        return len(self._hashes)
@@ -0,0 +1,184 @@
+"""
+Monthly range partitions of `transactions`.
+
+Partitions are named transactions_YYYY_MM. The current month and the next PARTITION_MONTHS_AHEAD are created
+ahead of time by the bootstrap and a periodic task of the app, each in its own short transaction, as creating a
+partition takes an exclusive lock on `transactions`. The write paths read the partitions from a short lived
+cache rather than the catalog, and only create a missing one (an older month, say) as a fallback, again in a
+transaction of its own. Creators take an advisory lock, so concurrent writers cannot race on one month. Closed
+seasons are archived by
+moving their partitions into the archive schema (and optionally a cold tablespace); they stay attached, so
+history queries still see them, but writes and upsert lookups only consider the open months.
+"""
+import datetime as dt
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+from consts import PARTITION_CACHE_TTL, PARTITION_LOCK_TIMEOUT, PARTITION_MONTHS_AHEAD
+from db import DB_SCHEMA
+from logger import GGLogger
+
+logger = GGLogger(__name__)
+
+ARCHIVE_SCHEMA = f"{DB_SCHEMA}_archive"
+PARENT = "transactions"
+_PARTITION_NAME = re.compile(rf"^{PARENT}_(\d{{4}})_(\d{{2}})$")
+# Key of the flag in `Session.info` of a transaction that created partitions itself, and may still roll them back
+UNCOMMITTED_PARTITIONS = 'uncommitted_partitions'
+
+
+def month_start(day: dt.date) -> dt.date:
+    return day.replace(day=1)
+
+
+def next_month(month: dt.date) -> dt.date:
+    return (month.replace(day=28) + dt.timedelta(days=4)).replace(day=1)
+
+
+def partition_name(month: dt.date) -> str:
+    return f"{PARENT}_{month:%Y_%m}"
+
+
+def list_partitions(db) -> Dict[dt.date, str]:
+    """Month of every partition and the schema it lives in, on a session or a connection"""
+    rows = db.execute(text(
+        "SELECT child_ns.nspname, child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_namespace child_ns ON child_ns.oid = child.relnamespace "
+        "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": f"{DB_SCHEMA}.{PARENT}"})
+    partitions = {}
+    for schema, name in rows:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[dt.date(int(match[1]), int(match[2]), 1)] = schema
+    return partitions
+
+
+def closed_before(partitions: Dict[dt.date, str]) -> Optional[dt.date]:
+    """First day after the newest archived month, None while nothing is archived"""
+    archived = [month for month, schema in partitions.items() if schema == ARCHIVE_SCHEMA]
+    return next_month(max(archived)) if archived else None
+
+
+class _PartitionCache:
+    """The partitions as last listed, so writes do not query the catalog each time"""
+
+    def __init__(self, ttl: float = PARTITION_CACHE_TTL):
+        self.ttl = ttl
+        self._partitions: Optional[Dict[dt.date, str]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db, refresh: bool = False) -> Dict[dt.date, str]:
+        cacheable = not db.info.get(UNCOMMITTED_PARTITIONS)
+        with self._lock:
+            if (cacheable and not refresh and self._partitions is not None
+                    and time.monotonic() - self._loaded_at < self.ttl):
+                return self._partitions
+        partitions = list_partitions(db)
+        if cacheable:
+            with self._lock:
+                self._partitions, self._loaded_at = partitions, time.monotonic()
+        return partitions
+
+    def forget(self):
+        with self._lock:
+            self._partitions = None
+
+
+partition_cache = _PartitionCache()
+
+
+def create_partitions(db, months: Iterable[dt.date]):
+    """Create the partitions of the given months, on a session or a connection, without committing"""
+    # Held until the transaction ends, so a second creator of the same month waits and then finds it
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:parent))"), {"parent": f"{DB_SCHEMA}.{PARENT}"})
+    for month in sorted(set(months)):
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.{partition_name(month)} PARTITION OF {DB_SCHEMA}.{PARENT} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+        ))
+        logger.info('Created transactions partition %s', partition_name(month))
+
+
+def create_upcoming_partitions(engine: Engine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create the partitions of the current month and the next `months_ahead` that are missing, and commit"""
+    months = [month_start(dt.datetime.now(dt.UTC).date())]
+    for _ in range(months_ahead):
+        months.append(next_month(months[-1]))
+    with engine.begin() as conn:
+        missing = set(months) - list_partitions(conn).keys()
+        if missing:
+            create_partitions(conn, missing)
+    partition_cache.forget()
+    return [partition_name(month) for month in sorted(missing)]
+
+
+def _missing_months(partitions: Dict[dt.date, str], dates: Iterable[dt.date]):
+    boundary = closed_before(partitions)
+    # Dates in archived months are rejected by the callers, they get no partition
+    months = {month_start(day) for day in dates if day and (not boundary or day >= boundary)}
+    return boundary, months - partitions.keys()
+
+
+def ensure_partitions(db, dates: Iterable[dt.date]) -> Optional[dt.date]:
+    """
+    Make sure every date has a partition, returning the archive boundary for the caller's writes.
+    Missing partitions are created and committed in a transaction of their own, before the caller's writes.
+    """
+    dates = list(dates)
+    boundary, missing = _missing_months(partition_cache.get(db), dates)
+    if missing:
+        boundary, missing = _missing_months(partition_cache.get(db, refresh=True), dates)
+    if missing:
+        _create_missing(db, missing)
+    return boundary
+
+
+def _create_missing(db, months):
+    try:
+        with db.get_bind().engine.begin() as conn:
+            # Waits for the transactions reading the ledger, rather than blocking every read behind it for long
+            conn.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}s'"))
+            create_partitions(conn, months)
+        partition_cache.forget()
+    except OperationalError:
+        # Such as the caller's own transaction having written to the ledger already, as a dry run does after its
+        # first report; the partitions then come and go with that transaction
+        logger.warning('Could not create partitions on their own, creating them in the writing transaction')
+        db.info[UNCOMMITTED_PARTITIONS] = True
+        create_partitions(db, months)
+
+
+def archive_partitions(conn: Connection, before: dt.date, tablespace: Optional[str] = None,
+                       dry_run: bool = False) -> List[str]:
+    """
+    Archive the months that end on or before `before`, which closes them for writes.
+    Returns the partitions that were (or, with `dry_run`, would be) moved.
+    """
+    partitions = list_partitions(conn)
+    months = sorted(month for month, schema in partitions.items()
+                    if schema != ARCHIVE_SCHEMA and next_month(month) <= before)
+    names = [partition_name(month) for month in months]
+    if dry_run or not months:
+        return names
+
+    conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+    for name in names:
+        conn.execute(text(f"ALTER TABLE {DB_SCHEMA}.{name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+        if tablespace:
+            # Rewrites the table and its indexes onto the cold storage
+            conn.execute(text(f"ALTER TABLE {ARCHIVE_SCHEMA}.{name} SET TABLESPACE {tablespace}"))
+            indexes = conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = :schema "
+                                        "AND tablename = :name"), {"schema": ARCHIVE_SCHEMA, "name": name})
+            for index in indexes.scalars().all():
+                conn.execute(text(f"ALTER INDEX {ARCHIVE_SCHEMA}.{index} SET TABLESPACE {tablespace}"))
+        logger.info('Archived transactions partition %s', name)
+    return names
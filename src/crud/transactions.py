@@ -1,24 +1,54 @@
+import numpy as np
+import pandas as pd
 from fastapi import HTTPException
-from crud.players import update_balance
+from clients.event_hub import Event, event_hub
+from clients.response_cache import response_cache
+from crud.player_stats import STAT_FIELDS, StatsDeltas
+from crud.players import (apply_balance_deltas, balance_events, get_player_cache_tags, get_player_event_topics,
+                          update_balance)
+from consts import RING_GAMES_BY_DAY_MIGRATION
+from crud.transaction_index import KEY_FIELDS, MATCH_FIELDS, SINGLE_PART, KnownTransactions, part_dates
+from crud.transaction_partitions import ensure_partitions
+from gg_exceptions.players import PlayerNotFound
 from logger import GGLogger
 from models import Transaction
-from schemas.transactions import TransactionCreate
-from datetime import date
-from typing import Optional, Sequence
-from sqlalchemy import select
+from schemas.transaction_batch import TRANSACTION_FIELDS, TransactionBatch
+from schemas.events import LedgerEvent
+from schemas.transactions import TransactionCreate, TransactionResponse
+from datetime import date, datetime, UTC
+from typing import List, Optional, Sequence, Tuple, Union
+from db import DB_SCHEMA
+from sqlalchemy import bindparam, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from utils.cache_utils import ledger_tag
 
 logger = GGLogger(__name__)
 
 
 def create_transaction(db, transaction: TransactionCreate):
     transaction = transaction.to_orm(Transaction)
+    closed_before = ensure_partitions(db, [transaction.date])
+    if closed_before and transaction.date < closed_before:
+        raise HTTPException(status_code=400, detail=f"Transactions before {closed_before} are archived")
+    if closed_before and db.execute(select(Transaction.id).where(
+            Transaction.id == transaction.id, Transaction.username == transaction.username,
+            Transaction.date < closed_before).limit(1)).first():
+        # The primary key includes the date, so only this check keeps it from being stored a second time
+        raise HTTPException(status_code=400, detail="Transaction already exists in an archived month")
+    stats = StatsDeltas()
+    stats.add(transaction)
     try:
         db.add(transaction)
+        stats.apply(db)
         db.commit()
     except Exception:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Transaction already exists")
-    update_balance(db, transaction.username, round(transaction.total_cashout - transaction.total_buyin, 2))
-    logger.info(f'Created Transaction: {transaction.id}')
+    response_cache.invalidate(ledger_tag(transaction.username))
+    player = update_balance(db, transaction.username, transaction.total_cashout - transaction.total_buyin)
+    event_hub.publish([Event('transaction', TransactionResponse.model_validate(transaction),
+                             get_player_event_topics(player))])
+    logger.debug('Created Transaction: %s', transaction.id)
     return transaction
 
 
@@ -57,32 +87,206 @@ def get_transaction(db, id, username) -> Transaction:
     return transaction
 
 
-def overwrite_transaction(db, transaction: TransactionCreate):
-    db_transaction = get_transaction(db, transaction.id, transaction.username)
-    if db_transaction:
-        # Fields to check and update
-        fields = [
-            'total_buyin',
-            'total_cashout',
-            'rake',
-            'bad_beat_contribution',
-            'bad_beat_cashout',
-            'hands'
-        ]
-        original_profit = db_transaction.total_cashout - db_transaction.total_buyin
-        
-        # Track if any changes were made
-
-        if transaction.hands > db_transaction.hands:
-            for field in fields:
-                new_value = getattr(transaction, field)
-                current_value = getattr(db_transaction, field)
-                if current_value != new_value:
-                    setattr(db_transaction, field, new_value)
-
-            db.commit()
-            logger.info(f'Updated Transaction: {transaction.id}')
-            new_profit = db_transaction.total_cashout - db_transaction.total_buyin
-            update_balance(db, transaction.username, float(round(new_profit - original_profit, 2)))
+OVERWRITE_FIELDS = [
+    'total_buyin',
+    'total_cashout',
+    'rake',
+    'bad_beat_contribution',
+    'bad_beat_cashout',
+    'hands'
+]
+
+
+def bulk_overwrite_transactions(db, transactions: Union[TransactionBatch, List[TransactionCreate]],
+                                lookup_batch_size: int = 1000,
+                                known: Optional[KnownTransactions] = None) -> Tuple[int, int]:
+    """
+    Insert the transactions of a report, or overwrite those already stored when the report has more hands of
+    them. Existing rows are looked up in batches, the rows to insert and to update are picked with pandas,
+    balance and rollup changes are summed per player, and everything is written with one executemany per
+    statement in a single commit.
+
+    A transaction repeated in the batch keeps the date, type and details of its first occurrence and the
+    amounts of its occurrence with the most hands, as writing the occurrences one by one would. The daily parts
+    of a ring game table are separate transactions (see MATCH_FIELDS), so they add up rather than replace one
+    another, whether they come in one batch or in the reports of two days. Ring game rows stored before
+    RING_GAMES_BY_DAY_MIGRATION hold all the parts of their table known then, so a part dated before it
+    overwrites that row, by the usual rule, rather than being added to it.
+
+    With `known` (see crud/transaction_index.py), rows it settles as unchanged or certainly new are not looked up.
+    A transaction of a username without a player raises PlayerNotFound, and nothing is written.
+
+    Returns:
+        Number of created and updated transactions
+    """
+    if not isinstance(transactions, TransactionBatch):
+        transactions = TransactionBatch.from_transactions(transactions)
+    if known is None:
+        return _overwrite_batch(db, transactions, lookup_batch_size, None)
+    try:
+        return _overwrite_batch(db, transactions, lookup_batch_size, known)
+    except IntegrityError:
+        # A row inserted by another process since the index was loaded
+        db.rollback()
+        known.reset()
+        logger.warning('Known transactions were out of date, writing the batch again with lookups')
+        return _overwrite_batch(db, transactions, lookup_batch_size, None)
+
+
+def ring_games_by_day_since(db) -> Optional[datetime]:
+    """When ring games started to be stored as one row per day, in UTC like the rows' created_at"""
+    applied_at = db.execute(text(f"SELECT applied_at FROM {DB_SCHEMA}.schema_migrations WHERE name = :name"),
+                            {"name": RING_GAMES_BY_DAY_MIGRATION}).scalar()
+    return applied_at.astimezone(UTC).replace(tzinfo=None) if applied_at else None
+
+
+def _match_rows_by_table(incoming: pd.DataFrame, before_by_day: np.ndarray, stored: pd.DataFrame,
+                         by_day_since: datetime) -> pd.DataFrame:
+    """
+    Give the ring game parts dated before `by_day_since`, and stored on no row of their own, the match key of
+    the row their table was stored on as one, when there is one. Several parts of a table matching the same
+    row are reduced to the one with the most hands.
+    """
+    created_at = pd.to_datetime(stored['created_at'])
+    by_table = stored[(stored['part'] != SINGLE_PART).to_numpy()
+                      & (created_at.isna() | (created_at < by_day_since)).to_numpy()]
+    if by_table.empty:
+        return incoming
+    by_table = by_table.drop_duplicates(KEY_FIELDS)[[*KEY_FIELDS, 'part']].rename(columns={'part': 'table_part'})
+    table_parts = incoming[KEY_FIELDS].merge(by_table, on=KEY_FIELDS, how='left')['table_part'].to_numpy()
+    own_row = pd.MultiIndex.from_frame(incoming[MATCH_FIELDS]).isin(pd.MultiIndex.from_frame(stored[MATCH_FIELDS]))
+    rekey = before_by_day & ~own_row & pd.notna(table_parts)
+    if not rekey.any():
+        return incoming
+    parts = incoming['part'].to_numpy().copy()
+    parts[rekey] = table_parts[rekey]
+    logger.debug('Matched %s ring game parts to rows stored as one per table', int(rekey.sum()))
+    return (incoming.assign(part=parts).sort_values('hands', ascending=False, kind='stable')
+            .drop_duplicates(MATCH_FIELDS))
+
+
+def _overwrite_batch(db, transactions: TransactionBatch, lookup_batch_size: int,
+                     known: Optional[KnownTransactions]) -> Tuple[int, int]:
+    batch = transactions.with_dates(datetime.now(UTC).date())
+    dates = batch.columns['date']
+    closed_before = ensure_partitions(db, dates.categories)
+    if closed_before:
+        # Archived months are closed, so neither their rows nor their partitions need to be looked at
+        archived = np.array([day < closed_before for day in dates.categories], dtype=bool)[dates.codes]
+        if archived.any():
+            logger.warning('Skipped %s transactions dated before the archive boundary %s', int(archived.sum()),
+                           closed_before)
+            batch = batch.take(~archived)
+    if not len(batch):
+        return 0, 0
+
+    frame = batch.to_frame()
+    frame['part'] = part_dates(frame['transaction_type'], frame['date'])
+    best = frame.sort_values('hands', ascending=False, kind='stable').drop_duplicates(MATCH_FIELDS)
+    incoming = (frame.drop_duplicates(MATCH_FIELDS).drop(columns=OVERWRITE_FIELDS)
+                .merge(best[[*MATCH_FIELDS, *OVERWRITE_FIELDS]], on=MATCH_FIELDS))
+
+    # Ring game parts that may belong to a row stored as one per table
+    by_day_since = ring_games_by_day_since(db) if (incoming['part'] != SINGLE_PART).any() else None
+    if by_day_since is not None:
+        parts = incoming['part'].to_numpy()
+        before_by_day = (parts != SINGLE_PART) & (parts < by_day_since.date())
     else:
-        create_transaction(db, transaction)
+        before_by_day = np.zeros(len(incoming), dtype=bool)
+
+    if known is not None:
+        stored_hands, maybe_stored = known.classify(db, incoming, closed_before)
+        changed = incoming['hands'].to_numpy() > stored_hands
+        # The index only knows the exact rows, not the one a part may belong to
+        look_up = changed & ((stored_hands >= 0) | maybe_stored | before_by_day)
+        logger.debug('Known transactions: %s unchanged, %s new, %s to look up', int((~changed).sum()),
+                     int((changed & ~look_up).sum()), int(look_up.sum()))
+        incoming, look_up, before_by_day = incoming[changed], look_up[changed], before_by_day[changed]
+        if incoming.empty:
+            return 0, 0
+    else:
+        look_up = np.ones(len(incoming), dtype=bool)
+
+    # Looked up by table id, which the index answers far faster than (id, username) pairs; the merge below
+    # keeps the stored rows of the batch's players. Archived months are looked at too, see below.
+    ids = incoming.loc[look_up, 'id'].unique().tolist()
+    stored_columns = ['date', 'transaction_type', 'created_at', *OVERWRITE_FIELDS]
+    stored = []
+    for start in range(0, len(ids), lookup_batch_size):
+        query = (select(Transaction.id, Transaction.username, *(getattr(Transaction, field) for field in stored_columns))
+                 .where(Transaction.id.in_(ids[start:start + lookup_batch_size])))
+        stored.extend(db.execute(query).all())
+    stored = pd.DataFrame.from_records(stored, columns=['id', 'username', *stored_columns])
+    stored[OVERWRITE_FIELDS] = stored[OVERWRITE_FIELDS].fillna(0).astype('int64')
+    stored['part'] = part_dates(stored['transaction_type'], stored['date'])
+    if before_by_day.any():
+        incoming = _match_rows_by_table(incoming, before_by_day, stored, by_day_since)
+    merged = incoming.merge(stored, on=MATCH_FIELDS, how='left', suffixes=('', '_stored'), indicator=True)
+    if closed_before:
+        # The primary key includes the date, so a row stored in a closed month and now reported on an open day
+        # would be inserted a second time; such rows are rejected, as rows dated in a closed month are
+        in_archive = (merged['_merge'] == 'both').to_numpy().copy()
+        in_archive[in_archive] = (merged.loc[in_archive, 'date_stored'] < closed_before).to_numpy(dtype=bool)
+        if in_archive.any():
+            keys = pd.MultiIndex.from_frame(merged[MATCH_FIELDS])
+            rejected = keys.isin(keys[in_archive])
+            logger.warning('Skipped %s transactions already stored in months before the archive boundary %s',
+                           int(rejected.sum()), closed_before)
+            merged = merged[~rejected]
+    created = merged[merged['_merge'] == 'left_only']
+    updated = merged[(merged['_merge'] == 'both') & (merged['hands'] > merged['hands_stored'])]
+    if created.empty and updated.empty:
+        return 0, 0
+
+    # Core statements on the table: its defaults and onupdate still apply, without the ORM's per row bookkeeping
+    table = Transaction.__table__
+    if not created.empty:
+        db.execute(insert(table), created[list(TRANSACTION_FIELDS)].to_dict('records'))
+    if not updated.empty:
+        # By primary key, with the stored date so each update only touches its own partition
+        statement = (update(table)
+                     .where(table.c.id == bindparam('key_id'), table.c.username == bindparam('key_username'),
+                            table.c.date == bindparam('key_date'))
+                     .values({field: bindparam(field) for field in OVERWRITE_FIELDS}))
+        db.execute(statement, updated[['id', 'username', 'date_stored', *OVERWRITE_FIELDS]]
+                   .rename(columns={'id': 'key_id', 'username': 'key_username', 'date_stored': 'key_date'})
+                   .to_dict('records'))
+
+    # The change of every written row; an overwrite keeps the stored date and type, so it counts on the stored day
+    changes = pd.concat([part for part in (
+        created[['username', 'date', 'transaction_type', *STAT_FIELDS]].assign(transactions=1),
+        pd.DataFrame({'username': updated['username'], 'date': updated['date_stored'],
+                      'transaction_type': updated['transaction_type_stored'], 'transactions': 0,
+                      **{field: updated[field] - updated[f'{field}_stored'] for field in STAT_FIELDS}}),
+    ) if not part.empty])
+    stats = StatsDeltas()
+    stats.add_frame(changes)
+    profits = (changes['total_cashout'] - changes['total_buyin']).groupby(changes['username'], observed=True).sum()
+    balance_deltas = dict(zip(profits.index, profits.tolist()))
+
+    try:
+        players = apply_balance_deltas(db, balance_deltas)
+    except PlayerNotFound:
+        db.rollback()
+        raise
+    cache_tags = [tag for player in players for tag in get_player_cache_tags(player)]
+    stats.apply(db)
+    db.commit()
+    if known is not None:
+        written = [part for part in (created, updated) if not part.empty]
+        known.remember(pd.concat([part[MATCH_FIELDS] for part in written]),
+                       np.concatenate([part['hands'].to_numpy() for part in written]))
+    response_cache.invalidate(*cache_tags, *(ledger_tag(username) for username in balance_deltas))
+    event_hub.publish(_ledger_events(players, created, updated))
+    logger.info('Bulk overwrote transactions: %s created, %s updated', len(created), len(updated))
+    return len(created), len(updated)
+
+
+def _ledger_events(players, created: pd.DataFrame, updated: pd.DataFrame):
+    """A balance and a ledger event per player of a batch, rather than an event per transaction"""
+    created, updated = created['username'].value_counts(), updated['username'].value_counts()
+    for player in players:
+        yield from balance_events([player])
+        yield Event('ledger', LedgerEvent(username=player.username, created=int(created.get(player.username, 0)),
+                                          updated=int(updated.get(player.username, 0))),
+                    get_player_event_topics(player))
@@ -1,3 +1,5 @@
+from typing import Dict
+
 from enums import UserRole
 from logger import GGLogger
 from models import ClientUser
@@ -9,9 +11,9 @@ logger = GGLogger(__name__)
 def get_user_by_username(db, username) -> ClientUser:
     client_user =  db.query(ClientUser).filter(ClientUser.username == username).first()
     if not client_user:
-        logger.warning(f'User not found: {username}')
+        logger.warning('User not found: %s', username)
         raise UserNotFound
-    logger.info(f'Retrieved User: {client_user.username}')
+    logger.debug('Retrieved User: %s', username, sample=100)
     return client_user
 
 
@@ -19,18 +21,30 @@ def create_user(db, user: ClientUserCreate):
     user = user.to_orm(ClientUser)
     db.add(user)
     db.commit()
-    logger.info(f'Created User: {user.username}')
+    logger.info('Created User: %s', user.username)
 
 def update_password(db, username, password):
     client_user =  get_user_by_username(db, username)
     client_user.hashed_password = password
     db.commit()
-    logger.info(f"Password Changed Successfully")
+    logger.info("Password Changed Successfully")
 
 def update_role(db, username, role: UserRole):
     client_user =  get_user_by_username(db, username)
     if client_user.role != role:
         client_user.role = role
         db.commit()
-        logger.info(f"Role Changed Successfully")
+        logger.info("Role Changed Successfully")
+
 
+def update_roles(db, roles: Dict[str, UserRole]):
+    """update_role for many users at once, skipping players that have no client user"""
+    if not roles:
+        return
+    client_users = db.query(ClientUser).filter(ClientUser.username.in_(roles)).all()
+    changed = [client_user for client_user in client_users if client_user.role != roles[client_user.username]]
+    for client_user in changed:
+        client_user.role = roles[client_user.username]
+    if changed:
+        db.commit()
+        logger.info("Changed %s Roles", len(changed))
@@ -1,10 +1,15 @@
+from functools import lru_cache
+
 from dotenv import load_dotenv
 from pydantic import SecretStr
 from pydantic_settings import BaseSettings
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+
+from utils import metrics, sql_profiler
 
-load_dotenv()
+DB_SCHEMA = "sheep_it"
 
 
 class PGSettings(BaseSettings):
@@ -20,11 +25,33 @@ class PGSettings(BaseSettings):
         return f"postgresql://{self.pg_user}:{self.pg_password.get_secret_value()}@{self.pg_host}:{self.pg_port}/{self.pg_db}"
 
 
-pg_settings = PGSettings()
-engine = create_engine(pg_settings.database_url)
+@lru_cache
+def get_pg_settings() -> PGSettings:
+    load_dotenv()
+    return PGSettings()
+
+
+@lru_cache
+def get_engine() -> Engine:
+    """
+    The engine is created on first use rather than at import, so importing the app, the models or a script
+    costs no settings parsing, driver setup or connection. Schema management lives in scripts/bootstrap_db.py.
+    """
+    # Batched executemany for updates as well as inserts, instead of one round trip per row
+    engine = create_engine(get_pg_settings().database_url, executemany_mode="values_plus_batch")
+    metrics.instrument_engine(engine)
+    sql_profiler.instrument_engine(engine)
+    return engine
+
+
 Base = declarative_base()
-Base.__table_args__ = {"schema": "sheep_it"}
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.__table_args__ = {"schema": DB_SCHEMA}
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+
+def SessionLocal() -> Session:
+    return _session_factory(bind=get_engine())
+
 
 def get_db():
     db = SessionLocal()
@@ -16,7 +16,22 @@ class TransactionType(Enum):
     SPIN_AND_GOLD = "Spin and Gold"
     RAKEBACK = "RakeBack"
     TRANSFER = "Transfer"
+    ADJUSTMENT = "Adjustment"  # Balance correction from a reconciliation
+
+
+# The types that are games played, as opposed to money moved by the club
+GAME_TRANSACTION_TYPES = (TransactionType.MTT, TransactionType.SNG, TransactionType.RING_GAME,
+                          TransactionType.SPIN_AND_GOLD)
 
 class RakebackType(Enum):
     FLAT = "FLAT"  # Rakeback only for player's own rake
-    ALL_DOWNLINES = "ALL_DOWNLINES"  # Rakeback includes downlines' rake
\ No newline at end of file
+    ALL_DOWNLINES = "ALL_DOWNLINES"  # Rakeback includes downlines' rake
+
+
+class IngestJobStatus(Enum):
+    QUEUED = "queued"
+    PARSING = "parsing"
+    WRITING = "writing"
+    DONE = "done"
+    SKIPPED = "skipped"  # Same content was ingested before
+    FAILED = "failed"
@@ -0,0 +1,2 @@
+class RequestBodyTooLarge(Exception):
+    pass
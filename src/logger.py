@@ -1,44 +1,129 @@
+import atexit
+import json
 import logging
+import queue
+import threading
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from pydantic_settings import BaseSettings
+
+
+class LogSettings(BaseSettings):
+    log_level: str = "INFO"
+    # Per-logger overrides, e.g. LOG_LEVELS='{"crud.players": "WARNING", "logic.gg_parser": "DEBUG"}'
+    log_levels: Dict[str, str] = {}
+    log_format: str = "json"  # "json" or "text"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        sample_every = getattr(record, "sample_every", None)
+        if sample_every:
+            payload["sample_every"] = sample_every
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Hands the record to the queue untouched.
+    The stock QueueHandler formats the message in the calling thread, here both the %-interpolation
+    and the formatting happen on the listener thread, off the request path.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+@lru_cache
+def get_log_settings() -> LogSettings:
+    load_dotenv()
+    return LogSettings()
+
+
+@lru_cache
+def get_queue_handler() -> QueueHandler:
+    """Single queue shared by all loggers, drained by one background listener writing to stderr."""
+    settings = get_log_settings()
+    console_handler = logging.StreamHandler()
+    if settings.log_format == "json":
+        console_handler.setFormatter(JsonFormatter(datefmt='%Y-%m-%dT%H:%M:%S%z'))
+    else:
+        console_handler.setFormatter(logging.Formatter(
+            '[%(name)s] [%(asctime)s] [%(levelname)s] - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, console_handler)
+    listener.start()
+    # Flush whatever is still queued on interpreter shutdown
+    atexit.register(listener.stop)
+    return DeferredQueueHandler(log_queue)
 
 
 class GGLogger:
-    def __init__(self, name=__name__, level=logging.DEBUG):
+    def __init__(self, name=__name__, level=None):
         """
         Initialize the logger.
 
+        Messages are formatted lazily: pass arguments separately (`logger.info("Created %s", username)`)
+        so nothing is interpolated unless the level is enabled.
+
         :param name: The name of the logger, defaults to the current module name.
-        :param level: Logging level, defaults to DEBUG.
+        :param level: Logging level, defaults to the LOG_LEVELS override for this name, or LOG_LEVEL.
         """
+        settings = get_log_settings()
+        if level is None:
+            level = settings.log_levels.get(name, settings.log_level)
+
         self.logger = logging.getLogger(name)
         self.logger.setLevel(level)
+        self._sample_counts: Dict[str, int] = {}
+        # Loggers are shared by the request threads and the ingest workers
+        self._sample_lock = threading.Lock()
 
         # Avoid duplicate handlers if multiple instances are created
         if not self.logger.handlers:
-            # Create a console handler
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(level)
+            self.logger.addHandler(get_queue_handler())
 
-            formatter = logging.Formatter(
-                '[%(name)s] [%(asctime)s] [%(levelname)s] - %(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
+    def _log(self, level, message, args, sample: Optional[int], **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        if sample and sample > 1:
+            # Keep 1 of every `sample` records per message template
+            with self._sample_lock:
+                count = self._sample_counts.get(message, 0)
+                self._sample_counts[message] = count + 1
+            if count % sample:
+                return
+            kwargs["extra"] = {**kwargs.get("extra", {}), "sample_every": sample}
+        self.logger.log(level, message, *args, stacklevel=3, **kwargs)
 
-    def debug(self, message):
-        self.logger.debug(message)
+    def debug(self, message, *args, sample: Optional[int] = None):
+        self._log(logging.DEBUG, message, args, sample)
 
-    def info(self, message):
-        self.logger.info(message)
+    def info(self, message, *args, sample: Optional[int] = None):
+        self._log(logging.INFO, message, args, sample)
 
-    def warning(self, message):
-        self.logger.warning(message)
+    def warning(self, message, *args, sample: Optional[int] = None):
+        self._log(logging.WARNING, message, args, sample)
 
-    def error(self, message):
-        self.logger.error(message)
+    def error(self, message, *args):
+        self._log(logging.ERROR, message, args, None)
 
-    def exception(self, message):
-        self.logger.exception(message)
+    def exception(self, message, *args):
+        self._log(logging.ERROR, message, args, None, exc_info=True)
 
     def set_level(self, level=logging.INFO):
         self.logger.setLevel(level)
@@ -4,6 +4,7 @@ from hashlib import md5
 from pathlib import Path
 from typing import List, Optional, Set
 import re
+import time
 
 import pandas as pd
 import numpy as np
@@ -11,7 +12,9 @@ import numpy as np
 from enums import UserRole, TransactionType
 from logger import GGLogger
 from schemas.players import PlayerCreate
-from schemas.transactions import TransactionCreate
+from schemas.transaction_batch import TransactionBatch
+from utils.metrics import ingest_stage_duration
+from utils.money import to_cents_array
 
 logger = GGLogger(__name__)
 
@@ -34,9 +37,29 @@ def check_data_clean(func):
     return wrapper
 
 
+def timed_stage(stage: str):
+    """Record the duration of an ingest stage, counted once when an override calls into super()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if getattr(self, '_active_stage', None):
+                return func(self, *args, **kwargs)
+            self._active_stage = stage
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self._active_stage = None
+                ingest_stage_duration.observe(time.perf_counter() - start, type(self).__name__, stage)
+        return wrapper
+    return decorator
+
+
 class ClubGGDataParser:
     DATA_DIR = Path(__file__).parents[2] / 'resources'
     MULTI_TABLE_SHEET = False
+    # Amount columns, converted to int64 cents once the tables are clean
+    MONEY_COLUMNS: List[str] = []
 
     def __init__(self, club_id):
         self.club_id = club_id
@@ -44,11 +67,12 @@ class ClubGGDataParser:
         self._clean: bool = False
         self._raw_data: Optional[pd.DataFrame] = None
 
+    @timed_stage("load")
     def load_data_from_file(self, file=None, sheet_name=None, **kwargs):
-        logger.info(sheet_name)
         if not file:
             file = self.get_latest_file()
-        logger.info(f'Getting Data From: {file}')
+        # An already opened pd.ExcelFile lets several parsers share one workbook read
+        logger.info('Getting %s Data From: %s', sheet_name, file.io if isinstance(file, pd.ExcelFile) else file)
         self._raw_data = pd.read_excel(file, sheet_name=sheet_name, header=None, **kwargs)
 
     def get_latest_file(self):
@@ -134,8 +158,15 @@ class ClubGGDataParser:
         for i in range(len(self)):
             self.data[i] = self.data[i].replace(to_replace=["-", pd.NA, np.nan], value=None)
 
+    @check_data_clean
+    def _money_to_cents(self):
+        for i in range(len(self)):
+            for column in self.MONEY_COLUMNS:
+                self.data[i][column] = to_cents_array(self.data[i][column])
+
 
 
+    @timed_stage("clean")
     def clean_data(self, columns: List[str], metadata_terms: Optional[Set[str]] = None, metadata_rows: int = 0,
                    header_rows: int = 1, *args, **kwargs):
         if len(self._raw_data) <= header_rows + metadata_rows:
@@ -149,6 +180,7 @@ class ClubGGDataParser:
             self._set_column_names(columns)
             self._remove_irrelevant_rows(metadata_rows + header_rows)
             self._normalize_none()
+            self._money_to_cents()
             self._clean = True
             logger.info("Finished cleaning data")
 
@@ -171,14 +203,17 @@ class ClubOverviewDataParser(ClubGGDataParser):
     def __init__(self, club_id):
         super().__init__(club_id)
 
+    @timed_stage("load")
     def load_data_from_file(self, file=None, **kwargs):
         super().load_data_from_file(file, self.SHEET_NAME, **kwargs)
         
+    @timed_stage("clean")
     def clean_data(self, *args, **kwargs):
         super().clean_data(columns=self.COLUMNS, metadata_terms=self.METADATA_TERMS, metadata_rows=self.METADATA_ROWS,
                            header_rows=self.HEADER_ROWS)
 
     @check_data_clean
+    @timed_stage("players")
     def get_players(self):
         players: List[PlayerCreate] = []
 
@@ -224,6 +259,7 @@ class ClubOverviewDataParser(ClubGGDataParser):
 class SNGDetailsDataParser(ClubGGDataParser):
     SHEET_NAME = "SNG Detail"
     COLUMNS = ["MemberID", "MemberName", "Buyin", "Fee", "Hands", "Prize", "Winnings"]
+    MONEY_COLUMNS = ["Buyin", "Fee", "Prize", "Winnings"]
     METADATA_ROWS = 3
     METADATA_TERMS = {"Table Name"}
     HEADER_ROWS = 2
@@ -232,39 +268,42 @@ class SNGDetailsDataParser(ClubGGDataParser):
     def __init__(self, club_id):
         super().__init__(club_id)
 
+    @timed_stage("load")
     def load_data_from_file(self, file=None, **kwargs):
         super().load_data_from_file(file, self.SHEET_NAME, **kwargs)
 
+    @timed_stage("clean")
     def clean_data(self, *args, **kwargs):
         super().clean_data(columns=self.COLUMNS, metadata_terms=self.METADATA_TERMS, metadata_rows=self.METADATA_ROWS,
                            header_rows=self.HEADER_ROWS)
         
+    @timed_stage("transactions")
     def get_transactions(self):
-        transactions: List[TransactionCreate] = list()
+        transactions: List[TransactionBatch] = list()
         for i in range(len(self)):
             df = self[i]
-            for _, row in df.iterrows():
-                transaction = TransactionCreate(
-                    id = df.attrs['id'],
-                    username=row.MemberName,
-                    transaction_type=TransactionType.SNG,
-                    hands=row.Hands,
-                    rake=row.Fee,
-                    date=df.attrs.get("Date"),
-                    details=df.attrs.get("Table Name"),
-                    total_buyin=row.Buyin + row.Fee,
-                    total_cashout=row.Prize,
-                    created_by='App'
-                )
-                transactions.append(transaction)
-
-        return transactions
+            transactions.append(TransactionBatch.from_columns(
+                id=df.attrs['id'],
+                username=df.MemberName,
+                transaction_type=TransactionType.SNG,
+                hands=df.Hands,
+                rake=df.Fee,
+                date=df.attrs.get("Date"),
+                details=df.attrs.get("Table Name"),
+                total_buyin=df.Buyin + df.Fee,
+                total_cashout=df.Prize,
+                created_by='App'
+            ))
+
+        return TransactionBatch.concat(transactions)
 
 
 class MTTDetailsDataParser(ClubGGDataParser):
     SHEET_NAME = "MTT Detail"
     COLUMNS = ["MemberID", "MemberName", "Buyin", "TBuyin", "Fee", "TFee", "ReBuyin", "ReTBuyin", "ReFee",
                "ReTFee", "Hands", "BountyPrize", "RegularPrize", "BubbleProtection", "Winnings"]
+    MONEY_COLUMNS = ["Buyin", "TBuyin", "Fee", "TFee", "ReBuyin", "ReTBuyin", "ReFee", "ReTFee", "BountyPrize",
+                     "RegularPrize", "BubbleProtection", "Winnings"]
     METADATA_ROWS = 3
     METADATA_TERMS = {"Table Name"}
     HEADER_ROWS = 3
@@ -273,41 +312,44 @@ class MTTDetailsDataParser(ClubGGDataParser):
     def __init__(self, club_id):
         super().__init__(club_id)
 
+    @timed_stage("load")
     def load_data_from_file(self, file=None, **kwargs):
         super().load_data_from_file(file, self.SHEET_NAME, **kwargs)
 
+    @timed_stage("clean")
     def clean_data(self, *args, **kwargs):
         super().clean_data(columns=self.COLUMNS, metadata_terms=self.METADATA_TERMS, metadata_rows=self.METADATA_ROWS,
                            header_rows=self.HEADER_ROWS)
 
+    @timed_stage("transactions")
     def get_transactions(self):
-        transactions: List[TransactionCreate] = list()
+        transactions: List[TransactionBatch] = list()
         for i in range(len(self)):
             df = self[i]
-            for _, row in df.iterrows():
-                rake = sum([row.Fee, row.TFee, row.ReFee, row.ReTFee])
-                total_buyin = sum([row.Buyin, row.TBuyin, row.ReBuyin, row.ReTBuyin, rake])
-                total_cashout = round(row.Winnings + total_buyin, 2)
-                transaction = TransactionCreate(
-                    id=df.attrs['id'],
-                    username=row.MemberName,
-                    transaction_type=TransactionType.MTT,
-                    rake=rake,
-                    date=df.attrs.get("Date"),
-                    details=df.attrs.get("Table Name", ""),
-                    total_buyin=total_buyin,
-                    total_cashout=total_cashout,
-                    hands=row.Hands,
-                    created_by='App'
-                )
-                transactions.append(transaction)
-        return transactions
+            rake = df.Fee + df.TFee + df.ReFee + df.ReTFee
+            total_buyin = df.Buyin + df.TBuyin + df.ReBuyin + df.ReTBuyin + rake
+            total_cashout = df.Winnings + total_buyin
+            transactions.append(TransactionBatch.from_columns(
+                id=df.attrs['id'],
+                username=df.MemberName,
+                transaction_type=TransactionType.MTT,
+                rake=rake,
+                date=df.attrs.get("Date"),
+                details=df.attrs.get("Table Name", ""),
+                total_buyin=total_buyin,
+                total_cashout=total_cashout,
+                hands=df.Hands,
+                created_by='App'
+            ))
+        return TransactionBatch.concat(transactions)
 
 
 class RingGameDetailsDataParser(ClubGGDataParser):
     SHEET_NAME = "Ring Game Detail"
     COLUMNS = ["MemberID", "MemberName", "Buyin", "Cashout", "Hands", "Insurance", "EVCashout", "SquidGame",
                "BadBeatFee", "BadBeatCashout", "Fee", "Total"]
+    MONEY_COLUMNS = ["Buyin", "Cashout", "Insurance", "EVCashout", "SquidGame", "BadBeatFee", "BadBeatCashout", "Fee",
+                     "Total"]
     METADATA_ROWS = 3
     METADATA_TERMS = {"Table Name"}
     HEADER_ROWS = 2
@@ -323,14 +365,14 @@ class RingGameDetailsDataParser(ClubGGDataParser):
         files.sort(key=lambda x: x.name.split('_')[1], reverse=True)
         return files[:n]
 
+    @timed_stage("load")
     def load_data_from_file(self, file=None, sheet_name=None, **kwargs):
         """Load data from one or two latest files."""
-        logger.info(sheet_name)
         if not file:
             files = self.get_latest_files()
             dfs = []
             for file in files:
-                logger.info(f'Getting Data From: {file}')
+                logger.info('Getting %s Data From: %s', self.SHEET_NAME, file)
                 df = pd.read_excel(file, sheet_name=self.SHEET_NAME, header=None, **kwargs)
                 dfs.append(df)
             # Concatenate the dataframes
@@ -338,6 +380,7 @@ class RingGameDetailsDataParser(ClubGGDataParser):
         else:
             super().load_data_from_file(file, self.SHEET_NAME, **kwargs)
 
+    @timed_stage("clean")
     def clean_data(self, *args, **kwargs):
         super().clean_data(columns=self.COLUMNS, metadata_terms=self.METADATA_TERMS, metadata_rows=self.METADATA_ROWS,
                            header_rows=self.HEADER_ROWS)
@@ -345,68 +388,47 @@ class RingGameDetailsDataParser(ClubGGDataParser):
 
     
     def merge_ring_game_data(self):
-        """Merge ring game tables that have the same ID but different dates"""
-        grouped_tables = {}
-        # Group tables by ID
-        for df in self.data:
-            df_id = df.attrs.get('id')
-            if df_id:
-                if df_id not in grouped_tables:
-                    grouped_tables[df_id] = []
-                grouped_tables[df_id].append(df)
-        
+        """
+        Keep one table per ring game and day. A table that runs past midnight is reported once per day, each with
+        that day's part of the game; the parts are separate transactions, see crud/transaction_index.py.
+        The same table and day reported twice, as when loading the two latest files, keeps the first, latest one.
+        """
         merged_data = []
-        numeric_columns = self.COLUMNS[2:]
-        
-        for tables in grouped_tables.values():
-            # If only one table for this ID, add it as is
-            if len(tables) == 1:
-                merged_data.append(tables[0])
+        seen = set()
+        for df in self.data:
+            key = (df.attrs.get('id'), df.attrs.get('Date'))
+            if not key[0] or key in seen:
                 continue
-            
-            # Check if tables have different dates
-            dates = {df.attrs.get('Date') for df in tables}
-            if len(dates) > 1:
-                # Different dates - merge tables
-                combined = pd.concat(tables)
-                merged = combined.groupby('MemberName', as_index=False).agg({
-                    'MemberID': 'first',
-                    **{col: 'sum' for col in numeric_columns}
-                })
-                # Preserve metadata from the latest table
-                merged.attrs = tables[0].attrs
-                merged_data.append(merged)
-            else:
-                # Same date - keep only the latest table
-                merged_data.append(tables[0])
-        
+            seen.add(key)
+            merged_data.append(df)
+
         self.data = merged_data
 
+    @timed_stage("transactions")
     def get_transactions(self):
-        transactions: List[TransactionCreate] = list()
+        transactions: List[TransactionBatch] = list()
         for i in range(len(self)):
             df = self[i]
-            for _, row in df.iterrows():
-                transaction = TransactionCreate(
-                    id=df.attrs['id'],
-                    username=row.MemberName,
-                    transaction_type=TransactionType.RING_GAME,
-                    bad_beat_contribution=row.BadBeatFee,
-                    bad_beat_cashout=row.BadBeatCashout,
-                    rake=row.Fee,
-                    date=df.attrs.get("Date"),
-                    details=df.attrs.get("Table Name", ""),
-                    total_buyin=row.Buyin,
-                    total_cashout=row.Cashout,
-                    hands=row.Hands,
-                    created_by='App'
-                )
-                transactions.append(transaction)
-        return transactions
+            transactions.append(TransactionBatch.from_columns(
+                id=df.attrs['id'],
+                username=df.MemberName,
+                transaction_type=TransactionType.RING_GAME,
+                bad_beat_contribution=df.BadBeatFee,
+                bad_beat_cashout=df.BadBeatCashout,
+                rake=df.Fee,
+                date=df.attrs.get("Date"),
+                details=df.attrs.get("Table Name", ""),
+                total_buyin=df.Buyin,
+                total_cashout=df.Cashout,
+                hands=df.Hands,
+                created_by='App'
+            ))
+        return TransactionBatch.concat(transactions)
 
 class SpinAndGoldDataParser(ClubGGDataParser):
     SHEET_NAME = "Spin&Gold Detail"
     COLUMNS = ["MemberID", "MemberName", "Buyin", "Hands", "Prize", "Winnings"]
+    MONEY_COLUMNS = ["Buyin", "Prize", "Winnings"]
     METADATA_ROWS = 3
     METADATA_TERMS = {"Table Name"}
     HEADER_ROWS = 2
@@ -415,29 +437,30 @@ class SpinAndGoldDataParser(ClubGGDataParser):
     def __init__(self, club_id):
         super().__init__(club_id)
 
+    @timed_stage("load")
     def load_data_from_file(self, file=None, **kwargs):
         super().load_data_from_file(file, self.SHEET_NAME, **kwargs)
 
+    @timed_stage("clean")
     def clean_data(self, *args, **kwargs):
         super().clean_data(columns=self.COLUMNS, metadata_terms=self.METADATA_TERMS, metadata_rows=self.METADATA_ROWS,
                            header_rows=self.HEADER_ROWS)
 
 
+    @timed_stage("transactions")
     def get_transactions(self):
-        transactions: List[TransactionCreate] = list()
+        transactions: List[TransactionBatch] = list()
         for i in range(len(self)):
             df = self[i]
-            for _, row in df.iterrows():
-                transaction = TransactionCreate(
-                    id=df.attrs['id'],
-                    username=row.MemberName,
-                    transaction_type=TransactionType.SPIN_AND_GOLD,
-                    date=df.attrs.get("Date"),
-                    details=df.attrs.get("Table Name", ""),
-                    total_buyin=row.Buyin,
-                    total_cashout=row.Prize,
-                    hands=row.Hands,
-                    created_by='App'
-                )
-                transactions.append(transaction)
-        return transactions
+            transactions.append(TransactionBatch.from_columns(
+                id=df.attrs['id'],
+                username=df.MemberName,
+                transaction_type=TransactionType.SPIN_AND_GOLD,
+                date=df.attrs.get("Date"),
+                details=df.attrs.get("Table Name", ""),
+                total_buyin=df.Buyin,
+                total_cashout=df.Prize,
+                hands=df.Hands,
+                created_by='App'
+            ))
+        return TransactionBatch.concat(transactions)
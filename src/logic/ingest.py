@@ -0,0 +1,277 @@
+"""
+Report ingestion shared by every entry point: the email pipeline, the CLI, the watch folder and uploads.
+
+A report goes through three steps, each usable on its own:
+    open_report   - content hash, club id and the sheets the workbook contains (read through openpyxl once)
+    parse_report  - the gg_parser classes for the sheets that are present
+    write_reports - players first, then transactions, each as a single bulk write, then the dedup records
+"""
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from crud.ingested_files import is_ingested, mark_ingested
+from crud.players import bulk_update_players
+from crud.transaction_index import KnownTransactions
+from crud.transactions import bulk_overwrite_transactions
+from db import SessionLocal, get_engine
+from logger import GGLogger
+from logic.gg_parser import (ClubGGDataParser, ClubOverviewDataParser, MTTDetailsDataParser,
+                             RingGameDetailsDataParser, SNGDetailsDataParser, SpinAndGoldDataParser)
+from models import Player
+from schemas.players import PlayerCreate
+from schemas.transaction_batch import TransactionBatch
+
+logger = GGLogger(__name__)
+
+PLAYER_PARSER = ClubOverviewDataParser
+TRANSACTION_PARSERS: List[Type[ClubGGDataParser]] = [SNGDetailsDataParser, MTTDetailsDataParser,
+                                                     SpinAndGoldDataParser, RingGameDetailsDataParser]
+REPORT_SHEETS = {parser.SHEET_NAME for parser in [PLAYER_PARSER, *TRANSACTION_PARSERS]}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(path: Path) -> str:
+    digest = sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def club_id_from_filename(path: Path) -> str:
+    """ClubGG names its exports <club id>_<timestamp>.xlsx"""
+    return Path(path).name.split('_')[0]
+
+
+def report_sort_key(path: Path) -> str:
+    """Exports sort chronologically by the timestamp in their name, as in ClubGGDataParser.get_latest_file"""
+    name = Path(path).name
+    return name.split('_')[1] if '_' in name else name
+
+
+@dataclass
+class ReportFile:
+    path: Path
+    club_id: str
+    content_hash: str
+    source: str
+    sheets: List[str] = field(default_factory=list)
+    workbook: Optional[pd.ExcelFile] = None
+
+    def close(self):
+        if self.workbook is not None:
+            self.workbook.close()
+            self.workbook = None
+
+
+@dataclass
+class ParsedReport:
+    file: ReportFile
+    players: List[PlayerCreate]
+    transactions: TransactionBatch
+
+
+@dataclass
+class IngestResult:
+    files: List[ReportFile]
+    players_created: int = 0
+    players_updated: int = 0
+    transactions_created: int = 0
+    transactions_updated: int = 0
+    # Seconds spent per write phase
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def open_report(path: Path, source: str, club_id: Optional[str] = None,
+                file_hash: Optional[str] = None) -> ReportFile:
+    """Open the workbook once and list its report sheets; the parsers then share the opened workbook."""
+    path = Path(path)
+    report = ReportFile(path=path, club_id=club_id or club_id_from_filename(path),
+                        content_hash=file_hash or content_hash(path), source=source)
+    report.workbook = pd.ExcelFile(path, engine='openpyxl')
+    report.sheets = [sheet for sheet in report.workbook.sheet_names if sheet in REPORT_SHEETS]
+    return report
+
+
+def _run_parser(parser_cls: Type[ClubGGDataParser], report: ReportFile) -> Optional[ClubGGDataParser]:
+    if parser_cls.SHEET_NAME not in report.sheets:
+        return None
+    parser = parser_cls(report.club_id)
+    parser.load_data_from_file(report.workbook)
+    parser.clean_data()
+    return parser if len(parser) else None
+
+
+def parse_report(report: ReportFile,
+                 on_sheet: Optional[Callable[[str, int, int], None]] = None) -> ParsedReport:
+    """`on_sheet(sheet name, tables, rows)` is called after each sheet, for progress reporting"""
+    try:
+        player_parser = _run_parser(PLAYER_PARSER, report)
+        players = player_parser.get_players() if player_parser else []
+        if player_parser and on_sheet:
+            on_sheet(PLAYER_PARSER.SHEET_NAME, len(player_parser), len(players))
+
+        sheets: List[TransactionBatch] = []
+        for parser_cls in TRANSACTION_PARSERS:
+            parser = _run_parser(parser_cls, report)
+            if parser:
+                sheet_transactions = parser.get_transactions()
+                sheets.append(sheet_transactions)
+                if on_sheet:
+                    on_sheet(parser_cls.SHEET_NAME, len(parser), len(sheet_transactions))
+    finally:
+        report.close()
+
+    transactions = TransactionBatch.concat(sheets)
+
+    logger.info('Parsed %s: %s players, %s transactions', report.path.name, len(players), len(transactions))
+    return ParsedReport(file=report, players=players, transactions=transactions)
+
+
+def write_report(db: Session, parsed: ParsedReport, known: Optional[KnownTransactions] = None) -> IngestResult:
+    return write_reports(db, [parsed], known)
+
+
+def write_reports(db: Session, reports: List[ParsedReport],
+                  known: Optional[KnownTransactions] = None) -> IngestResult:
+    """
+    Write the reports of one club, oldest first, as one players phase followed by one transactions phase.
+    Players go first so new players exist by the time their balances change; the latest roster wins.
+    Long running ingest processes pass their `known` transactions, so unchanged rows are settled in memory.
+    """
+    result = IngestResult(files=[parsed.file for parsed in reports])
+
+    start = time.perf_counter()
+    players = {player.username: player for parsed in reports for player in parsed.players}
+    if players:
+        result.players_created, result.players_updated = bulk_update_players(db, list(players.values()))
+    result.timings['players'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    transactions = TransactionBatch.concat(parsed.transactions for parsed in reports)
+    if transactions:
+        result.transactions_created, result.transactions_updated = bulk_overwrite_transactions(db, transactions,
+                                                                                               known=known)
+    result.timings['transactions'] = time.perf_counter() - start
+
+    for parsed in reports:
+        mark_ingested(db, parsed.file.content_hash, parsed.file.club_id, parsed.file.path.name, parsed.file.source,
+                      players=len(parsed.players), transactions=len(parsed.transactions))
+    return result
+
+
+def ingest_file(db: Session, path: Path, source: str, club_id: Optional[str] = None,
+                force: bool = False) -> Optional[IngestResult]:
+    """Open, parse and write one report, unless the same content was ingested before."""
+    file_hash = content_hash(path)
+    if not force and is_ingested(db, file_hash):
+        logger.info('Skipping %s, already ingested', Path(path).name)
+        return None
+    return write_report(db, parse_report(open_report(path, source, club_id, file_hash)))
+
+
+STAGES = ("hash", "parse", "players", "transactions")
+
+
+@dataclass
+class ClubRun:
+    club_id: str
+    files: int = 0
+    skipped: int = 0
+    players_created: int = 0
+    players_updated: int = 0
+    transactions_created: int = 0
+    transactions_updated: int = 0
+    timings: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(STAGES, 0.0))
+    # username -> (balance before, balance after), filled in dry-run mode
+    balance_changes: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+@contextmanager
+def club_session(dry_run: bool) -> Iterator[Session]:
+    if not dry_run:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+        return
+
+    # The crud functions commit as usual, but only to a savepoint of an outer transaction that is rolled back
+    connection = get_engine().connect()
+    outer = connection.begin()
+    db = Session(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield db
+    finally:
+        db.close()
+        outer.rollback()
+        connection.close()
+
+
+def _balances(db: Session, usernames: set) -> Dict[str, int]:
+    rows = db.execute(select(Player.username, Player.balance).where(Player.username.in_(usernames)))
+    return {username: balance or 0 for username, balance in rows}
+
+
+def ingest_club(club_id: str, paths: List[Path], dry_run: bool = False, force: bool = False,
+                source: str = "cli", known: Optional[KnownTransactions] = None) -> ClubRun:
+    """
+    Ingest a batch of one club's reports in its own session, skipping the ones ingested before.
+    In dry-run mode everything is written inside a transaction that is rolled back, and `known` is left out:
+    it must only learn of committed rows.
+    """
+    run = ClubRun(club_id=club_id, files=len(paths))
+    try:
+        with club_session(dry_run) as db:
+            reports: List[ParsedReport] = []
+            for path in paths:
+                start = time.perf_counter()
+                file_hash = content_hash(path)
+                skip = not force and is_ingested(db, file_hash)
+                run.timings['hash'] += time.perf_counter() - start
+                if skip:
+                    run.skipped += 1
+                    continue
+
+                start = time.perf_counter()
+                report = open_report(path, source, club_id, file_hash)
+                if report.sheets:
+                    reports.append(parse_report(report))
+                else:
+                    report.close()
+                    run.skipped += 1
+                run.timings['parse'] += time.perf_counter() - start
+
+            if not reports:
+                return run
+
+            usernames = {player.username for parsed in reports for player in parsed.players}
+            usernames.update(*(parsed.transactions.usernames() for parsed in reports))
+            before = _balances(db, usernames) if dry_run else {}
+            result = write_reports(db, reports, None if dry_run else known)
+            run.players_created, run.players_updated = result.players_created, result.players_updated
+            run.transactions_created = result.transactions_created
+            run.transactions_updated = result.transactions_updated
+            run.timings.update(result.timings)
+
+            if dry_run:
+                after = _balances(db, usernames)
+                run.balance_changes = {
+                    username: (before.get(username, 0), balance) for username, balance in after.items()
+                    if balance != before.get(username, 0)
+                }
+    except Exception as e:
+        logger.exception('Ingest of club %s failed', club_id)
+        run.error = f"{type(e).__name__}: {e}"
+    return run
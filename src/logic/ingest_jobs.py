@@ -0,0 +1,141 @@
+"""
+Background ingest jobs for uploaded exports.
+
+The upload request only stores the file and queues a job; parsing and writing happen in a small worker pool,
+and the job object is what the status endpoint reports. Jobs live in this process only, and the uploaded file
+is deleted once its job finished, whatever the outcome.
+"""
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, UTC
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+
+from crud.ingested_files import is_ingested
+from db import SessionLocal
+from enums import IngestJobStatus
+from logger import GGLogger
+from logic.ingest import content_hash, open_report, parse_report, write_report
+from logic.ingest_pipeline import IngestSettings, get_ingest_settings, known_transactions
+from utils.metrics import ingest_pipeline_items_total, ingest_pipeline_stage_duration
+
+logger = GGLogger(__name__)
+
+FINISHED = {IngestJobStatus.DONE, IngestJobStatus.SKIPPED, IngestJobStatus.FAILED}
+
+
+@dataclass
+class SheetProgress:
+    sheet: str
+    tables: int
+    rows: int
+
+
+@dataclass
+class IngestJob:
+    id: str
+    path: Path
+    filename: str
+    club_id: str
+    submitted_by: str
+    status: IngestJobStatus = IngestJobStatus.QUEUED
+    created_at: datetime = field(default_factory=lambda: datetime.now(UTC))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    sheets: List[SheetProgress] = field(default_factory=list)
+    players_created: int = 0
+    players_updated: int = 0
+    transactions_created: int = 0
+    transactions_updated: int = 0
+    error: Optional[str] = None
+
+
+class IngestJobs:
+    def __init__(self, settings: Optional[IngestSettings] = None):
+        self.settings = settings or get_ingest_settings()
+        self._executor = ThreadPoolExecutor(max_workers=self.settings.ingest_upload_workers,
+                                            thread_name_prefix="ingest-upload")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Writes of one club are serialized, so concurrent uploads never interleave balance updates
+        self._club_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self.known = known_transactions(self.settings)
+
+    def submit_upload(self, stream: BinaryIO, filename: str, club_id: str, submitted_by: str) -> IngestJob:
+        """Store the uploaded export and queue its ingest, returning as soon as the file is on disk"""
+        job_id = uuid.uuid4().hex
+        filename = Path(filename).name
+        path = Path(self.settings.ingest_upload_dir) / job_id / filename
+        path.parent.mkdir(parents=True)
+        with open(path, 'wb') as file:
+            shutil.copyfileobj(stream, file)
+
+        job = IngestJob(id=job_id, path=path, filename=filename, club_id=club_id, submitted_by=submitted_by)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._forget_finished()
+        self._executor.submit(self._run, job)
+        logger.info('Queued ingest job %s for %s from %s', job_id, filename, submitted_by)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        """Most recent first"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _forget_finished(self):
+        excess = len(self._jobs) - self.settings.ingest_job_history
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.status in FINISHED][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: IngestJob):
+        job.started_at = datetime.now(UTC)
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            file_hash = content_hash(job.path)
+            if is_ingested(db, file_hash):
+                job.status = IngestJobStatus.SKIPPED
+                return
+
+            job.status = IngestJobStatus.PARSING
+            report = open_report(job.path, "upload", job.club_id, file_hash)
+            if not report.sheets:
+                report.close()
+                raise ValueError("The file has none of the ClubGG report sheets")
+            parsed = parse_report(report, lambda sheet, tables, rows: job.sheets.append(
+                SheetProgress(sheet=sheet, tables=tables, rows=rows)))
+
+            job.status = IngestJobStatus.WRITING
+            with self._club_locks[job.club_id]:
+                result = write_report(db, parsed, self.known)
+            job.players_created, job.players_updated = result.players_created, result.players_updated
+            job.transactions_created = result.transactions_created
+            job.transactions_updated = result.transactions_updated
+            job.status = IngestJobStatus.DONE
+        except Exception as e:
+            logger.exception('Ingest job %s failed', job.id)
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = IngestJobStatus.FAILED
+        finally:
+            db.close()
+            # Each upload has a directory of its own
+            shutil.rmtree(job.path.parent, ignore_errors=True)
+            job.finished_at = datetime.now(UTC)
+            ingest_pipeline_stage_duration.observe(time.perf_counter() - start, "upload")
+            ingest_pipeline_items_total.inc("upload", job.status.value)
+
+
+@lru_cache
+def get_ingest_jobs() -> IngestJobs:
+    return IngestJobs()
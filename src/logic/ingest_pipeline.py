@@ -0,0 +1,401 @@
+"""
+Streaming ingestion: new report emails reach player balances without anyone copying files around.
+
+    email source -> fetch -> detect -> parse -> write
+
+Stages are connected by bounded asyncio queues, so a slow stage makes the ones before it wait instead of
+piling up downloaded workbooks in memory. Every stage runs its blocking work in worker threads with its own
+concurrency, and reports per-item duration and outcome to the /metrics endpoint.
+"""
+import asyncio
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set
+
+from dotenv import load_dotenv
+from pydantic_settings import BaseSettings
+
+from clients.email_client import EmailClient, EmailSettings, get_email_settings
+from clients.mailbox_state import MailboxSyncState
+from crud.ingested_files import is_ingested
+from crud.transaction_index import KnownTransactions
+from db import SessionLocal
+from logger import GGLogger
+from logic.gg_parser import ClubGGDataParser
+from logic.ingest import IngestResult, ParsedReport, ReportFile, content_hash, open_report, parse_report, write_report
+from utils.metrics import ingest_pipeline_items_total, ingest_pipeline_stage_duration
+
+logger = GGLogger(__name__)
+
+REPORT_EXTENSIONS = ['.xlsx']
+
+
+class IngestSettings(BaseSettings):
+    ingest_queue_size: int = 8
+    ingest_fetch_concurrency: int = 1
+    ingest_detect_concurrency: int = 2
+    ingest_parse_concurrency: int = 2
+    # Balance updates of one club must not interleave, keep a single writer unless reports never share players
+    ingest_write_concurrency: int = 1
+    # Watch-folder daemon
+    ingest_watch_dir: Path = ClubGGDataParser.DATA_DIR
+    ingest_watch_settle_seconds: float = 2.0
+    ingest_watch_poll_interval: float = 5.0
+    ingest_watch_workers: int = 2
+    # Upload endpoint
+    ingest_upload_dir: Path = Path("uploads")
+    ingest_upload_workers: int = 2
+    ingest_job_history: int = 200
+    # Known transactions index of the long running writers (crud/transaction_index.py); 0 days turns it off
+    ingest_known_window_days: int = 35
+    ingest_known_false_positive_rate: float = 0.01
+
+
+@lru_cache
+def get_ingest_settings() -> IngestSettings:
+    load_dotenv()
+    return IngestSettings()
+
+
+def known_transactions(settings: IngestSettings) -> Optional[KnownTransactions]:
+    if not settings.ingest_known_window_days:
+        return None
+    return KnownTransactions(settings.ingest_known_window_days, settings.ingest_known_false_positive_rate)
+
+
+# Passed down a queue once its producers are finished
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    # Blocking work for one item, run in a worker thread; returns the items for the next stage
+    handler: Callable[[Any], Iterable[Any]]
+    concurrency: int = 1
+    # Called (in a worker thread) with the item when the handler raised
+    on_error: Optional[Callable[[Any], None]] = None
+
+
+@dataclass
+class StageStats:
+    processed: int = 0
+    produced: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items per second of work, i.e. what one worker of the stage sustains"""
+        return self.processed / self.busy_seconds if self.busy_seconds else 0.0
+
+
+class IngestPipeline:
+    def __init__(self, stages: List[Stage], queue_size: int = 8):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats: Dict[str, StageStats] = {stage.name: StageStats() for stage in stages}
+
+    async def run(self, source: AsyncIterator[Any]):
+        """Feed the first stage from `source` until it is exhausted, then drain every stage."""
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        runners = [
+            asyncio.create_task(self._run_stage(stage, queues[i], queues[i + 1] if i + 1 < len(queues) else None))
+            for i, stage in enumerate(self.stages)
+        ]
+        try:
+            async for item in source:
+                # Blocks while the first stage is saturated, which is the backpressure on the source
+                await queues[0].put(item)
+            await queues[0].put(_DONE)
+            await asyncio.gather(*runners)
+        finally:
+            for runner in runners:
+                runner.cancel()
+            logger.info('Ingest pipeline stopped\n%s', self.summary())
+
+    async def _run_stage(self, stage: Stage, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]):
+        await asyncio.gather(*(self._worker(stage, inbox, outbox) for _ in range(max(stage.concurrency, 1))))
+        if outbox is not None:
+            await outbox.put(_DONE)
+
+    async def _worker(self, stage: Stage, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]):
+        stats = self.stats[stage.name]
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                # Let the sibling workers see it as well
+                await inbox.put(_DONE)
+                return
+
+            start = time.perf_counter()
+            try:
+                outputs = list(await asyncio.to_thread(stage.handler, item))
+            except Exception:
+                logger.exception('Ingest stage %s failed on %s', stage.name, item)
+                stats.errors += 1
+                ingest_pipeline_items_total.inc(stage.name, "error")
+                if stage.on_error:
+                    await asyncio.to_thread(stage.on_error, item)
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                stats.busy_seconds += elapsed
+                ingest_pipeline_stage_duration.observe(elapsed, stage.name)
+
+            stats.processed += 1
+            stats.produced += len(outputs)
+            ingest_pipeline_items_total.inc(stage.name, "processed")
+            if outbox is not None:
+                for output in outputs:
+                    await outbox.put(output)
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<8} {'workers':>7} {'items':>6} {'out':>6} {'errors':>6} {'busy s':>8} {'items/s':>8}"]
+        for stage in self.stages:
+            stats = self.stats[stage.name]
+            lines.append(f"{stage.name:<8} {stage.concurrency:>7} {stats.processed:>6} {stats.produced:>6} "
+                         f"{stats.errors:>6} {stats.busy_seconds:>8.2f} {stats.throughput:>8.2f}")
+        return "\n".join(lines)
+
+
+class ReportStages:
+    """
+    The detect, parse and write stages for report files.
+    A file is skipped when its content was ingested before or is already on its way through the pipeline.
+    """
+
+    def __init__(self, settings: Optional[IngestSettings] = None, source: str = "email",
+                 on_finished: Optional[Callable[[Path, bool], None]] = None):
+        self.settings = settings or get_ingest_settings()
+        self.source = source
+        # Called with each file once it was written or skipped (True), or failed in any stage (False)
+        self.on_finished = on_finished
+        self.results: List[IngestResult] = []
+        self.known = known_transactions(self.settings)
+        self._in_flight: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def stages(self) -> List[Stage]:
+        return [
+            Stage("detect", self.detect, self.settings.ingest_detect_concurrency, self.release),
+            Stage("parse", self.parse, self.settings.ingest_parse_concurrency, self.release),
+            Stage("write", self.write, self.settings.ingest_write_concurrency, self.release),
+        ]
+
+    def detect(self, path: Path) -> List[ReportFile]:
+        file_hash = content_hash(path)
+        with self._lock:
+            if file_hash in self._in_flight:
+                logger.info('Skipping %s, the same report is already being ingested', path.name)
+                self._finished(path, True)
+                return []
+            self._in_flight.add(file_hash)
+
+        try:
+            db = SessionLocal()
+            try:
+                ingested = is_ingested(db, file_hash)
+            finally:
+                db.close()
+            report = None if ingested else open_report(path, self.source, file_hash=file_hash)
+        except Exception:
+            self._discard(file_hash)
+            raise
+        if report is None:
+            logger.info('Skipping %s, already ingested', path.name)
+            self._discard(file_hash)
+            self._finished(path, True)
+            return []
+        if not report.sheets:
+            logger.warning('Skipping %s, no report sheets found', path.name)
+            report.close()
+            self._discard(file_hash)
+            self._finished(path, True)
+            return []
+        return [report]
+
+    def parse(self, report: ReportFile) -> List[ParsedReport]:
+        return [parse_report(report)]
+
+    def write(self, parsed: ParsedReport) -> List[IngestResult]:
+        db = SessionLocal()
+        try:
+            result = write_report(db, parsed, self.known)
+        finally:
+            db.close()
+            self._discard(parsed.file.content_hash)
+        self.results.append(result)
+        self._finished(parsed.file.path, True)
+        return [result]
+
+    def release(self, item: Any):
+        """Error hook: forget a failed report so a later copy of it is tried again"""
+        report = item.file if isinstance(item, ParsedReport) else item
+        if isinstance(report, ReportFile):
+            report.close()
+            self._discard(report.content_hash)
+            self._finished(report.path, False)
+        elif isinstance(item, Path):
+            self._finished(item, False)
+
+    def _finished(self, path: Path, succeeded: bool):
+        if self.on_finished is not None:
+            self.on_finished(path, succeeded)
+
+    def _discard(self, file_hash: str):
+        with self._lock:
+            self._in_flight.discard(file_hash)
+
+
+@dataclass
+class _FetchedEmail:
+    email: Dict
+    files: Set[Path]
+    failed: bool = False
+
+
+class _UidTracker:
+    """
+    Advances the persisted high-water mark only past emails whose reports were all written, or skipped as
+    ingested before. Emails finish out of order with several workers, so the mark stops below the oldest
+    pending one. An email with a failed report stays pending, so it is fetched and tried again after a restart.
+    """
+
+    def __init__(self, state: MailboxSyncState):
+        self.state = state
+        self._listed: Dict[tuple, int] = {}
+        self._pending: Dict[tuple, Set[int]] = {}
+        self._completed: Dict[tuple, Set[int]] = {}
+        self._fetched: Dict[tuple, _FetchedEmail] = {}
+        # Attachments of different emails may share a file name, and so a path
+        self._files: Dict[Path, Set[tuple]] = {}
+        self._lock = threading.Lock()
+
+    def listed(self, email: Dict) -> bool:
+        """Register a listed email, False if it is already on its way"""
+        key = (email['folder'], email['uidvalidity'])
+        with self._lock:
+            if email['uid'] <= self._listed.get(key, 0):
+                return False
+            self._listed[key] = email['uid']
+            self._pending.setdefault(key, set()).add(email['uid'])
+            return True
+
+    def downloaded(self, email: Dict, paths: List[Path]):
+        """Register the report files of a fetched email; it is done once each of them finished"""
+        if not paths:
+            self.done(email)
+            return
+        email_key = (email['folder'], email['uidvalidity'], email['uid'])
+        with self._lock:
+            self._fetched[email_key] = _FetchedEmail(email, set(paths))
+            for path in paths:
+                self._files.setdefault(path, set()).add(email_key)
+
+    def file_finished(self, path: Path, succeeded: bool):
+        finished = []
+        with self._lock:
+            for email_key in self._files.pop(path, ()):
+                fetched = self._fetched[email_key]
+                fetched.files.discard(path)
+                fetched.failed = fetched.failed or not succeeded
+                if not fetched.files:
+                    del self._fetched[email_key]
+                    finished.append(fetched)
+        for fetched in finished:
+            if fetched.failed:
+                logger.error('Email %s keeps the mailbox sync mark below it, its reports are retried after a restart',
+                             fetched.email['uid'])
+            else:
+                self.done(fetched.email)
+
+    def done(self, email: Dict):
+        key = (email['folder'], email['uidvalidity'])
+        with self._lock:
+            pending = self._pending[key]
+            pending.discard(email['uid'])
+            completed = self._completed.setdefault(key, set())
+            completed.add(email['uid'])
+            low = min(pending) if pending else None
+            safe = [uid for uid in completed if low is None or uid < low]
+            if not safe:
+                return
+            self.state.advance(email['folder'], email['uidvalidity'], max(safe))
+            completed.difference_update(safe)
+            self.state.save()
+
+
+class EmailStages:
+    """The email source and the fetch stage, each fetch worker with its own IMAP connection."""
+
+    def __init__(self, settings: Optional[EmailSettings] = None, state: Optional[MailboxSyncState] = None,
+                 concurrency: int = 1):
+        self.settings = settings or get_email_settings()
+        self.state = state or MailboxSyncState(self.settings.email_download_folder / '.mailbox_state.json')
+        self.concurrency = concurrency
+        self._tracker = _UidTracker(self.state)
+        # Idle fetch connections, at most one per fetch worker since each worker holds one while busy
+        self._clients: "queue.SimpleQueue[EmailClient]" = queue.SimpleQueue()
+
+    def stage(self) -> Stage:
+        return Stage("fetch", self.fetch, self.concurrency)
+
+    async def source(self, run_forever: bool = True) -> AsyncIterator[Dict]:
+        """New emails, oldest first; waits on IMAP IDLE between syncs"""
+        client = await asyncio.to_thread(EmailClient.from_settings, self.settings)
+        try:
+            while True:
+                emails = await asyncio.to_thread(client.sync_new_emails, self.state, self.settings.email_folder,
+                                                 self.settings.email_sender, advance=False)
+                for email in emails:
+                    if self._tracker.listed(email):
+                        yield email
+                if not run_forever:
+                    return
+                await asyncio.to_thread(client.wait_for_new_mail, self.settings.email_idle_timeout,
+                                        self.settings.email_poll_interval)
+        finally:
+            await asyncio.to_thread(client.disconnect)
+
+    def fetch(self, email: Dict) -> List[Path]:
+        paths = []
+        if email['has_attachments']:
+            try:
+                client = self._clients.get_nowait()
+            except queue.Empty:
+                client = EmailClient.from_settings(self.settings)
+                client.mail.select(self.settings.email_folder)
+            try:
+                paths = client.download_attachments(email['id'], REPORT_EXTENSIONS, by_uid=True)
+            except Exception:
+                # Drop the connection; the email stays below the high-water mark and is retried after a restart
+                client.disconnect()
+                raise
+            self._clients.put(client)
+        self._tracker.downloaded(email, paths)
+        return paths
+
+    def file_finished(self, path: Path, succeeded: bool):
+        """ReportStages.on_finished hook"""
+        self._tracker.file_finished(path, succeeded)
+
+    def close(self):
+        while not self._clients.empty():
+            self._clients.get_nowait().disconnect()
+
+
+async def run_email_ingest(run_forever: bool = True) -> IngestPipeline:
+    settings = get_ingest_settings()
+    email_stages = EmailStages(concurrency=settings.ingest_fetch_concurrency)
+    report_stages = ReportStages(settings, on_finished=email_stages.file_finished)
+    pipeline = IngestPipeline([email_stages.stage(), *report_stages.stages()], settings.ingest_queue_size)
+    try:
+        await pipeline.run(email_stages.source(run_forever))
+    finally:
+        email_stages.close()
+    return pipeline
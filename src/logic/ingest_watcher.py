@@ -0,0 +1,120 @@
+"""
+Watch-folder ingestion: exports dropped into the data directory are ingested as soon as they are complete.
+
+Completed files are grouped per club in a bounded work queue. A burst of exports for one club becomes a
+single ingest run of just those files, and a club is never ingested by two workers at once.
+"""
+import queue
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from logger import GGLogger
+from logic.ingest import club_id_from_filename, ingest_club, report_sort_key
+from logic.ingest_pipeline import IngestSettings, get_ingest_settings, known_transactions
+from utils.file_watcher import DirectoryWatcher
+from utils.metrics import ingest_pipeline_items_total, ingest_pipeline_stage_duration
+
+logger = GGLogger(__name__)
+
+
+class ClubWorkQueue:
+    """
+    Queue of clubs with new files, each club at most once.
+    Files arriving for a club that is queued or being ingested join its pending batch instead.
+    """
+
+    def __init__(self, maxsize: int):
+        self._clubs: "queue.Queue[Optional[str]]" = queue.Queue(maxsize)
+        self._pending: Dict[str, Set[Path]] = defaultdict(set)
+        self._queued: Set[str] = set()
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def add(self, club_id: str, path: Path):
+        with self._lock:
+            self._pending[club_id].add(path)
+            if club_id in self._queued or club_id in self._running:
+                return
+            self._queued.add(club_id)
+        # Blocks the watcher while too many clubs are waiting, outside the lock so workers can still finish
+        self._clubs.put(club_id)
+
+    def take(self) -> Optional[Tuple[str, List[Path]]]:
+        """Next club and its batch, None once close() was called"""
+        club_id = self._clubs.get()
+        if club_id is None:
+            return None
+        with self._lock:
+            self._queued.discard(club_id)
+            self._running.add(club_id)
+            return club_id, self._pop(club_id)
+
+    def finish(self, club_id: str) -> List[Path]:
+        """Files that arrived for the club while it was being ingested; the club stays claimed if there are any"""
+        with self._lock:
+            paths = self._pop(club_id)
+            if not paths:
+                self._running.discard(club_id)
+            return paths
+
+    def close(self, workers: int):
+        for _ in range(workers):
+            self._clubs.put(None)
+
+    def _pop(self, club_id: str) -> List[Path]:
+        return sorted(self._pending.pop(club_id, ()), key=report_sort_key)
+
+
+class IngestWatcher:
+    def __init__(self, directory: Optional[Path] = None, settings: Optional[IngestSettings] = None,
+                 use_inotify: bool = True):
+        self.settings = settings or get_ingest_settings()
+        self.watcher = DirectoryWatcher(directory or self.settings.ingest_watch_dir,
+                                        settle_seconds=self.settings.ingest_watch_settle_seconds,
+                                        poll_interval=self.settings.ingest_watch_poll_interval,
+                                        use_inotify=use_inotify)
+        self.work = ClubWorkQueue(self.settings.ingest_queue_size)
+        self.known = known_transactions(self.settings)
+        self._workers: List[threading.Thread] = []
+
+    def run(self, include_existing: bool = True):
+        """Block, ingesting completed files, until stop() is called from another thread or a signal handler"""
+        logger.info('Watching %s for exports (%s)', self.watcher.directory, self.watcher.mode)
+        self._workers = [threading.Thread(target=self._worker, name=f"ingest-watch-{i}", daemon=True)
+                         for i in range(self.settings.ingest_watch_workers)]
+        for worker in self._workers:
+            worker.start()
+        try:
+            existing = self.watcher.existing_files()
+            if include_existing:
+                # Already ingested exports only cost a hash
+                self._enqueue(existing)
+            for paths in self.watcher.watch():
+                self._enqueue(paths)
+        finally:
+            self.work.close(len(self._workers))
+            for worker in self._workers:
+                worker.join()
+
+    def stop(self):
+        self.watcher.stop()
+
+    def _enqueue(self, paths: List[Path]):
+        for path in paths:
+            logger.info('New export %s', path.name)
+            self.work.add(club_id_from_filename(path), path)
+
+    def _worker(self):
+        while (item := self.work.take()) is not None:
+            club_id, paths = item
+            while paths:
+                run = ingest_club(club_id, paths, source="watch", known=self.known)
+                duration = sum(run.timings.values())
+                ingest_pipeline_stage_duration.observe(duration, "watch")
+                ingest_pipeline_items_total.inc("watch", "error" if run.error else "processed", amount=len(paths))
+                logger.info('Club %s: %s file(s), %s skipped, %s new / %s updated transactions in %.2fs',
+                            club_id, run.files, run.skipped, run.transactions_created, run.transactions_updated,
+                            duration)
+                paths = self.work.finish(club_id)
@@ -0,0 +1,176 @@
+"""
+Incremental Parquet export of the ledger for offline analytics.
+
+The export directory holds one Parquet file per day, hive-style (`day=2025-06-24/transactions.parquet`), so
+`pyarrow.dataset.dataset(path, partitioning="hive")` or pandas read it as a single table and date filters only
+open the matching files. Files are written uncompressed by default, which lets readers memory-map them
+(`memory_map=True`) instead of decoding into fresh buffers.
+
+Each run exports only the rows whose `updated_at` is past the persisted watermark. The rows of a day are
+merged into its file, replacing earlier versions of the same transactions, so no file ever holds duplicates.
+Every run re-reads a short overlap before the watermark, so rows committed late by a slow writer are picked
+up by the next run. Undated transactions are filed under the day they were created, like the stats rollup.
+Amounts are written in currency units, as the analytics reading the files have always had them.
+"""
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from pydantic_settings import BaseSettings
+from sqlalchemy import Date, Select, cast, func, select
+
+from db import SessionLocal
+from logger import GGLogger
+from models import Transaction
+from utils.money import CENTS
+
+logger = GGLogger(__name__)
+
+KEY_COLUMNS = ["id", "username"]
+MONEY_COLUMNS = ["total_buyin", "total_cashout", "rake", "bad_beat_contribution", "bad_beat_cashout"]
+
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("username", pa.string()),
+    ("transaction_type", pa.dictionary(pa.int8(), pa.string())),
+    ("details", pa.string()),
+    ("total_buyin", pa.float64()),
+    ("total_cashout", pa.float64()),
+    ("rake", pa.float64()),
+    ("bad_beat_contribution", pa.float64()),
+    ("bad_beat_cashout", pa.float64()),
+    ("hands", pa.int64()),
+    ("date", pa.date32()),
+    ("created_by", pa.string()),
+    ("created_at", pa.timestamp("us")),
+    ("updated_at", pa.timestamp("us")),
+])
+
+
+class LedgerExportSettings(BaseSettings):
+    ledger_export_dir: Path = Path("exports/ledger")
+    ledger_export_batch_size: int = 50_000
+    # Re-read before the watermark, covering transactions that committed after rows newer than them
+    ledger_export_overlap_seconds: int = 300
+    # "none" keeps the files memory-mappable, "snappy" or "zstd" trade that for size
+    ledger_export_compression: str = "none"
+
+
+@lru_cache
+def get_ledger_export_settings() -> LedgerExportSettings:
+    load_dotenv()
+    return LedgerExportSettings()
+
+
+class ExportWatermark:
+    """The newest `updated_at` already exported, persisted as JSON next to the partitions"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.updated_at: Optional[datetime] = None
+        if self.path.exists():
+            self.updated_at = datetime.fromisoformat(json.loads(self.path.read_text())["updated_at"])
+
+    def save(self, updated_at: datetime, rows: int):
+        self.updated_at = updated_at
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({"updated_at": updated_at.isoformat(), "rows": rows,
+                                        "exported_at": datetime.now().isoformat()}, indent=2))
+        os.replace(tmp_path, self.path)
+
+
+@dataclass
+class LedgerExportRun:
+    since: Optional[datetime]
+    rows: int = 0
+    partitions: List[date] = field(default_factory=list)
+    watermark: Optional[datetime] = None
+    timings: Dict[str, float] = field(default_factory=lambda: {"read": 0.0, "write": 0.0})
+
+
+def changed_rows_query(since: Optional[datetime]) -> Select:
+    day = func.coalesce(Transaction.date, cast(Transaction.created_at, Date)).label("day")
+    query = select(day, *(Transaction.__table__.c[name] for name in SCHEMA.names))
+    if since is not None:
+        query = query.where(Transaction.updated_at > since)
+    return query.order_by(day)
+
+
+def partition_path(export_dir: Path, day: date) -> Path:
+    return export_dir / f"day={day.isoformat()}" / "transactions.parquet"
+
+
+def _days(query: Select, batch_size: int, run: LedgerExportRun) -> Iterator[Tuple[date, pd.DataFrame]]:
+    """The changed rows one day at a time; rows arrive ordered by day, so only one day is held in memory"""
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        result = db.connection().execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+        current, rows = None, []
+        for batch in result.partitions(batch_size):
+            for row in batch:
+                if row[0] != current and rows:
+                    run.timings["read"] += time.perf_counter() - start
+                    yield current, pd.DataFrame.from_records(rows, columns=["day", *SCHEMA.names])
+                    start, rows = time.perf_counter(), []
+                current = row[0]
+                rows.append(row)
+        run.timings["read"] += time.perf_counter() - start
+        if rows:
+            yield current, pd.DataFrame.from_records(rows, columns=["day", *SCHEMA.names])
+    finally:
+        db.close()
+
+
+def _write_partition(path: Path, changed: pd.DataFrame, compression: str):
+    changed = changed.drop(columns="day")
+    changed["transaction_type"] = changed["transaction_type"].map(lambda value: value.value if value else None)
+    changed[MONEY_COLUMNS] = changed[MONEY_COLUMNS].astype("float64") / CENTS
+    if path.exists():
+        # The changed rows go last, so they replace the exported versions of the same transactions
+        existing = pq.read_table(path, memory_map=True).to_pandas()
+        existing["transaction_type"] = existing["transaction_type"].astype(object)
+        changed = pd.concat([existing, changed]).drop_duplicates(KEY_COLUMNS, keep="last")
+    table = pa.Table.from_pandas(changed.sort_values(KEY_COLUMNS), schema=SCHEMA, preserve_index=False)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp_path, compression=compression)
+    os.replace(tmp_path, path)
+
+
+def export_ledger(settings: Optional[LedgerExportSettings] = None, full: bool = False) -> LedgerExportRun:
+    """Export the transactions changed since the last run, or all of them with `full`"""
+    settings = settings or get_ledger_export_settings()
+    export_dir = Path(settings.ledger_export_dir)
+    watermark = ExportWatermark(export_dir / "_watermark.json")
+    since = None
+    if watermark.updated_at is not None and not full:
+        since = watermark.updated_at - timedelta(seconds=settings.ledger_export_overlap_seconds)
+    run = LedgerExportRun(since=since, watermark=watermark.updated_at)
+
+    for day, changed in _days(changed_rows_query(since), settings.ledger_export_batch_size, run):
+        start = time.perf_counter()
+        _write_partition(partition_path(export_dir, day), changed, settings.ledger_export_compression)
+        run.timings["write"] += time.perf_counter() - start
+        run.rows += len(changed)
+        run.partitions.append(day)
+        newest = changed["updated_at"].max()
+        if pd.notna(newest) and (run.watermark is None or newest > run.watermark):
+            run.watermark = newest.to_pydatetime()
+
+    # Only once every partition is written, so a failed run is simply repeated
+    if run.watermark is not None and run.watermark != watermark.updated_at:
+        watermark.save(run.watermark, run.rows)
+    logger.info('Exported %s changed transactions into %s day partitions, watermark %s',
+                run.rows, len(run.partitions), run.watermark)
+    return run
@@ -0,0 +1,189 @@
+"""
+Rakeback settlement for a period.
+
+The rake of the period is loaded per player from the daily rollup in one query, and the agent tree as arrays:
+every player is an index and `parents[i]` is the index of its agent, -1 at the top. Depths come from
+pointer jumping and subtree rake is summed level by level from the deepest players up, one scatter-add per
+level, so a run is a few array operations per hierarchy level instead of a query per player.
+
+FLAT pays a percentage of the player's own rake, ALL_DOWNLINES of the rake of the player and everyone below it.
+The RAKEBACK transactions are written in one batch together with their balance changes. Their ids are derived
+from the period, so settling a period again only pays whoever was not paid yet.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from crud.rakeback_settings import get_rakeback_settings
+from crud.transactions import bulk_overwrite_transactions
+from enums import RakebackType, TransactionType
+from logger import GGLogger
+from models import Player, PlayerDailyStats
+from schemas.transactions import TransactionCreate
+from utils.money import from_cents, round_cents
+
+logger = GGLogger(__name__)
+
+
+def last_week(today: date) -> Tuple[date, date]:
+    """Monday to Sunday of the last complete week"""
+    monday = today - timedelta(days=today.weekday())
+    return monday - timedelta(days=7), monday - timedelta(days=1)
+
+
+def rakeback_transaction_id(from_date: date, to_date: date) -> str:
+    return f"rakeback-{from_date:%Y%m%d}-{to_date:%Y%m%d}"
+
+
+class AgentTree:
+    """The player hierarchy as parent pointers, with every player's depth below the top of its tree"""
+
+    def __init__(self, ids: Sequence[str], usernames: Sequence[str], agent_ids: Sequence[str]):
+        self.usernames = np.array(usernames, dtype=str)
+        self._username_order = np.argsort(self.usernames)
+        ids = np.array(ids, dtype=str)
+        id_order = np.argsort(ids)
+        self.parents = _lookup(ids, id_order, np.array([agent_id or "" for agent_id in agent_ids], dtype=str))
+        self.depths = self._depths()
+        self._deepest_first = np.argsort(-self.depths, kind="stable")
+        self._level_sizes = np.bincount(self.depths)
+
+    @classmethod
+    def load(cls, db: Session) -> "AgentTree":
+        rows = db.execute(select(Player.id, Player.username, Player.agent_id)).all()
+        return cls([row.id for row in rows], [row.username for row in rows], [row.agent_id for row in rows])
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def index_of(self, usernames: Iterable[str]) -> np.ndarray:
+        """Index of each username, -1 for unknown ones"""
+        return _lookup(self.usernames, self._username_order, np.array(list(usernames), dtype=str))
+
+    def subtree_sums(self, values: np.ndarray) -> np.ndarray:
+        """Each player's value plus the values of everyone below it"""
+        totals = values.copy()
+        # Deepest level first, each level is a slice of the players ordered by depth
+        ends = np.cumsum(self._level_sizes[::-1])
+        for start, end in zip(np.concatenate(([0], ends[:-1])), ends):
+            level = self._deepest_first[start:end]
+            level = level[self.parents[level] >= 0]
+            np.add.at(totals, self.parents[level], totals[level])
+        return totals
+
+    def _depths(self) -> np.ndarray:
+        """Distance to the top of the tree by pointer jumping: log2(depth) rounds however deep the tree is"""
+        depths = (self.parents >= 0).astype(np.int64)
+        jumps = self.parents.copy()
+        # Jumps double every round, still jumping after covering more than n players means a cycle
+        for _ in range(int(np.log2(max(len(self), 1))) + 2):
+            jumping = np.flatnonzero(jumps >= 0)
+            if not len(jumping):
+                return depths
+            targets = jumps[jumping]
+            depths[jumping] += depths[targets]
+            jumps[jumping] = jumps[targets]
+        cycle = sorted(self.usernames[jumps >= 0])
+        raise ValueError(f"The agent hierarchy has a cycle through {', '.join(cycle[:10])}")
+
+
+def _lookup(keys: np.ndarray, order: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Positions of `values` in `keys` (sorted by `order`), -1 where missing"""
+    if not len(keys):
+        return np.full(len(values), -1, dtype=np.int64)
+    sorted_keys = keys[order]
+    positions = np.minimum(np.searchsorted(sorted_keys, values), len(keys) - 1)
+    return np.where(sorted_keys[positions] == values, order[positions], -1).astype(np.int64)
+
+
+@dataclass
+class RakebackLine:
+    username: str
+    rakeback_type: RakebackType
+    percentage: float
+    # The rake the percentage applies to: own rake for FLAT, subtree rake for ALL_DOWNLINES
+    rake: int
+    amount: int
+
+
+@dataclass
+class RakebackRun:
+    from_date: date
+    to_date: date
+    lines: List[RakebackLine] = field(default_factory=list)
+    created: int = 0
+    timings: Dict[str, float] = field(default_factory=lambda: {"load": 0.0, "calculate": 0.0, "write": 0.0})
+
+    @property
+    def total(self) -> int:
+        return sum(line.amount for line in self.lines)
+
+
+def calculate_rakeback(db: Session, from_date: date, to_date: date, run: RakebackRun = None) -> List[RakebackLine]:
+    run = run or RakebackRun(from_date, to_date)
+    start = time.perf_counter()
+    tree = AgentTree.load(db)
+    rake_rows = db.execute(
+        select(PlayerDailyStats.username, func.sum(PlayerDailyStats.rake))
+        .where(PlayerDailyStats.date.between(from_date, to_date))
+        .group_by(PlayerDailyStats.username)
+    ).all()
+    settings = get_rakeback_settings(db)
+    run.timings["load"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    rake = np.zeros(len(tree), dtype=np.int64)
+    rake_index = tree.index_of(username for username, _ in rake_rows)
+    known = rake_index >= 0
+    np.add.at(rake, rake_index[known], np.array([amount or 0 for _, amount in rake_rows], dtype=np.int64)[known])
+    if not known.all():
+        logger.warning('Rake of %s unknown players left out of rakeback', int((~known).sum()))
+    subtree_rake = tree.subtree_sums(rake)
+
+    settings_index = tree.index_of(setting.username for setting in settings)
+    for setting in (setting for setting, index in zip(settings, settings_index) if index < 0):
+        logger.warning('Rakeback setting for unknown player %s ignored', setting.username)
+    settings = [setting for setting, index in zip(settings, settings_index) if index >= 0]
+    settings_index = settings_index[settings_index >= 0]
+    percentages = np.array([setting.percentage for setting in settings], dtype=np.float64)
+    all_downlines = np.array([setting.rakeback_type == RakebackType.ALL_DOWNLINES for setting in settings], dtype=bool)
+    base = np.where(all_downlines, subtree_rake[settings_index], rake[settings_index])
+    amounts = round_cents(base * percentages)
+
+    lines = [
+        RakebackLine(username=setting.username, rakeback_type=setting.rakeback_type, percentage=setting.percentage,
+                     rake=int(rake_base), amount=int(amount))
+        for setting, rake_base, amount in zip(settings, base, amounts) if amount > 0
+    ]
+    run.timings["calculate"] += time.perf_counter() - start
+    return lines
+
+
+def settle_rakeback(db: Session, from_date: date, to_date: date, created_by: str = "rakeback",
+                    dry_run: bool = False) -> RakebackRun:
+    """Calculate the rakeback of a period and, unless `dry_run`, pay it out as RAKEBACK transactions"""
+    run = RakebackRun(from_date, to_date)
+    run.lines = calculate_rakeback(db, from_date, to_date, run)
+    if dry_run or not run.lines:
+        return run
+
+    start = time.perf_counter()
+    transaction_id = rakeback_transaction_id(from_date, to_date)
+    transactions = [
+        TransactionCreate(id=transaction_id, username=line.username, transaction_type=TransactionType.RAKEBACK,
+                          details=f"{line.rakeback_type.value} rakeback {line.percentage:.2%} of "
+                                  f"{from_cents(line.rake):.2f} rake from {from_date} to {to_date}",
+                          total_buyin=0, total_cashout=line.amount, date=to_date, created_by=created_by)
+        for line in run.lines
+    ]
+    # Rakeback already paid for the period is left as it is
+    run.created, _ = bulk_overwrite_transactions(db, transactions)
+    run.timings["write"] += time.perf_counter() - start
+    logger.info('Settled rakeback from %s to %s: %s of %s transactions written, %.2f in total',
+                from_date, to_date, run.created, len(transactions), from_cents(run.total))
+    return run
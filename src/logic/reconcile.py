@@ -0,0 +1,131 @@
+"""
+Balance reconciliation: every player's stored balance against the sum of its ledger.
+
+The ledger is streamed through a server-side cursor in fixed-size batches, and each batch is summed per player
+with a pandas groupby before it is added to the running totals. Memory stays bounded by the batch size and the
+number of players rather than the number of transactions. The ledger and the balances are read in one REPEATABLE READ snapshot, so writes that
+land during the audit are never reported as drift.
+
+ADJUSTMENT transactions are the corrections themselves: a balance is expected to equal the sum of its other
+transactions, and each adjustment moves the stored balance by the difference found.
+"""
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, UTC
+from typing import Dict, List
+
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from crud.transactions import bulk_overwrite_transactions
+from enums import TransactionType
+from logger import GGLogger
+from models import Player, Transaction
+from schemas.transactions import TransactionCreate
+from utils.money import from_cents
+
+logger = GGLogger(__name__)
+
+
+@dataclass
+class BalanceMismatch:
+    username: str
+    stored: int
+    expected: int
+
+    @property
+    def difference(self) -> int:
+        return self.expected - self.stored
+
+
+@dataclass
+class Reconciliation:
+    transactions: int = 0
+    players: int = 0
+    mismatches: List[BalanceMismatch] = field(default_factory=list)
+    # Ledger totals of usernames without a player, which have no balance to compare against
+    orphans: Dict[str, int] = field(default_factory=dict)
+    corrected: int = 0
+    timings: Dict[str, float] = field(default_factory=lambda: {"ledger": 0.0, "balances": 0.0, "fix": 0.0})
+
+    @property
+    def drift(self) -> int:
+        return sum(mismatch.difference for mismatch in self.mismatches)
+
+
+def ledger_totals(db: Session, batch_size: int = 50_000, report: Reconciliation = None) -> Dict[str, int]:
+    """Sum of cashout minus buy-in in cents per username, over everything but the adjustments"""
+    report = report or Reconciliation()
+    query = (
+        select(Transaction.username,
+               func.coalesce(Transaction.total_cashout, 0) - func.coalesce(Transaction.total_buyin, 0))
+        .where(Transaction.transaction_type.is_distinct_from(TransactionType.ADJUSTMENT))
+    )
+    totals: Dict[str, int] = defaultdict(int)
+    # Core rows over the session's connection, building ORM rows costs more than the sums themselves
+    result = db.connection().execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+    for rows in result.partitions(batch_size):
+        batch = pd.DataFrame.from_records(rows, columns=["username", "profit"])
+        for username, profit in batch.groupby("username", sort=False)["profit"].sum().items():
+            totals[username] += int(profit)
+        report.transactions += len(batch)
+    return dict(totals)
+
+
+def reconcile_balances(db: Session, batch_size: int = 50_000, tolerance: int = 1) -> Reconciliation:
+    """
+    Compare the stored balances with the ledger without writing anything, reporting differences of at least
+    `tolerance` cents.
+    Must be called on a session that has not started a transaction yet, as it opens the snapshot.
+    """
+    report = Reconciliation()
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    try:
+        start = time.perf_counter()
+        expected = ledger_totals(db, batch_size, report)
+        report.timings["ledger"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for username, balance in db.execute(select(Player.username, Player.balance)):
+            report.players += 1
+            stored = balance or 0
+            ledger = expected.pop(username, 0)
+            if abs(ledger - stored) >= tolerance:
+                report.mismatches.append(BalanceMismatch(username=username, stored=stored, expected=ledger))
+        report.orphans = {username: total for username, total in expected.items() if total}
+        report.timings["balances"] = time.perf_counter() - start
+    finally:
+        # End the snapshot, corrections are written in a transaction of their own
+        db.rollback()
+
+    report.mismatches.sort(key=lambda mismatch: -abs(mismatch.difference))
+    logger.info('Reconciled %s players over %s transactions: %s mismatched, %.2f drift, %s orphaned usernames',
+                report.players, report.transactions, len(report.mismatches), from_cents(report.drift),
+                len(report.orphans))
+    return report
+
+
+def correct_balances(db: Session, report: Reconciliation, created_by: str = "reconciliation") -> int:
+    """
+    Write one ADJUSTMENT transaction per mismatch, moving each balance by its difference in a single commit.
+    The differences are relative, so writes that landed since the audit are kept.
+    """
+    if not report.mismatches:
+        return 0
+    start = time.perf_counter()
+    now = datetime.now(UTC)
+    transaction_id = f"reconciliation-{now:%Y%m%d%H%M%S}"
+    adjustments = [
+        TransactionCreate(id=transaction_id, username=mismatch.username, transaction_type=TransactionType.ADJUSTMENT,
+                          details=f"Balance {from_cents(mismatch.stored):.2f} reconciled to ledger "
+                                  f"{from_cents(mismatch.expected):.2f}",
+                          total_buyin=max(-mismatch.difference, 0), total_cashout=max(mismatch.difference, 0),
+                          date=now.date(), created_by=created_by)
+        for mismatch in report.mismatches
+    ]
+    report.corrected, _ = bulk_overwrite_transactions(db, adjustments)
+    report.timings["fix"] = time.perf_counter() - start
+    logger.info('Corrected %s balances by %.2f in total', report.corrected, from_cents(report.drift))
+    return report.corrected
@@ -0,0 +1,97 @@
+"""
+Streaming transaction exports.
+
+Rows come from a server-side cursor in batches and each batch is written out as soon as it is fetched, so
+exporting a full season costs one batch of memory. The generators own their session: a streamed response
+outlives the request's `get_db` session.
+"""
+import csv
+import datetime as dt
+import io
+from typing import Iterator, Optional, Sequence, Union
+
+from pydantic_core import to_json
+from sqlalchemy import Select, select
+from sqlalchemy.engine import Row
+
+from db import SessionLocal
+from logger import GGLogger
+from models import Transaction
+from utils.money import from_cents
+
+logger = GGLogger(__name__)
+
+EXPORT_FIELDS = ('id', 'username', 'transaction_type', 'details', 'total_buyin', 'total_cashout', 'rake',
+                 'bad_beat_contribution', 'bad_beat_cashout', 'hands', 'date', 'created_by', 'created_at',
+                 'updated_at')
+
+MEDIA_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def export_query(usernames: Union[Select, Sequence[str]], from_date: Optional[dt.date] = None,
+                 to_date: Optional[dt.date] = None) -> Select:
+    """Transactions of the given usernames, or of those selected by a subquery, oldest first"""
+    query = (select(*(getattr(Transaction, field) for field in EXPORT_FIELDS))
+             .where(Transaction.username.in_(usernames)))
+    if from_date:
+        query = query.where(Transaction.date >= from_date)
+    if to_date:
+        query = query.where(Transaction.date <= to_date)
+    return query.order_by(Transaction.date.asc().nulls_first(), Transaction.username, Transaction.id)
+
+
+def stream_rows(query: Select, batch_size: int = 2000) -> Iterator[Sequence[Row]]:
+    db = SessionLocal()
+    rows = 0
+    try:
+        result = db.connection().execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+        for batch in result.partitions(batch_size):
+            rows += len(batch)
+            yield batch
+    finally:
+        db.close()
+        logger.info('Exported %s transactions', rows)
+
+
+def _isoformat(value) -> str:
+    return value.isoformat()
+
+
+# Only these columns need converting, the rest are written as they come from the driver
+_CONVERTERS = tuple((EXPORT_FIELDS.index(field), converter) for field, converter in (
+    ('transaction_type', lambda value: value.value),
+    # Exports are read by people and spreadsheets, amounts go out in currency units like the API's
+    *((field, from_cents) for field in ('total_buyin', 'total_cashout', 'rake', 'bad_beat_contribution',
+                                        'bad_beat_cashout')),
+    ('date', _isoformat),
+    ('created_at', _isoformat),
+    ('updated_at', _isoformat),
+))
+
+
+def _plain(row: Row) -> list:
+    values = list(row)
+    for index, converter in _CONVERTERS:
+        if values[index] is not None:
+            values[index] = converter(values[index])
+    return values
+
+
+def csv_chunks(query: Select, batch_size: int = 2000) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for batch in stream_rows(query, batch_size):
+        writer.writerows(map(_plain, batch))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header alone when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(query: Select, batch_size: int = 2000) -> Iterator[bytes]:
+    for batch in stream_rows(query, batch_size):
+        # pydantic's serializer is several times faster than json.dumps
+        yield b"".join(to_json(dict(zip(EXPORT_FIELDS, _plain(row)))) + b"\n" for row in batch)
@@ -1,41 +1,54 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import Headers
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from consts import PUBLIC_PATHS
 from gg_exceptions.auth import TokenExpired, AuthNotProvided, AuthenticationError, AuthorizationError
 from utils.auth_utils import verify_token
 
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.method == "OPTIONS":
-            return await call_next(request)
+class AuthMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        if request.url.path in PUBLIC_PATHS:
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"] in PUBLIC_PATHS:
+            await self.app(scope, receive, send)
+            return
 
         try:
-            auth_header = request.headers.get("Authorization")
+            auth_header = Headers(scope=scope).get("Authorization")
             verify_token(auth_header)
-            return await call_next(request)
         except TokenExpired:
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=401,
                 content={"detail": "Token has expired"},
             )
         except AuthNotProvided:
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=401,
                 content={"detail": "Token not provided"}
             )
         except AuthenticationError:
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=401,
                 content={"detail": "Malformed token"},
             )
         except AuthorizationError:
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=403,
                 content={"detail": "Not authorized to access this resource"},
-            )
\ No newline at end of file
+            )
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        await response(scope, receive, send)
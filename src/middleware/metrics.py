@@ -0,0 +1,43 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.metrics import (http_requests_total, http_request_duration, db_queries_per_request, db_time_per_request,
+                           request_db_stats, RequestDBStats)
+
+
+class MetricsMiddleware:
+    """Records per-route request counts, latency and database usage. Meant to be the outermost layer."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = RequestDBStats()
+        token = request_db_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_db_stats.reset(token)
+            # The route template keeps label cardinality bounded, unmatched paths are folded together
+            route = scope.get("route")
+            route_path = getattr(route, "path", "<unmatched>")
+            method = scope["method"]
+            http_requests_total.inc(method, route_path, str(status_code))
+            http_request_duration.observe(elapsed, method, route_path)
+            db_queries_per_request.observe(stats.queries, route_path)
+            db_time_per_request.observe(stats.seconds, route_path)
@@ -2,19 +2,21 @@ import time
 
 from fastapi_cache import FastAPICache
 from jose import jwt
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from consts import PUBLIC_PATHS
 from logger import GGLogger
-from utils.auth_utils import auth_settings
+from utils.auth_utils import get_auth_settings
+from utils.metrics import rate_limit_rejections_total
 
 
 logger = GGLogger(__name__)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, auth_requests_per_minute: int = 60, public_requests_per_minute: int = 30):
-        super().__init__(app)
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, auth_requests_per_minute: int = 60, public_requests_per_minute: int = 30):
+        self.app = app
         self.auth_requests_per_minute = auth_requests_per_minute
         self.public_requests_per_minute = public_requests_per_minute
 
@@ -33,73 +35,95 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
         return is_allowed, requests_data, current_time
 
-    async def dispatch(self, request, call_next):
-        current_time = int(time.time())
-        client_ip = request.client.host
-        is_public_path = request.url.path in PUBLIC_PATHS
+    async def _check_request(self, scope: Scope, is_public_path: bool) -> tuple[JSONResponse | None, list]:
+        """Run the rate limit check, returning the 429 response to send (if any) and the window's requests."""
         requests_data = []
 
+        if is_public_path:
+            # IP-based rate limiting for public paths
+            client_ip = scope["client"][0]
+            rate_limit_key = f"rate_limit:ip:{client_ip}"
+            is_allowed, requests_data, _ = await self._check_rate_limit(
+                rate_limit_key,
+                self.public_requests_per_minute
+            )
+
+            if not is_allowed:
+                rate_limit_rejections_total.inc("ip")
+                return JSONResponse(
+                    status_code=429,
+                    content={
+                        "detail": "Too many requests. Please try again later.",
+                        "requests_remaining": 0,
+                        "reset_at": min(requests_data) + 60
+                    }
+                ), requests_data
+            return None, requests_data
+
+        # Username-based rate limiting for authenticated paths
+        token = Headers(scope=scope).get("Authorization")
+        if not token:
+            return None, requests_data
+        token = token.split(" ")[1] if token.startswith("Bearer ") else token
         try:
-            if is_public_path:
-                # IP-based rate limiting for public paths
-                rate_limit_key = f"rate_limit:ip:{client_ip}"
+            auth_settings = get_auth_settings()
+            payload = jwt.decode(
+                token,
+                auth_settings.auth_secret_key,
+                algorithms=[auth_settings.auth_algorithm]
+            )
+            username = payload.get("username")
+            if username:
+                rate_limit_key = f"rate_limit:user:{username}"
                 is_allowed, requests_data, _ = await self._check_rate_limit(
                     rate_limit_key,
-                    self.public_requests_per_minute
+                    self.auth_requests_per_minute
                 )
 
                 if not is_allowed:
+                    rate_limit_rejections_total.inc("user")
                     return JSONResponse(
                         status_code=429,
                         content={
-                            "detail": "Too many requests. Please try again later.",
+                            "detail": "Rate limit exceeded. Please try again in a minute.",
                             "requests_remaining": 0,
                             "reset_at": min(requests_data) + 60
                         }
-                    )
-            else:
-                # Username-based rate limiting for authenticated paths
-                token = request.headers.get("Authorization")
-                if token:
-                    token = token.split(" ")[1] if token.startswith("Bearer ") else token
-                    try:
-                        payload = jwt.decode(
-                            token,
-                            auth_settings.auth_secret_key,
-                            algorithms=[auth_settings.auth_algorithm]
-                        )
-                        username = payload.get("username")
-                        if username:
-                            rate_limit_key = f"rate_limit:user:{username}"
-                            is_allowed, requests_data, _ = await self._check_rate_limit(
-                                rate_limit_key,
-                                self.auth_requests_per_minute
-                            )
-
-                            if not is_allowed:
-                                return JSONResponse(
-                                    status_code=429,
-                                    content={
-                                        "detail": "Rate limit exceeded. Please try again in a minute.",
-                                        "requests_remaining": 0,
-                                        "reset_at": min(requests_data) + 60
-                                    }
-                                )
-                    except Exception as e:
-                        logger.error(f"Rate limiting error: {e}")
-                        # Continue processing the request if there's an error with rate limiting
-
-            # Process the request
-            response = await call_next(request)
-
-            # Add rate limit headers
-            limit = self.public_requests_per_minute if is_public_path else self.auth_requests_per_minute
-            response.headers["X-RateLimit-Limit"] = str(limit)
-            response.headers["X-RateLimit-Remaining"] = str(limit - len(requests_data))
-            response.headers["X-RateLimit-Reset"] = str(current_time + 60)
-
-            return response
+                    ), requests_data
+        except Exception as e:
+            logger.error("Rate limiting error: %s", e)
+            # Continue processing the request if there's an error with rate limiting
+        return None, requests_data
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
+        current_time = int(time.time())
+        is_public_path = scope["path"] in PUBLIC_PATHS
+
+        try:
+            rejection, requests_data = await self._check_request(scope, is_public_path)
         except Exception as e:
-            logger.error(f"Unexpected error in rate limiting middleware: {e}")
-            return await call_next(request)
\ No newline at end of file
+            logger.error("Unexpected error in rate limiting middleware: %s", e)
+            await self.app(scope, receive, send)
+            return
+
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+
+        limit = self.public_requests_per_minute if is_public_path else self.auth_requests_per_minute
+        remaining = limit - len(requests_data)
+
+        async def send_with_rate_limit_headers(message: Message):
+            if message["type"] == "http.response.start":
+                # Add rate limit headers
+                headers = MutableHeaders(scope=message)
+                headers["X-RateLimit-Limit"] = str(limit)
+                headers["X-RateLimit-Remaining"] = str(remaining)
+                headers["X-RateLimit-Reset"] = str(current_time + 60)
+            await send(message)
+
+        await self.app(scope, receive, send_with_rate_limit_headers)
@@ -1,57 +1,106 @@
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers
 from starlette.responses import JSONResponse
-from fastapi import Request
-import logging
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from gg_exceptions.requests import RequestBodyTooLarge
+from logger import GGLogger
 
-logger = logging.getLogger(__name__)
+logger = GGLogger(__name__)
 
-class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
+BODY_METHODS = {"POST", "PUT", "PATCH"}
+
+
+class RequestSizeLimitMiddleware:
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         max_content_length: int = 1024 * 1024,  # 1MB default
         max_headers_length: int = 1024 * 8,          # 8KB default
     ):
-        super().__init__(app)
+        self.app = app
         self.max_content_length = max_content_length
         self.max_headers_length = max_headers_length
 
-    async def dispatch(self, request: Request, call_next):
-        # Check headers size
-        headers_length = len(str(request.headers))
+    def _too_large_response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=413,  # Payload Too Large
+            content={
+                "detail": "Request body too large",
+                "max_size": self.max_content_length
+            }
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Check headers size on the raw header pairs
+        headers_length = sum(len(name) + len(value) for name, value in scope["headers"])
         if headers_length > self.max_headers_length:
-            logger.warning(f"Request headers too large: {headers_length} bytes")
-            return JSONResponse(
+            logger.warning("Request headers too large: %s bytes", headers_length)
+            response = JSONResponse(
                 status_code=431,  # Request Header Fields Too Large
                 content={
                     "detail": "Request header too large",
                     "max_size": self.max_headers_length
                 }
             )
+            await response(scope, receive, send)
+            return
+
+        body_too_large = False
+        response_started = False
 
-        # Check Content-Length header for POST/PUT/PATCH requests
-        if request.method in ["POST", "PUT", "PATCH"]:
-            content_length = request.headers.get("content-length")
+        if scope["method"] in BODY_METHODS:
+            # Reject early when the client announces an oversized body
+            content_length = Headers(scope=scope).get("content-length")
             if content_length:
                 content_length = int(content_length)
                 if content_length > self.max_content_length:
-                    logger.warning(f"Request content too large: {content_length} bytes")
-                    return JSONResponse(
-                        status_code=413,  # Payload Too Large
-                        content={
-                            "detail": "Request body too large",
-                            "max_size": self.max_content_length
-                        }
-                    )
+                    logger.warning("Request content too large: %s bytes", content_length)
+                    await self._too_large_response()(scope, receive, send)
+                    return
 
-        try:
-            # If we get here, the size checks passed
-            response = await call_next(request)
-            return response
+            # Enforce the limit on the bytes actually streamed, content-length may be missing or wrong
+            received = 0
+            upstream_receive = receive
+
+            async def receive() -> Message:
+                nonlocal received, body_too_large
+                message = await upstream_receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                    if received > self.max_content_length:
+                        body_too_large = True
+                        raise RequestBodyTooLarge
+                return message
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if body_too_large and not response_started:
+                # Drop whatever error response the app built for the aborted body read
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
 
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except RequestBodyTooLarge:
+            if response_started:
+                raise
         except Exception as e:
-            logger.error(f"Error processing request: {str(e)}")
-            return JSONResponse(
-                status_code=500,
-                content={"detail": "Internal server error"}
-            )
\ No newline at end of file
+            logger.error("Error processing request: %s", e)
+            if response_started:
+                raise
+            if not body_too_large:
+                response = JSONResponse(
+                    status_code=500,
+                    content={"detail": "Internal server error"}
+                )
+                await response(scope, receive, send)
+                return
+
+        if body_too_large and not response_started:
+            logger.warning("Request content too large: more than %s bytes streamed", self.max_content_length)
+            await self._too_large_response()(scope, receive, send)
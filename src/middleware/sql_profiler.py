@@ -0,0 +1,34 @@
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.sql_profiler import current_profile, start_profile, report_profile
+
+
+class SQLProfilerMiddleware:
+    """
+    Profiles the SQL of every request: a summary goes out in the X-SQL-Profile response header
+    and the full report is written as JSON to SQL_PROFILE_DIR. Only installed when SQL_PROFILE is set.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = start_profile(f"{scope['method']} {scope['path']}")
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                # Queries run while streaming the body are in the JSON report only
+                MutableHeaders(scope=message)["X-SQL-Profile"] = profile.summary_header()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            report_profile(profile)
@@ -0,0 +1,157 @@
+"""
+Explicit schema management, run by scripts/bootstrap_db.py rather than on app import.
+
+A fresh database gets the current schema from the models and every migration is stamped as applied.
+An existing database gets the pending migrations, in order, followed by create_all for any new tables.
+Migrations are (name, step) pairs and must never be renamed or reordered once released.
+"""
+from datetime import datetime, UTC
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+import models  # registers every table on Base.metadata
+from crud.player_stats import rebuild_stats_rows
+from crud.transaction_partitions import create_partitions, create_upcoming_partitions
+from consts import RING_GAMES_BY_DAY_MIGRATION
+from db import Base, DB_SCHEMA
+from logger import GGLogger
+
+logger = GGLogger(__name__)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(schema=DB_SCHEMA),
+    Column("name", String, primary_key=True),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+MONEY_COLUMNS = {
+    "transactions": ("total_buyin", "total_cashout", "rake", "bad_beat_contribution", "bad_beat_cashout"),
+    "players": ("balance",),
+    "player_daily_stats": ("rake", "total_buyin", "total_cashout", "bad_beat_contribution", "bad_beat_cashout"),
+}
+RAKEBACK_SUMMARY_MONEY_COLUMNS = ("balance", "rake_since_last_rakeback", "total_rakeback_received",
+                                  "total_lifetime_rake")
+
+
+def _money_as_floats(conn: Connection, table: str):
+    # Tables created from the models by migrations before 0005_money_in_cents start out with the amounts it converts
+    conn.execute(text(f"ALTER TABLE {DB_SCHEMA}.{table} " + ", ".join(
+        f"ALTER COLUMN {column} TYPE DOUBLE PRECISION" for column in MONEY_COLUMNS[table])))
+
+
+def _player_daily_stats(conn: Connection):
+    # The rollup starts out filled from the existing transactions
+    models.PlayerDailyStats.__table__.create(conn, checkfirst=True)
+    _money_as_floats(conn, "player_daily_stats")
+    rebuild_stats_rows(conn)
+
+
+def _adjustment_transaction_type(conn: Connection):
+    # Enum types live in the default schema; the new label can only be used once this transaction commits
+    conn.execute(text("ALTER TYPE transactiontype ADD VALUE IF NOT EXISTS 'ADJUSTMENT'"))
+
+
+def _transactions_updated_at_index(conn: Connection):
+    # The ledger export reads the rows changed since its watermark
+    index = next(index for index in models.Transaction.__table__.indexes if index.columns.keys() == ["updated_at"])
+    index.create(conn, checkfirst=True)
+
+
+def _partition_transactions(conn: Connection):
+    """Recreate `transactions` range partitioned by month and copy the ledger over"""
+    old = "transactions_unpartitioned"
+    conn.execute(text(f"ALTER TABLE {DB_SCHEMA}.transactions RENAME TO {old}"))
+    # Index and constraint names are per schema, the partitioned table needs them back
+    indexes = conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = :schema AND tablename = :table"),
+                           {"schema": DB_SCHEMA, "table": old}).scalars().all()
+    conn.execute(text(f"ALTER TABLE {DB_SCHEMA}.{old} DROP CONSTRAINT IF EXISTS transactions_pkey"))
+    for index in indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {DB_SCHEMA}.{index}"))
+    # The partition key is part of the primary key, undated rows take the day they were written
+    conn.execute(text(f"UPDATE {DB_SCHEMA}.{old} SET date = COALESCE(CAST(created_at AS DATE), CURRENT_DATE) "
+                      f"WHERE date IS NULL"))
+
+    # checkfirst also keeps the existing enum type
+    models.Transaction.__table__.create(conn, checkfirst=True)
+    _money_as_floats(conn, "transactions")
+    months = conn.execute(text(f"SELECT DISTINCT CAST(date_trunc('month', date) AS DATE) FROM {DB_SCHEMA}.{old}"))
+    create_partitions(conn, months.scalars().all())
+    columns = ", ".join(column.name for column in models.Transaction.__table__.columns)
+    conn.execute(text(f"INSERT INTO {DB_SCHEMA}.transactions ({columns}) SELECT {columns} FROM {DB_SCHEMA}.{old}"))
+    conn.execute(text(f"DROP TABLE {DB_SCHEMA}.{old}"))
+
+
+def _columns_in_cents(conn: Connection, table: str, columns: Tuple[str, ...]):
+    # The table is rewritten once, whatever the number of its columns; on `transactions` this covers every partition
+    conn.execute(text(f"ALTER TABLE {DB_SCHEMA}.{table} " + ", ".join(
+        f"ALTER COLUMN {column} TYPE BIGINT USING round(CAST({column} AS NUMERIC) * 100)" for column in columns
+    )))
+
+
+def _money_in_cents(conn: Connection):
+    for table, columns in MONEY_COLUMNS.items():
+        _columns_in_cents(conn, table, columns)
+
+
+def _rakeback_summary_in_cents(conn: Connection):
+    # The model is not registered in models/__init__.py, so the table only exists where it was made by hand
+    table_type = conn.execute(text("SELECT table_type FROM information_schema.tables "
+                                   "WHERE table_schema = :schema AND table_name = 'player_rakeback_summary'"),
+                              {"schema": DB_SCHEMA}).scalar()
+    if table_type == "BASE TABLE":
+        _columns_in_cents(conn, "player_rakeback_summary", RAKEBACK_SUMMARY_MONEY_COLUMNS)
+    elif table_type is not None:
+        logger.warning("player_rakeback_summary is a view, not converted; it should now return amounts in cents")
+
+
+def _ring_games_by_day(conn: Connection):
+    # Nothing to change: the time it was stamped tells the ring game rows stored as one per table from those
+    # stored as one per day, which the old rows cannot be split into
+    pass
+
+
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("0001_player_daily_stats", _player_daily_stats),
+    ("0002_adjustment_transaction_type", _adjustment_transaction_type),
+    ("0003_transactions_updated_at_index", _transactions_updated_at_index),
+    ("0004_partition_transactions", _partition_transactions),
+    ("0005_money_in_cents", _money_in_cents),
+    ("0006_rakeback_summary_in_cents", _rakeback_summary_in_cents),
+    (RING_GAMES_BY_DAY_MIGRATION, _ring_games_by_day),
+]
+
+
+def _stamp(conn: Connection, name: str):
+    conn.execute(schema_migrations.insert().values(name=name, applied_at=datetime.now(UTC)))
+
+
+def bootstrap(engine: Engine) -> List[str]:
+    """Bring the database schema up to date, returning the names of the migrations that were run."""
+    applied_now = []
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {DB_SCHEMA}"))
+        fresh = not inspect(conn).has_table("players", schema=DB_SCHEMA)
+        schema_migrations.create(conn, checkfirst=True)
+        applied = set(conn.execute(select(schema_migrations.c.name)).scalars())
+
+        if fresh:
+            logger.info("Creating schema %s from the models", DB_SCHEMA)
+            Base.metadata.create_all(conn)
+            for name, _ in MIGRATIONS:
+                _stamp(conn, name)
+        else:
+            for name, step in MIGRATIONS:
+                if name in applied:
+                    continue
+                logger.info("Applying migration %s", name)
+                step(conn)
+                _stamp(conn, name)
+                applied_now.append(name)
+            Base.metadata.create_all(conn)
+    # In a transaction of its own, once the schema is committed
+    create_upcoming_partitions(engine)
+    return applied_now
@@ -1,3 +1,6 @@
 from models.client_users import ClientUser
 from models.players import Player
 from models.transactions import Transaction
+from models.ingested_files import IngestedFile
+from models.player_daily_stats import PlayerDailyStats
+from models.rakeback_settings import RakebackSetting
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, DateTime, Integer
+from sqlalchemy.sql import func
+from db import Base
+
+
+class IngestedFile(Base):
+    """A report file that was fully written, keyed by the SHA-256 of its content."""
+    __tablename__ = "ingested_files"
+
+    content_hash = Column(String, primary_key=True)
+    club_id = Column(String, index=True)
+    filename = Column(String)
+    source = Column(String)
+    players = Column(Integer, default=0)
+    transactions = Column(Integer, default=0)
+    ingested_at = Column(DateTime(timezone=True), server_default=func.now())
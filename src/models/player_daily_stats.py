@@ -0,0 +1,23 @@
+from sqlalchemy import BigInteger, Column, String, Date, Enum, Integer
+from enums import TransactionType
+from db import Base
+
+
+class PlayerDailyStats(Base):
+    """
+    Per player, day and game type totals of `transactions`, kept up to date by the transaction write paths.
+    Rebuild with scripts/backfill_player_stats.py.
+    """
+    __tablename__ = "player_daily_stats"
+
+    username = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True, index=True)
+    transaction_type = Column(Enum(TransactionType), primary_key=True)
+    transactions = Column(Integer, nullable=False, default=0)
+    hands = Column(Integer, nullable=False, default=0)
+    # Amounts are in cents (utils/money.py)
+    rake = Column(BigInteger, nullable=False, default=0)
+    total_buyin = Column(BigInteger, nullable=False, default=0)
+    total_cashout = Column(BigInteger, nullable=False, default=0)
+    bad_beat_contribution = Column(BigInteger, nullable=False, default=0)
+    bad_beat_cashout = Column(BigInteger, nullable=False, default=0)
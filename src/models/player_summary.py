@@ -1,5 +1,5 @@
 
-from sqlalchemy import Column, String, Float, DateTime, Integer
+from sqlalchemy import BigInteger, Column, String, DateTime, Integer
 from db import Base
 
 
@@ -7,14 +7,14 @@ class PlayerRakebackSummary(Base):
     __tablename__ = "player_rakeback_summary"
     
     username = Column(String, primary_key=True)
-    balance = Column(Float)
+    balance = Column(BigInteger)
     agent_name = Column(String)
     agent_id = Column(String)
     role = Column(String)
-    rake_since_last_rakeback = Column(Float)
+    rake_since_last_rakeback = Column(BigInteger)
     last_rakeback_date = Column(DateTime, nullable=True)
-    total_rakeback_received = Column(Float)
-    total_lifetime_rake = Column(Float)
+    total_rakeback_received = Column(BigInteger)
+    total_lifetime_rake = Column(BigInteger)
     total_hands_played = Column(Integer)
 
     # Make this a view
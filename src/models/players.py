@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Enum, Float
+from sqlalchemy import BigInteger, Column, String, DateTime, Enum
 from sqlalchemy.sql import func
 from enums import UserRole
 from db import Base
@@ -12,7 +12,8 @@ class Player(Base):
     agent_id = Column(String, nullable=True)
     agent_name = Column(String, nullable=True)
     role = Column(Enum(UserRole), nullable=False)
-    balance = Column(Float, default=0)
+    # In cents (utils/money.py)
+    balance = Column(BigInteger, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
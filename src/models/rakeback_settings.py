@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, DateTime, Enum, Float
+from sqlalchemy.sql import func
+from enums import RakebackType
+from db import Base
+
+
+class RakebackSetting(Base):
+    """Rakeback rate of a player or agent, a fraction of the rake it is paid back on"""
+    __tablename__ = "rakeback_settings"
+
+    username = Column(String, primary_key=True)
+    rakeback_type = Column(Enum(RakebackType), nullable=False)
+    percentage = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
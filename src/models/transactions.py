@@ -1,23 +1,40 @@
 import datetime as dt
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Date, Enum
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Date, Enum
+from sqlalchemy.orm import validates
 from enums import TransactionType
-from db import Base
+from db import Base, DB_SCHEMA
+
+
+def _today() -> dt.date:
+    return dt.datetime.now(dt.UTC).date()
 
 
 class Transaction(Base):
+    """
+    The ledger, range partitioned by month of `date` (see crud/transaction_partitions.py).
+    The partition key has to be part of the primary key, so undated transactions are dated on the day written.
+    """
     __tablename__ = "transactions"
+    __table_args__ = {"schema": DB_SCHEMA, "postgresql_partition_by": "RANGE (date)"}
     id = Column(String, primary_key=True, index=True)
     username = Column(String, primary_key=True, index=True)
     transaction_type = Column(Enum(TransactionType), index=True)
     details = Column(String)
-    total_buyin = Column(Float)
-    total_cashout = Column(Float)
-    date = Column(Date, nullable=True)
-    rake = Column(Float, default=0)
-    bad_beat_contribution = Column(Float, default=0)
-    bad_beat_cashout = Column(Float, default=0)
+    # Amounts are in cents (utils/money.py)
+    total_buyin = Column(BigInteger)
+    total_cashout = Column(BigInteger)
+    date = Column(Date, primary_key=True, default=_today)
+    rake = Column(BigInteger, default=0)
+    bad_beat_contribution = Column(BigInteger, default=0)
+    bad_beat_cashout = Column(BigInteger, default=0)
     hands = Column(Integer, default=0)
     created_by = Column(String)
-    created_at = Column(DateTime, default=dt.datetime.now(dt.UTC))
-    updated_at = Column(DateTime, default=dt.datetime.now(dt.UTC), onupdate=dt.datetime.now(dt.UTC))
+    # Callables, so every insert and update gets its own time rather than the time the module was imported
+    created_at = Column(DateTime, default=lambda: dt.datetime.now(dt.UTC))
+    updated_at = Column(DateTime, default=lambda: dt.datetime.now(dt.UTC), onupdate=lambda: dt.datetime.now(dt.UTC),
+                        index=True)
+
+    @validates("date")
+    def _date_or_today(self, key, value):
+        return value or _today()
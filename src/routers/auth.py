@@ -11,7 +11,7 @@ from gg_exceptions.client_users import UserNotFound
 from gg_exceptions.players import PlayerNotFound
 from schemas.auth import Token
 from schemas.client_users import ClientUserCreate, ClientUserAuth, ClientUserResponse
-from utils.auth_utils import create_access_token, pwd_context, authenticate_user, get_current_user
+from utils.auth_utils import create_access_token, get_pwd_context, authenticate_user, get_current_user
 
 router = APIRouter(
     prefix="/auth",
@@ -64,7 +64,7 @@ async def register(
             detail="Player not found in club"
         )
 
-    hashed_password = pwd_context.hash(user_data.password.get_secret_value())
+    hashed_password = get_pwd_context().hash(user_data.password.get_secret_value())
     new_user = ClientUserCreate(
         id=str(player.id),
         username=str(player.username),
@@ -81,6 +81,6 @@ async def change_password(
         db: Session = Depends(get_db),
         current_user: ClientUserResponse = Depends(get_current_user)
 ):
-    hashed_password = pwd_context.hash(user_data.password.get_secret_value())
+    hashed_password = get_pwd_context().hash(user_data.password.get_secret_value())
     update_password(db, current_user.username, hashed_password)
     return {"message": "User created successfully"}
\ No newline at end of file
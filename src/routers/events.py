@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+import crud.players as player_crud
+from clients.event_hub import Subscription, event_hub, sse_frame
+from consts import EVENT_HEARTBEAT_INTERVAL, EVENT_RETRY_MS
+from db import get_db
+from gg_exceptions.players import PlayerNotFound
+from schemas.client_users import ClientUserResponse
+from utils.auth_utils import get_current_user, get_token_expiry
+
+router = APIRouter(
+    prefix="/events",
+    tags=["Events"]
+)
+
+HEARTBEAT_FRAME = b": heartbeat\n\n"
+
+
+@router.get("", response_class=StreamingResponse)
+async def events(request: Request, current_user: ClientUserResponse = Depends(get_current_user),
+                 expires_at: int = Depends(get_token_expiry), db: Session = Depends(get_db)):
+    """
+    Server-sent events of the balances and ledgers the user sees: its own and, for agents and managers, those of
+    its downlines. Replaces polling GET /players and GET /transactions.
+
+    - `ready` once subscribed: load the current state then, and apply the events that follow
+    - `balance` {username, balance}: a player's new balance
+    - `transaction`: a transaction created through the API, as GET /transactions returns it
+    - `ledger` {username, created, updated}: transactions written in one batch, such as a report
+    - `resync`: the client fell behind and events were dropped; load the current state again
+
+    The stream is authenticated like any request, with the Authorization header, and ends when the token
+    expires so the client reconnects with a fresh one.
+    """
+    try:
+        player = player_crud.get_player_by_username(db, current_user.username)
+    except PlayerNotFound:
+        raise HTTPException(status_code=404, detail="Player not found")
+    topics = player_crud.get_stream_topics(db, player)
+    # The stream outlives the request, so the connection goes back to the pool now rather than when it ends
+    db.close()
+
+    return StreamingResponse(_stream(request, topics, expires_at), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _stream(request: Request, topics, expires_at: int):
+    subscription = event_hub.subscribe(topics)
+    try:
+        yield f"retry: {EVENT_RETRY_MS}\n\n".encode() + sse_frame("ready")
+        while True:
+            timeout = min(EVENT_HEARTBEAT_INTERVAL, expires_at - time.time())
+            if timeout <= 0:
+                return
+            try:
+                frame = await asyncio.wait_for(subscription.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield HEARTBEAT_FRAME
+                continue
+            # Whatever else is queued goes out in the same write
+            yield frame + b"".join(_drain(subscription))
+    finally:
+        event_hub.unsubscribe(subscription)
+
+
+def _drain(subscription: Subscription):
+    while not subscription.queue.empty():
+        yield subscription.queue.get_nowait()
@@ -0,0 +1,47 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+
+from enums import UserRole
+from logic.ingest import club_id_from_filename
+from logic.ingest_jobs import get_ingest_jobs
+from schemas.client_users import ClientUserResponse
+from schemas.ingest import IngestJobResponse
+from utils.auth_utils import get_current_user, check_roles
+
+router = APIRouter(
+    prefix="/ingest",
+    tags=["Ingest"]
+)
+
+
+@router.post("/uploads", response_model=IngestJobResponse, status_code=status.HTTP_202_ACCEPTED)
+@check_roles([UserRole.MASTER, UserRole.MANAGER])
+async def upload_export(file: UploadFile = File(...), club_id: Optional[str] = Form(None),
+                        current_user: ClientUserResponse = Depends(get_current_user)):
+    """Queue a ClubGG export for ingestion; poll GET /ingest/jobs/{id} for its progress"""
+    if not (file.filename or "").lower().endswith(".xlsx"):
+        raise HTTPException(status_code=400, detail="Only .xlsx ClubGG exports are supported")
+    club_id = club_id or club_id_from_filename(file.filename)
+    if not club_id.isdigit():
+        raise HTTPException(status_code=400, detail="Pass club_id, the file name does not start with one")
+
+    job = await run_in_threadpool(get_ingest_jobs().submit_upload, file.file, file.filename, club_id,
+                                  current_user.username)
+    return IngestJobResponse.model_validate(job)
+
+
+@router.get("/jobs", response_model=List[IngestJobResponse])
+@check_roles([UserRole.MASTER, UserRole.MANAGER])
+async def list_jobs(current_user: ClientUserResponse = Depends(get_current_user)):
+    return [IngestJobResponse.model_validate(job) for job in get_ingest_jobs().list()]
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobResponse)
+@check_roles([UserRole.MASTER, UserRole.MANAGER])
+async def get_job(job_id: str, current_user: ClientUserResponse = Depends(get_current_user)):
+    job = get_ingest_jobs().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return IngestJobResponse.model_validate(job)
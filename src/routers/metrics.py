@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from enums import UserRole
+from schemas.client_users import ClientUserResponse
+from utils.auth_utils import check_roles, get_current_user
+from utils.metrics import registry
+
+router = APIRouter(
+    tags=["Metrics"]
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+@check_roles([UserRole.MASTER, UserRole.MANAGER])
+async def metrics(current_user: ClientUserResponse = Depends(get_current_user)):
+    # Route names, traffic and database timings are for the club's operators only, scrapers send a bearer token
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
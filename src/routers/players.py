@@ -1,15 +1,21 @@
-from typing import List
+from base64 import b64decode, urlsafe_b64encode
+from datetime import date, timedelta, datetime, UTC
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 
 from db import get_db
 import crud.players as player_crud
 from enums import UserRole
 from gg_exceptions.players import PlayerNotFound
-from schemas.players import PlayerResponse, PlayerCreate
+from consts import DOWNLINE_MAX_PAGE_SIZE, DOWNLINE_PAGE_SIZE
+from crud.players import DOWNLINE_FIELDS
+from schemas.players import PlayerResponse, PlayerRequest, PlayerProjection, DownlineAggregateResponse
 from schemas.client_users import ClientUserResponse
 from utils.auth_utils import get_current_user, check_roles
+from utils.cache_utils import cached_json_response, player_tag
 from utils.player_utils import get_downline
 
 router = APIRouter(
@@ -17,40 +23,123 @@ router = APIRouter(
     tags=["Players"]
 )
 
+player_list_adapter = TypeAdapter(List[PlayerResponse])
+projection_list_adapter = TypeAdapter(List[PlayerProjection])
+
 @router.get("", response_model=PlayerResponse)
-async def get_current_player(current_user: ClientUserResponse = Depends(get_current_user), db: Session = Depends(get_db)):
-    return player_crud.get_player_by_username(db, current_user.username)
+async def get_current_player(request: Request, current_user: ClientUserResponse = Depends(get_current_user),
+                             db: Session = Depends(get_db)):
+    def build():
+        player = player_crud.get_player_by_username(db, current_user.username)
+        return PlayerResponse.model_validate(player).model_dump_json().encode(), []
+
+    return cached_json_response(request, current_user.username, [player_tag(current_user.username)], build)
 
 
 @router.post("", response_model=PlayerResponse)
 @check_roles([UserRole.MASTER, UserRole.MANAGER])
-async def create_player(player: PlayerCreate, db: Session = Depends(get_db), current_user: ClientUserResponse = Depends(get_current_user)):
-    return player_crud.create_player(db, player)
+async def create_player(player: PlayerRequest, db: Session = Depends(get_db), current_user: ClientUserResponse = Depends(get_current_user)):
+    return player_crud.create_player(db, player.to_player_create())
 
 
 @router.put("", response_model=PlayerResponse)
 @check_roles([UserRole.MASTER, UserRole.MANAGER])
-async def update_player(player: PlayerCreate, db: Session = Depends(get_db), current_user: ClientUserResponse = Depends(get_current_user)):
-    player_crud.update_player(db, player)
+async def update_player(player: PlayerRequest, db: Session = Depends(get_db), current_user: ClientUserResponse = Depends(get_current_user)):
+    player_crud.update_player(db, player.to_player_create())
 
 
 @router.delete("", response_model=None)
 @check_roles([UserRole.MASTER, UserRole.MANAGER])
 async def delete_player(username: str, db: Session = Depends(get_db), current_user: ClientUserResponse = Depends(get_current_user)):
     try:
-        player = player_crud.get_player_by_username(db, username)
-        db.delete(player)
-        db.commit()
+        player_crud.delete_player(db, username)
 
     except PlayerNotFound:
         raise
     return None
 
 
-@router.get("/downlines", response_model=List[PlayerResponse])
+def _encode_cursor(username: str) -> str:
+    return urlsafe_b64encode(username.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return b64decode(cursor, altchars=b"-_", validate=True).decode()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/downlines", response_model=Union[List[PlayerResponse], List[PlayerProjection]])
+@check_roles([UserRole.MASTER, UserRole.MANAGER, UserRole.SUPER_AGENT, UserRole.AGENT])
+async def player_downlines(request: Request,
+                           limit: Optional[int] = Query(None, ge=1, le=DOWNLINE_MAX_PAGE_SIZE),
+                           cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+                           fields: Optional[str] = Query(None, description="Comma separated, e.g. username,balance"),
+                           role: Optional[UserRole] = None,
+                           agent_id: Optional[str] = None,
+                           current_user: ClientUserResponse = Depends(get_current_user),
+                           db: Session = Depends(get_db)):
+    """
+    Without parameters: the player followed by all of its downlines.
+    With any of them: a page of downlines ordered by username, with only the requested fields. The cursor of
+    the next page comes in the X-Next-Cursor header, which is absent on the last page.
+    """
+    if limit is None and cursor is None and fields is None and role is None and agent_id is None:
+        def build():
+            player, *downlines = player_crud.get_downlines(db, current_user)
+            body = player_list_adapter.dump_json(player_list_adapter.validate_python([player, *downlines],
+                                                                                     from_attributes=True))
+            return body, player_crud.get_downline_cache_tags(player, downlines)
+
+        return cached_json_response(request, current_user.username, [player_tag(current_user.username)], build)
+
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else DOWNLINE_FIELDS
+    unknown = set(selected) - set(DOWNLINE_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    after = _decode_cursor(cursor) if cursor else None
+    limit = limit or DOWNLINE_PAGE_SIZE
+
+    def build_page():
+        player = player_crud.get_player_by_username(db, current_user.username)
+        # One more row than asked tells whether there is a next page
+        rows = player_crud.get_downline_page(db, player, selected, limit + 1, after, role, agent_id)
+        page, more = rows[:limit], len(rows) > limit
+        body = projection_list_adapter.dump_json(
+            projection_list_adapter.validate_python([row._mapping for row in page]), exclude_unset=True)
+        headers = {"X-Next-Cursor": _encode_cursor(page[-1].username)} if more else {}
+        return body, player_crud.get_downline_page_cache_tags(db, player), headers
+
+    return cached_json_response(request, current_user.username, [player_tag(current_user.username)], build_page)
+
+
+@router.get("/downlines/aggregate", response_model=DownlineAggregateResponse)
 @check_roles([UserRole.MASTER, UserRole.MANAGER, UserRole.SUPER_AGENT, UserRole.AGENT])
-async def player_downlines(current_user: ClientUserResponse = Depends(get_current_user),db: Session = Depends(get_db)):
-    return player_crud.get_downlines(db, current_user)
+async def player_downlines_aggregate(request: Request,
+                                     from_date: Optional[date] = Query(None, description="Defaults to this week's Monday"),
+                                     to_date: Optional[date] = Query(None, description="Defaults to today"),
+                                     current_user: ClientUserResponse = Depends(get_current_user),
+                                     db: Session = Depends(get_db)):
+    """Balance, rake, hands and net winnings of every downline and of the whole subtree"""
+    to_date = to_date or datetime.now(UTC).date()
+    from_date = from_date or to_date - timedelta(days=to_date.weekday())
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date must not be after to_date")
+
+    def build():
+        player = player_crud.get_player_by_username(db, current_user.username)
+        rows = player_crud.get_downline_aggregates(db, player, from_date, to_date)
+        downlines = [row for row in rows if not row.is_total]
+        totals = next(row for row in rows if row.is_total)
+        response = DownlineAggregateResponse(
+            from_date=from_date, to_date=to_date,
+            totals=totals._mapping,
+            downlines=[downline._mapping for downline in downlines])
+        # Balance and transaction writes invalidate the rosters of everyone above the player
+        return response.model_dump_json().encode(), player_crud.get_downline_cache_tags(player, downlines)
+
+    return cached_json_response(request, current_user.username, [player_tag(current_user.username)], build)
 
 
 @router.get("/{player_username}", response_model=PlayerResponse)
@@ -0,0 +1,48 @@
+import datetime
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+import crud.player_stats as stats_crud
+from crud.players import get_downlines
+from db import get_db
+from enums import UserRole
+from schemas.client_users import ClientUserResponse
+from schemas.stats import StatsRow
+from utils.auth_utils import get_current_user
+from utils.cache_utils import cached_json_response, ledger_tag
+from utils.player_utils import get_downline
+
+router = APIRouter(
+    prefix="/stats",
+    tags=["Stats"]
+)
+
+stats_list_adapter = TypeAdapter(List[StatsRow])
+
+DEFAULT_RANGE_DAYS = 30
+
+
+@router.get('', response_model=List[StatsRow])
+def get_stats(request: Request, username: Optional[str] = None, from_date: Optional[datetime.date] = None,
+              to_date: Optional[datetime.date] = None,
+              group_by: List[Literal['date', 'transaction_type']] = Query(default=[]),
+              current_user: ClientUserResponse = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Totals of a player's games over a date range (default: the last 30 days), from the daily rollup.
+    Players see their own stats, agents and managers also those of their downlines.
+    """
+    username = username or current_user.username
+    if username != current_user.username and (
+            current_user.role == UserRole.PLAYER or not get_downline(username, get_downlines(db, current_user))):
+        raise HTTPException(status_code=403, detail="You don't have permission to access this player's stats")
+    to_date = to_date or datetime.date.today()
+    from_date = from_date or to_date - datetime.timedelta(days=DEFAULT_RANGE_DAYS)
+
+    def build():
+        rows = stats_crud.get_stats(db, [username], from_date, to_date, group_by)
+        return stats_list_adapter.dump_json(stats_list_adapter.validate_python(rows)), []
+
+    return cached_json_response(request, current_user.username, [ledger_tag(username)], build)
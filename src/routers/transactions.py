@@ -1,17 +1,24 @@
 import datetime
-from typing import List
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select, union
 from sqlalchemy.orm import Session
 
-from crud.players import get_downlines, get_player_by_username
+from crud.players import get_downline_query, get_downlines, get_player_by_username
 import crud.transactions as crud
 from crud.transactions import create_transaction
 from db import get_db
 from gg_exceptions.auth import AuthorizationError
+from gg_exceptions.players import PlayerNotFound
+from logic.transaction_export import MEDIA_TYPES, csv_chunks, export_query, ndjson_chunks
+from models import Player
 from utils.auth_utils import get_current_user, check_roles
 from schemas.transactions import TransactionResponse, TransferTransaction
 from schemas.client_users import UserRole, ClientUserResponse
+from utils.cache_utils import cached_json_response, ledger_tag
 from utils.player_utils import get_downline
 
 # Create router
@@ -20,12 +27,52 @@ router = APIRouter(
     tags=["Transactions"]
 )
 
+transaction_list_adapter = TypeAdapter(List[TransactionResponse])
+
 @router.get('', response_model=List[TransactionResponse])
-def get_transactions(skip: int = 0, limit: int = 100, from_date: datetime.date = None, to_date: datetime.date = None,
-                     current_user: ClientUserResponse = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_transactions(request: Request, skip: int = 0, limit: int = 100, from_date: datetime.date = None,
+                     to_date: datetime.date = None, current_user: ClientUserResponse = Depends(get_current_user),
+                     db: Session = Depends(get_db)):
+    def build():
+        transactions = crud.get_transactions(db, username=current_user.username, skip=skip, limit=limit,
+                                             from_date=from_date, to_date=to_date)
+        body = transaction_list_adapter.dump_json(transaction_list_adapter.validate_python(transactions,
+                                                                                           from_attributes=True))
+        return body, []
+
+    return cached_json_response(request, current_user.username, [ledger_tag(current_user.username)], build)
+
+
+@router.get('/export')
+def export_transactions(format: Literal['csv', 'ndjson'] = 'csv', username: Optional[str] = None,
+                        subtree: bool = False, from_date: Optional[datetime.date] = None,
+                        to_date: Optional[datetime.date] = None,
+                        current_user: ClientUserResponse = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Stream the full transaction history of a player, or of a player and everyone below it, as CSV or NDJSON.
+    Players export their own history, agents and managers also that of their downlines.
+    """
+    username = username or current_user.username
+    if username != current_user.username and (
+            current_user.role == UserRole.PLAYER or not get_downline(username, get_downlines(db, current_user))):
+        raise HTTPException(status_code=403, detail="You don't have permission to export this player's transactions")
+
+    usernames = [username]
+    if subtree and current_user.role != UserRole.PLAYER:
+        try:
+            player = get_player_by_username(db, username)
+        except PlayerNotFound:
+            raise HTTPException(status_code=404, detail="Player not found")
+        if player.role != UserRole.PLAYER:
+            usernames = union(select(Player.username).where(Player.username == username),
+                              get_downline_query(player).with_only_columns(Player.username))
 
-    return crud.get_transactions(db, username=current_user.username, skip=skip, limit=limit, from_date=from_date,
-                                 to_date=to_date)
+    query = export_query(usernames, from_date, to_date)
+    chunks = csv_chunks(query) if format == 'csv' else ndjson_chunks(query)
+    period = "_".join(str(day) for day in (from_date, to_date) if day)
+    filename = "_".join(part for part in ("transactions", username, "subtree" if subtree else "", period) if part)
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'})
 
 
 @router.post("/transfer", response_model=List[TransactionResponse])
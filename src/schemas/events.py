@@ -0,0 +1,14 @@
+from schemas.base import BaseSchema
+from utils.money import Cents
+
+
+class BalanceEvent(BaseSchema):
+    username: str
+    balance: Cents
+
+
+class LedgerEvent(BaseSchema):
+    """Transactions of a player written in one batch, such as a report; reload its ledger to see them"""
+    username: str
+    created: int
+    updated: int
@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import List, Optional
+
+from enums import IngestJobStatus
+from schemas.base import BaseSchema
+
+
+class IngestSheetProgress(BaseSchema):
+    sheet: str
+    tables: int
+    rows: int
+
+    class Config:
+        from_attributes = True
+
+
+class IngestJobResponse(BaseSchema):
+    id: str
+    filename: str
+    club_id: str
+    status: IngestJobStatus
+    submitted_by: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    sheets: List[IngestSheetProgress] = []
+    players_created: int = 0
+    players_updated: int = 0
+    transactions_created: int = 0
+    transactions_updated: int = 0
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
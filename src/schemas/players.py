@@ -1,14 +1,15 @@
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import List, Optional
 from enums import UserRole
 from schemas.base import BaseSchema
+from utils.money import Cents, to_cents
 
 class PlayerBase(BaseSchema):
     username: str
     agent_id: Optional[str]
     agent_name: Optional[str]
     role: UserRole
-    balance: float
+    balance: Cents
 
 class PlayerCreate(PlayerBase):
     id: str
@@ -16,7 +17,49 @@ class PlayerCreate(PlayerBase):
     class Config:
         from_attributes = True
 
+class PlayerRequest(PlayerCreate):
+    """A player as sent to the API, with the balance in currency units"""
+    balance: float
+
+    def to_player_create(self) -> PlayerCreate:
+        return PlayerCreate(**self.model_dump(exclude={'balance'}), balance=to_cents(self.balance))
+
 class PlayerResponse(PlayerCreate):
     created_at: datetime
     updated_at: datetime
 
+
+class PlayerProjection(BaseSchema):
+    """Any subset of PlayerResponse's fields, as selected with `fields`; serialize with exclude_unset"""
+    id: Optional[str] = None
+    username: Optional[str] = None
+    agent_id: Optional[str] = None
+    agent_name: Optional[str] = None
+    role: Optional[UserRole] = None
+    balance: Optional[Cents] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+
+class DownlineTotals(BaseSchema):
+    players: int
+    balance: Cents
+    transactions: int
+    hands: int
+    rake: Cents
+    net_winnings: Cents
+
+
+class DownlineAggregate(DownlineTotals):
+    username: str
+    agent_id: Optional[str]
+    agent_name: Optional[str]
+    role: UserRole
+
+
+class DownlineAggregateResponse(BaseSchema):
+    from_date: date
+    to_date: date
+    totals: DownlineTotals
+    downlines: List[DownlineAggregate]
@@ -0,0 +1,27 @@
+import datetime
+from typing import Optional
+
+from pydantic import computed_field
+
+from enums import TransactionType
+from schemas.base import BaseSchema
+from utils.money import Cents
+
+
+class StatsRow(BaseSchema):
+    # Set only for the fields the stats were grouped by
+    date: Optional[datetime.date] = None
+    transaction_type: Optional[TransactionType] = None
+    username: Optional[str] = None
+    transactions: int
+    hands: int
+    rake: Cents
+    total_buyin: Cents
+    total_cashout: Cents
+    bad_beat_contribution: Cents
+    bad_beat_cashout: Cents
+
+    @computed_field
+    @property
+    def profit(self) -> Cents:
+        return self.total_cashout - self.total_buyin
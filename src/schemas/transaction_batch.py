@@ -0,0 +1,175 @@
+"""
+Columnar transactions, for reports of thousands of rows.
+
+A TransactionBatch holds one column per TransactionCreate field rather than one model per transaction. The
+strings that repeat on every row of a table (id, type, table name, creator, date) are categoricals, stored once
+per batch, and amounts are int64 cents. Validation is done once per column, and for categoricals once per
+distinct value, instead of once per row. Rows are available as light named tuples for code that works row
+by row.
+"""
+import datetime as dt
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from enums import TransactionType
+from schemas.transactions import TransactionCreate
+
+TRANSACTION_FIELDS = ('id', 'username', 'transaction_type', 'details', 'total_buyin', 'total_cashout', 'rake',
+                      'bad_beat_contribution', 'bad_beat_cashout', 'hands', 'date', 'created_by')
+STRING_FIELDS = ('id', 'username', 'details', 'created_by')
+INTEGER_FIELDS = ('total_buyin', 'total_cashout', 'rake', 'bad_beat_contribution', 'bad_beat_cashout', 'hands')
+CATEGORICAL_FIELDS = (*STRING_FIELDS, 'transaction_type', 'date')
+DEFAULTS = {'rake': 0, 'bad_beat_contribution': 0, 'bad_beat_cashout': 0, 'hands': 0}
+
+TransactionRow = namedtuple('TransactionRow', TRANSACTION_FIELDS)
+
+
+def _convert_categories(values: pd.Categorical, convert) -> pd.Categorical:
+    """Validate and convert a categorical through its distinct values"""
+    converted = [convert(value) for value in values.categories]
+    if len(set(converted)) == len(converted):
+        return values.rename_categories(converted)
+    # Distinct values converting to the same one, such as 1 and '1'
+    return pd.Categorical(np.append(np.asarray(converted, dtype=object), None)[values.codes])
+
+
+def _as_date(value) -> dt.date:
+    if isinstance(value, dt.datetime):
+        return value.date()
+    if isinstance(value, dt.date):
+        return value
+    return dt.date.fromisoformat(str(value))
+
+
+class TransactionBatch:
+    """Transactions as validated columns; build with from_columns, from_transactions or concat"""
+
+    def __init__(self, columns: Dict[str, object]):
+        self.columns = self._validate(columns)
+
+    @classmethod
+    def from_columns(cls, **columns) -> 'TransactionBatch':
+        """
+        Each field as a sequence, or as a scalar repeated on every row, such as a table's id and date.
+        Fields with a TransactionCreate default may be left out.
+        """
+        lengths = {len(value) for value in columns.values() if isinstance(value, (Sequence, np.ndarray, pd.Series))
+                   and not isinstance(value, str)}
+        if len(lengths) > 1:
+            raise ValueError(f'Transaction columns of different lengths: {sorted(lengths)}')
+        length = lengths.pop() if lengths else 1
+        full = {}
+        for field in TRANSACTION_FIELDS:
+            value = columns.get(field, DEFAULTS.get(field))
+            if field not in columns and field not in DEFAULTS and field != 'date':
+                raise ValueError(f'Transaction column {field} is missing')
+            if isinstance(value, pd.Series):
+                value = value.to_numpy()
+            elif isinstance(value, str) or not isinstance(value, (Sequence, np.ndarray)):
+                value = [value] * length if field in CATEGORICAL_FIELDS else np.full(length, value)
+            full[field] = value
+        return cls(full)
+
+    @classmethod
+    def from_transactions(cls, transactions: Iterable[TransactionCreate]) -> 'TransactionBatch':
+        transactions = list(transactions)
+        return cls({field: [getattr(transaction, field) for transaction in transactions]
+                    for field in TRANSACTION_FIELDS})
+
+    @classmethod
+    def concat(cls, batches: Iterable['TransactionBatch']) -> 'TransactionBatch':
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.from_transactions([])
+        if len(batches) == 1:
+            return batches[0]
+        batch = cls.__new__(cls)
+        batch.columns = {
+            field: union_categoricals([b.columns[field] for b in batches]) if field in CATEGORICAL_FIELDS
+            else np.concatenate([b.columns[field] for b in batches])
+            for field in TRANSACTION_FIELDS
+        }
+        return batch
+
+    @staticmethod
+    def _validate(columns: Dict[str, object]) -> Dict[str, object]:
+        valid = {}
+        for field in TRANSACTION_FIELDS:
+            values = columns[field]
+            if field in INTEGER_FIELDS:
+                numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy()
+                if numbers.dtype.kind == 'f':
+                    # Also catches NaN, which is not equal to itself
+                    invalid = numbers != np.round(numbers)
+                    if invalid.any():
+                        raise ValueError(f'{int(invalid.sum())} transactions have no whole number of {field}')
+                valid[field] = numbers.astype(np.int64)
+                continue
+
+            values = pd.Categorical(values)
+            convert = {'transaction_type': TransactionType, 'date': _as_date}.get(field, str)
+            values = _convert_categories(values, convert)
+            if field != 'date' and (values.codes == -1).any():
+                raise ValueError(f'{int((values.codes == -1).sum())} transactions have no {field}')
+            valid[field] = values
+        return valid
+
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+
+    def _lists(self, fields: Sequence[str] = TRANSACTION_FIELDS) -> List[list]:
+        lists = []
+        for field in fields:
+            values = self.columns[field]
+            if field in CATEGORICAL_FIELDS:
+                categories = np.asarray(values.categories, dtype=object)
+                # Missing values (code -1) pick the None appended after the categories
+                values = np.append(categories, None)[values.codes].tolist()
+            else:
+                values = values.tolist()
+            lists.append(values)
+        return lists
+
+    def usernames(self) -> set:
+        usernames = self.columns['username']
+        return set(usernames.categories[np.unique(usernames.codes)])
+
+    def rows(self) -> Iterator[TransactionRow]:
+        return map(TransactionRow._make, zip(*self._lists()))
+
+    def __iter__(self) -> Iterator[TransactionRow]:
+        return self.rows()
+
+    def records(self, fields: Sequence[str] = TRANSACTION_FIELDS) -> List[dict]:
+        """The rows as dicts of plain Python values, ready for an executemany"""
+        return [dict(zip(fields, values)) for values in zip(*self._lists(fields))]
+
+    def to_transactions(self) -> List[TransactionCreate]:
+        return [TransactionCreate(**row._asdict()) for row in self.rows()]
+
+    def to_frame(self, fields: Sequence[str] = TRANSACTION_FIELDS) -> pd.DataFrame:
+        return pd.DataFrame({field: self.columns[field] for field in fields}, copy=False)
+
+    def with_dates(self, default: dt.date) -> 'TransactionBatch':
+        """The batch with undated transactions dated `default`, as the ledger does"""
+        dates: pd.Categorical = self.columns['date']
+        if not (dates.codes == -1).any():
+            return self
+        if default not in dates.categories:
+            dates = dates.add_categories([default])
+        codes = np.where(dates.codes == -1, dates.categories.get_loc(default), dates.codes)
+        batch = self.__class__.__new__(self.__class__)
+        batch.columns = {**self.columns, 'date': pd.Categorical.from_codes(codes, dates.categories)}
+        return batch
+
+    def take(self, mask: np.ndarray) -> 'TransactionBatch':
+        batch = self.__class__.__new__(self.__class__)
+        batch.columns = {field: values[mask] for field, values in self.columns.items()}
+        return batch
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({len(self)} transactions)'
@@ -6,20 +6,21 @@ from pydantic import field_validator
 
 from enums import TransactionType
 from schemas.base import BaseSchema
+from utils.money import Cents, to_cents
 
 class TransactionBase(BaseSchema):
     id: str
     username: str
     transaction_type: TransactionType
     details: str
-    total_buyin: float
-    total_cashout: float
+    total_buyin: Cents
+    total_cashout: Cents
     date: Optional[datetime.date]
 
 class TransactionCreate(TransactionBase):
-    rake: float = 0
-    bad_beat_contribution: float = 0
-    bad_beat_cashout: float = 0
+    rake: Cents = 0
+    bad_beat_contribution: Cents = 0
+    bad_beat_cashout: Cents = 0
     hands: int = 0
     created_by: str
 
@@ -34,6 +35,7 @@ class TransactionResponse(TransactionBase):
 class TransferTransaction(BaseSchema):
     transfer_from: str
     transfer_to: str
+    # In currency units, as typed by the user
     transfer_amount: float
     date: datetime.date = datetime.date.today()
 
@@ -55,7 +57,7 @@ class TransferTransaction(BaseSchema):
             username=self.transfer_from,
             transaction_type=TransactionType.TRANSFER,
             details=f'Transfer to {self.transfer_to}',
-            total_buyin=self.transfer_amount,
+            total_buyin=to_cents(self.transfer_amount),
             total_cashout=0,
             date=datetime.date.today(),
             created_by=''
@@ -67,7 +69,7 @@ class TransferTransaction(BaseSchema):
             transaction_type=TransactionType.TRANSFER,
             details=f'Transfer from {self.transfer_from}',
             total_buyin=0,
-            total_cashout=self.transfer_amount,
+            total_cashout=to_cents(self.transfer_amount),
             date=datetime.date.today(),
             created_by=''
         ))
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""
+Close the transaction months of finished seasons by moving their partitions to the archive schema.
+
+Archived months stay readable through `transactions`, but ingest no longer writes to or looks them up, which
+keeps upsert lookups on the open months only.
+
+Usage (from src/):
+    python -m scripts.archive_transactions --before 2025-01-01 --dry-run
+    python -m scripts.archive_transactions --before 2025-01-01 --tablespace cold
+"""
+import argparse
+from datetime import date
+
+from crud.transaction_partitions import ARCHIVE_SCHEMA, archive_partitions
+from db import get_engine
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Archive the transaction partitions of closed seasons")
+    arg_parser.add_argument("--before", type=date.fromisoformat, required=True,
+                            help="Archive the months that end on or before this date")
+    arg_parser.add_argument("--tablespace", help="Also move the archived partitions to this tablespace")
+    arg_parser.add_argument("--dry-run", action="store_true", help="List the partitions without moving them")
+    args = arg_parser.parse_args()
+
+    with get_engine().begin() as conn:
+        names = archive_partitions(conn, args.before, args.tablespace, args.dry_run)
+    verb = "Would archive" if args.dry_run else "Archived"
+    print(f"{verb} {len(names)} partition(s) into {ARCHIVE_SCHEMA}" + "".join(f"\n  {name}" for name in names))
@@ -0,0 +1,13 @@
+from crud.player_stats import rebuild_stats
+from db import SessionLocal
+from utils.sql_profiler import profile_sql
+
+
+if __name__ == '__main__':
+    db = SessionLocal()
+    try:
+        with profile_sql("backfill_player_stats"):
+            rows = rebuild_stats(db)
+        print(f"Rebuilt player_daily_stats: {rows} rows")
+    finally:
+        db.close()
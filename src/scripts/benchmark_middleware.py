@@ -0,0 +1,107 @@
+"""
+Micro-benchmark of the per-request overhead added by the middleware stack.
+
+Drives the ASGI apps directly (no sockets, no server) and compares:
+    bare         - the route with no middleware at all
+    base_http    - three no-op BaseHTTPMiddleware layers, i.e. the wrapping cost the old stack paid
+                   before running any of its own logic
+    asgi_stack   - the pure ASGI RequestSizeLimit/Auth/RateLimit middlewares doing their real work
+
+Usage (from src/, with the usual .env available):
+    python -m scripts.benchmark_middleware --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi_cache import FastAPICache
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from clients.memory_cache import InMemoryCache
+from consts import MAX_CONTENT_LENGTH, MAX_HEADER_LENGTH
+from enums import UserRole
+from middleware.auth import AuthMiddleware
+from middleware.rate_limit import RateLimitMiddleware
+from middleware.request_size_limit import RequestSizeLimitMiddleware
+from schemas.client_users import ClientUserResponse
+from utils.auth_utils import create_access_token
+
+
+async def ping(_):
+    return PlainTextResponse("pong")
+
+
+class NoopHTTPMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        return await call_next(request)
+
+
+def build_app(stack: str, requests: int):
+    app = Starlette(routes=[Route("/ping", ping)])
+    if stack == "base_http":
+        for _ in range(3):
+            app.add_middleware(NoopHTTPMiddleware)
+    elif stack == "asgi_stack":
+        # Added as app.py adds them, the last one outermost: the rate limiter runs first, the size limit last
+        app.add_middleware(RequestSizeLimitMiddleware, max_content_length=MAX_CONTENT_LENGTH,
+                           max_headers_length=MAX_HEADER_LENGTH)
+        app.add_middleware(AuthMiddleware)
+        app.add_middleware(RateLimitMiddleware, auth_requests_per_minute=requests + 1)
+    return app
+
+
+async def run(app, token: str, requests: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 12345),
+        "server": ("localhost", 8080),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"Unexpected status {message['status']}")
+
+    # Warm up before timing
+    for _ in range(min(500, requests)):
+        await app(dict(scope), receive, send)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+async def main(requests: int):
+    FastAPICache.init(InMemoryCache(), prefix="benchmark")
+    token = create_access_token(ClientUserResponse(id="0", username="benchmark", role=UserRole.PLAYER))
+
+    results = {}
+    for stack in ("bare", "base_http", "asgi_stack"):
+        elapsed = await run(build_app(stack, requests * 2), token, requests)
+        results[stack] = elapsed / requests * 1e6
+
+    print(f"{'stack':<12} {'us/request':>12} {'overhead us':>12}")
+    for stack, per_request in results.items():
+        print(f"{stack:<12} {per_request:>12.1f} {per_request - results['bare']:>12.1f}")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Measure per-request middleware overhead")
+    arg_parser.add_argument("--requests", type=int, default=10000)
+    args = arg_parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,71 @@
+"""
+Startup benchmark: interpreter start -> `import app` -> first served request, in fresh processes.
+
+Every run spawns a new interpreter (like a worker booting during a rolling deploy or scale-out), imports
+the app, runs its lifespan startup and serves GET /openapi.json through the full middleware stack.
+
+Usage (from src/, with the usual .env available):
+    python -m scripts.benchmark_startup --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+CHILD = r"""
+import asyncio, json, time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+
+async def first_request():
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": "/openapi.json", "raw_path": b"/openapi.json", "root_path": "",
+             "query_string": b"", "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 1),
+             "server": ("localhost", 8080)}
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    async with app_module.app.router.lifespan_context(app_module.app):
+        await app_module.app(scope, receive, send)
+    return status[0]
+
+status = asyncio.run(first_request())
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first_request": t2 - t1, "status": status}))
+"""
+
+
+def run_once() -> dict:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=Path(__file__).parents[1],
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def main(runs: int):
+    samples = [run_once() for _ in range(runs)]
+    statuses = {sample["status"] for sample in samples}
+    print(f"{runs} runs, first request status {statuses}")
+    print(f"{'phase':<15} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for phase in ("import", "first_request", "total"):
+        values = [sample[phase] * 1000 for sample in samples]
+        print(f"{phase:<15} {statistics.median(values):>10.1f} {min(values):>10.1f} {max(values):>10.1f}")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Measure import-to-first-request startup time")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args()
+    main(args.runs)
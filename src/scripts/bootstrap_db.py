@@ -0,0 +1,7 @@
+from db import get_engine
+from migrations import bootstrap
+
+
+if __name__ == '__main__':
+    applied = bootstrap(get_engine())
+    print(f"Schema up to date, applied {len(applied)} migration(s): {', '.join(applied) or '-'}")
@@ -0,0 +1,31 @@
+"""
+Export the transactions changed since the last run to day-partitioned Parquet files.
+
+Usage (from src/):
+    python -m scripts.export_ledger                      # incremental, into LEDGER_EXPORT_DIR
+    python -m scripts.export_ledger --full               # re-export everything
+
+Reading the export:
+    pyarrow.dataset.dataset("exports/ledger", format="parquet", partitioning="hive").to_table()
+"""
+import argparse
+from pathlib import Path
+
+from logic.ledger_export import export_ledger, get_ledger_export_settings
+from utils.sql_profiler import profile_sql
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Incremental Parquet export of the transaction ledger")
+    arg_parser.add_argument("--dir", type=Path, help="Export directory (default: LEDGER_EXPORT_DIR)")
+    arg_parser.add_argument("--full", action="store_true", help="Ignore the watermark and export every transaction")
+    args = arg_parser.parse_args()
+
+    settings = get_ledger_export_settings()
+    if args.dir:
+        settings = settings.model_copy(update={"ledger_export_dir": args.dir})
+    with profile_sql("export_ledger"):
+        run = export_ledger(settings, full=args.full)
+    print(f"{run.rows} transaction(s) in {len(run.partitions)} day partition(s) since {run.since or 'the start'}, "
+          f"watermark {run.watermark}")
+    print(" ".join(f"{stage} {seconds:.2f}s" for stage, seconds in run.timings.items()))
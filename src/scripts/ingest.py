@@ -0,0 +1,105 @@
+"""
+Ingest ClubGG report exports for one or more clubs.
+
+Clubs are processed in parallel, each in its own session. Within a club the reports are written oldest
+first: one players phase, then one transactions phase. Reports whose content was ingested before are skipped.
+
+Usage (from src/):
+    python -m scripts.ingest --club 910171 --club 123456          # resources/<club>_*.xlsx
+    python -m scripts.ingest --files '../exports/*.xlsx'            # clubs taken from the file names
+    python -m scripts.ingest --club 910171 --dry-run                # show what would change, write nothing
+"""
+import argparse
+import contextvars
+import glob
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from logic.gg_parser import ClubGGDataParser
+from logic.ingest import STAGES, ClubRun, club_id_from_filename, ingest_club, report_sort_key
+from utils.money import from_cents
+from utils.sql_profiler import profile_sql
+
+
+def resolve_files(club_ids: List[str], patterns: List[str]) -> Dict[str, List[Path]]:
+    if not patterns:
+        patterns = [str(ClubGGDataParser.DATA_DIR / f'{club_id}_*.xlsx') for club_id in club_ids]
+
+    files_by_club = defaultdict(set)
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            club_id = club_id_from_filename(Path(path))
+            if not club_ids or club_id in club_ids:
+                files_by_club[club_id].add(Path(path).resolve())
+    return {club_id: sorted(paths, key=report_sort_key) for club_id, paths in files_by_club.items()}
+
+
+def print_report(runs: List[ClubRun], elapsed: float, dry_run: bool, show_changes: int):
+    header = (f"{'club':<10} {'files':>5} {'skip':>4} {'players +new/~upd':>18} {'transactions +new/~upd':>23} "
+              + " ".join(f"{stage + ' s':>14}" for stage in STAGES))
+    print(("DRY RUN - nothing was written\n" if dry_run else "") + header)
+    totals = ClubRun(club_id="total")
+    for run in runs:
+        players = f"+{run.players_created}/~{run.players_updated}"
+        transactions = f"+{run.transactions_created}/~{run.transactions_updated}"
+        print(f"{run.club_id:<10} {run.files:>5} {run.skipped:>4} {players:>18} {transactions:>23} "
+              + " ".join(f"{run.timings[stage]:>14.2f}" for stage in STAGES))
+        if run.error:
+            print(f"  failed: {run.error}")
+        for name in ("files", "skipped", "players_created", "players_updated", "transactions_created",
+                     "transactions_updated"):
+            setattr(totals, name, getattr(totals, name) + getattr(run, name))
+        for stage in STAGES:
+            totals.timings[stage] += run.timings[stage]
+
+    players = f"+{totals.players_created}/~{totals.players_updated}"
+    transactions = f"+{totals.transactions_created}/~{totals.transactions_updated}"
+    print(f"{'total':<10} {totals.files:>5} {totals.skipped:>4} {players:>18} {transactions:>23} "
+          + " ".join(f"{totals.timings[stage]:>14.2f}" for stage in STAGES))
+    print(f"wall time {elapsed:.2f}s for {len(runs)} club(s)")
+
+    if dry_run:
+        for run in runs:
+            changes = sorted(run.balance_changes.items(), key=lambda item: -abs(item[1][1] - item[1][0]))
+            if not changes:
+                continue
+            print(f"\nclub {run.club_id}: {len(changes)} balance change(s)")
+            for username, (before, after) in changes[:show_changes]:
+                print(f"  {username:<24} {from_cents(before):>12.2f} -> {from_cents(after):>12.2f} "
+                      f"({from_cents(after - before):+.2f})")
+
+
+def main(club_ids: List[str], patterns: List[str], dry_run: bool, force: bool, workers: Optional[int],
+         show_changes: int) -> int:
+    files_by_club = resolve_files(club_ids, patterns)
+    if not files_by_club:
+        print("No report files found")
+        return 1
+
+    start = time.perf_counter()
+    with profile_sql("ingest"), ThreadPoolExecutor(max_workers=workers or len(files_by_club)) as executor:
+        # Each club runs in a copy of this context, so an enabled SQL profile sees every club's statements
+        futures = [executor.submit(contextvars.copy_context().run, ingest_club, club_id, paths, dry_run, force)
+                   for club_id, paths in files_by_club.items()]
+        runs = [future.result() for future in futures]
+    print_report(runs, time.perf_counter() - start, dry_run, show_changes)
+    return 1 if any(run.error for run in runs) else 0
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Ingest ClubGG report exports for one or more clubs")
+    arg_parser.add_argument("--club", action="append", default=[], help="Club id, may be repeated")
+    arg_parser.add_argument("--files", action="append", default=[],
+                            help="Glob of report files, may be repeated (default: resources/<club>_*.xlsx)")
+    arg_parser.add_argument("--dry-run", action="store_true", help="Show what would change without writing")
+    arg_parser.add_argument("--force", action="store_true", help="Ingest files even if they were ingested before")
+    arg_parser.add_argument("--workers", type=int, help="Clubs processed in parallel (default: one per club)")
+    arg_parser.add_argument("--show-changes", type=int, default=20,
+                            help="Balance changes listed per club in dry-run mode")
+    args = arg_parser.parse_args()
+    if not args.club and not args.files:
+        arg_parser.error("pass at least one --club or --files")
+    raise SystemExit(main(args.club, args.files, args.dry_run, args.force, args.workers, args.show_changes))
@@ -0,0 +1,24 @@
+"""
+Ingest ClubGG reports as they arrive by email.
+
+Settings come from the environment / .env: EMAIL_ADDRESS, EMAIL_PASSWORD and optionally EMAIL_SENDER,
+EMAIL_FOLDER, EMAIL_DOWNLOAD_FOLDER and the INGEST_*_CONCURRENCY / INGEST_QUEUE_SIZE knobs.
+
+Usage (from src/):
+    python -m scripts.ingest_email          # keep running, woken by IMAP IDLE
+    python -m scripts.ingest_email --once   # ingest what is new and exit
+"""
+import argparse
+import asyncio
+
+from logic.ingest_pipeline import run_email_ingest
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Stream report emails into the database")
+    arg_parser.add_argument("--once", action="store_true", help="Sync new emails once instead of waiting for more")
+    args = arg_parser.parse_args()
+    try:
+        asyncio.run(run_email_ingest(run_forever=not args.once))
+    except KeyboardInterrupt:
+        pass
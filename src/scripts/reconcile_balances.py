@@ -0,0 +1,49 @@
+"""
+Audit every player's stored balance against its ledger, and optionally correct the drift.
+
+Usage (from src/):
+    python -m scripts.reconcile_balances                 # report only, exits 1 on drift
+    python -m scripts.reconcile_balances --fix           # write ADJUSTMENT transactions for the mismatches
+"""
+import argparse
+
+from db import SessionLocal
+from logic.reconcile import Reconciliation, correct_balances, reconcile_balances
+from utils.money import from_cents, to_cents
+from utils.sql_profiler import profile_sql
+
+
+def print_report(report: Reconciliation, show: int):
+    print(f"{report.players} players, {report.transactions} transactions: "
+          f"{len(report.mismatches)} mismatched balance(s), {from_cents(report.drift):+.2f} drift")
+    if report.mismatches:
+        print(f"{'username':<24} {'stored':>12} {'ledger':>12} {'difference':>12}")
+    for mismatch in report.mismatches[:show]:
+        print(f"{mismatch.username:<24} {from_cents(mismatch.stored):>12.2f} {from_cents(mismatch.expected):>12.2f} "
+              f"{from_cents(mismatch.difference):>+12.2f}")
+    if report.orphans:
+        print(f"{len(report.orphans)} username(s) in the ledger without a player: "
+              + ", ".join(sorted(report.orphans)[:show]))
+    if report.corrected:
+        print(f"Corrected {report.corrected} balance(s)")
+    print(" ".join(f"{stage} {seconds:.2f}s" for stage, seconds in report.timings.items()))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Reconcile player balances with the transaction ledger")
+    arg_parser.add_argument("--fix", action="store_true", help="Write ADJUSTMENT transactions for the mismatches")
+    arg_parser.add_argument("--batch-size", type=int, default=50_000, help="Ledger rows fetched per batch")
+    arg_parser.add_argument("--tolerance", type=float, default=0.01, help="Smallest difference reported")
+    arg_parser.add_argument("--show", type=int, default=20, help="Mismatches listed")
+    args = arg_parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        with profile_sql("reconcile_balances"):
+            report = reconcile_balances(db, args.batch_size, to_cents(args.tolerance))
+            if args.fix:
+                correct_balances(db, report)
+        print_report(report, args.show)
+    finally:
+        db.close()
+    raise SystemExit(1 if report.mismatches and not report.corrected else 0)
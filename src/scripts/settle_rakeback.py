@@ -0,0 +1,52 @@
+"""
+Pay out rakeback for a settlement period, by default the last complete week.
+
+Usage (from src/):
+    python -m scripts.settle_rakeback --dry-run
+    python -m scripts.settle_rakeback --from 2025-06-23 --to 2025-06-29
+    python -m scripts.settle_rakeback --set alice ALL_DOWNLINES 0.3     # then settle as usual
+"""
+import argparse
+from datetime import date, datetime, UTC
+
+from crud.rakeback_settings import set_rakeback
+from db import SessionLocal
+from enums import RakebackType
+from logic.rakeback import RakebackRun, last_week, settle_rakeback
+from utils.money import from_cents
+from utils.sql_profiler import profile_sql
+
+
+def print_run(run: RakebackRun, dry_run: bool):
+    print(("DRY RUN - nothing was written\n" if dry_run else "")
+          + f"Rakeback from {run.from_date} to {run.to_date}")
+    print(f"{'username':<24} {'type':<14} {'rate':>7} {'rake':>12} {'rakeback':>12}")
+    for line in sorted(run.lines, key=lambda line: -line.amount):
+        print(f"{line.username:<24} {line.rakeback_type.value:<14} {line.percentage:>7.2%} "
+              f"{from_cents(line.rake):>12.2f} {from_cents(line.amount):>12.2f}")
+    print(f"{len(run.lines)} player(s), {from_cents(run.total):.2f} in total"
+          + ("" if dry_run else f", {run.created} new transaction(s)"))
+    print(" ".join(f"{stage} {seconds:.3f}s" for stage, seconds in run.timings.items()))
+
+
+if __name__ == '__main__':
+    default_from, default_to = last_week(datetime.now(UTC).date())
+    arg_parser = argparse.ArgumentParser(description="Pay out rakeback for a settlement period")
+    arg_parser.add_argument("--from", dest="from_date", type=date.fromisoformat, default=default_from)
+    arg_parser.add_argument("--to", dest="to_date", type=date.fromisoformat, default=default_to)
+    arg_parser.add_argument("--dry-run", action="store_true", help="Show the rakeback without writing it")
+    arg_parser.add_argument("--set", nargs=3, metavar=("USERNAME", "TYPE", "PERCENTAGE"),
+                            help="Set a player's rakeback type (FLAT or ALL_DOWNLINES) and fraction, then exit")
+    args = arg_parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.set:
+            username, rakeback_type, percentage = args.set
+            set_rakeback(db, username, RakebackType[rakeback_type.upper()], float(percentage))
+            raise SystemExit(0)
+        with profile_sql("settle_rakeback"):
+            run = settle_rakeback(db, args.from_date, args.to_date, dry_run=args.dry_run)
+        print_run(run, args.dry_run)
+    finally:
+        db.close()
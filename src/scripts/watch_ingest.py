@@ -0,0 +1,31 @@
+"""
+Keep the data directory ingested: new ClubGG exports are written to the database once fully copied.
+
+Settings come from the environment / .env: INGEST_WATCH_DIR (default resources/),
+INGEST_WATCH_SETTLE_SECONDS, INGEST_WATCH_POLL_INTERVAL, INGEST_WATCH_WORKERS and INGEST_QUEUE_SIZE.
+
+Usage (from src/):
+    python -m scripts.watch_ingest
+    python -m scripts.watch_ingest --dir ../exports --poll     # force polling, e.g. on network shares
+"""
+import argparse
+import signal
+from pathlib import Path
+
+from logic.ingest_watcher import IngestWatcher
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Ingest new ClubGG exports as they appear")
+    arg_parser.add_argument("--dir", type=Path, help="Directory to watch (default: INGEST_WATCH_DIR)")
+    arg_parser.add_argument("--poll", action="store_true", help="Poll the directory instead of using inotify")
+    arg_parser.add_argument("--skip-existing", action="store_true",
+                            help="Only ingest exports that appear after startup")
+    args = arg_parser.parse_args()
+
+    watcher = IngestWatcher(args.dir, use_inotify=not args.poll)
+    signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+    try:
+        watcher.run(include_existing=not args.skip_existing)
+    except KeyboardInterrupt:
+        watcher.stop()
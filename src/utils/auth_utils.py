@@ -1,5 +1,5 @@
 from datetime import datetime, UTC
-from functools import wraps
+from functools import wraps, lru_cache
 from typing import List
 
 from dotenv import load_dotenv
@@ -17,9 +17,9 @@ from gg_exceptions.auth import AuthenticationError, AuthNotProvided, TokenExpire
 from db import get_db
 from schemas.client_users import UserRole, ClientUserResponse
 from logger import GGLogger
+from utils.metrics import auth_user_cache_total
 
 
-load_dotenv()
 logger = GGLogger(__name__)
 
 
@@ -29,11 +29,21 @@ class AuthSettings(BaseSettings):
     access_token_expire_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES
 
 
-auth_settings = AuthSettings()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache
+def get_auth_settings() -> AuthSettings:
+    load_dotenv()
+    return AuthSettings()
+
+
+@lru_cache
+def get_pwd_context() -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", scheme_name="Bearer Token")
 
 def create_access_token(user: ClientUserResponse) -> str:
+    auth_settings = get_auth_settings()
     to_encode = {"username": user.username, "role": user.role.name, "id": user.id, "exp":
         int(datetime.now(UTC).timestamp() + auth_settings.access_token_expire_minutes * 60)
 }
@@ -48,11 +58,16 @@ def auth_key_builder(func, namespace: str, *args, **kwargs):
     return f"{namespace}"
 
 async def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> ClientUserResponse:
+    auth_settings = get_auth_settings()
     payload = jwt.decode(token, auth_settings.auth_secret_key, auth_settings.auth_algorithm)
     username: str = payload.get("username")
+    cache_hit = True
+
     @cache(expire=CURRENT_USER_CACHE_TTL, namespace=f"auth:{username}", key_builder=auth_key_builder)
     async def get_cached_user() -> dict:
-        logger.info(f"Getting current user from DB")
+        nonlocal cache_hit
+        cache_hit = False
+        logger.debug("Getting current user from DB")
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -68,11 +83,18 @@ async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)
         return user.model_dump()  # Convert to dict for caching
 
     cached_data = await get_cached_user()
+    auth_user_cache_total.inc("hit" if cache_hit else "miss")
     user =  ClientUserResponse.model_validate(cached_data)
     request.state.current_user = user
     return user
 
 
+def get_token_expiry(token: str = Depends(oauth2_scheme)) -> int:
+    """When the request's access token expires, as a Unix timestamp, for responses that outlive the request"""
+    auth_settings = get_auth_settings()
+    return jwt.decode(token, auth_settings.auth_secret_key, auth_settings.auth_algorithm)["exp"]
+
+
 def check_roles(allowed_roles: List[UserRole]):
     def decorator(func):
         @wraps(func)
@@ -89,7 +111,7 @@ def check_roles(allowed_roles: List[UserRole]):
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def authenticate_user(db: Session, username: str, password: str):
@@ -106,6 +128,7 @@ def verify_token(token: str):
     token = token.split(" ")[1] if token.startswith("Bearer ") else token
 
     # Decode and verify token
+    auth_settings = get_auth_settings()
     try:
         jwt.decode(
             token,
@@ -0,0 +1,49 @@
+"""
+A numpy Bloom filter over 64-bit hashes, for "was this key ever seen" checks on whole columns at once.
+
+A Bloom filter never misses a key it was given; it only answers "maybe" for a small share of keys it was not
+given, at about `false_positive_rate`. Callers must treat "maybe" as "go and check".
+"""
+import math
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+_LOW_BITS = np.uint64(0xFFFFFFFF)
+_SHIFT = np.uint64(32)
+
+
+def hash_values(values: Sequence) -> np.ndarray:
+    """Stable uint64 hashes of strings (the same in every process), vectorized"""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)), 64)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self._bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        # Double hashing: the i-th position is h1 + i * h2, both taken from the halves of one 64-bit hash
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        first, step = hashes & _LOW_BITS, (hashes >> _SHIFT) | np.uint64(1)
+        rounds = np.arange(self.hash_count, dtype=np.uint64)
+        return (first[:, None] + rounds * step[:, None]) % np.uint64(self.size)
+
+    def add(self, hashes: np.ndarray):
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self._bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def might_contain(self, hashes: np.ndarray) -> np.ndarray:
+        """Per hash: False when it was certainly never added, True when it may have been"""
+        positions = self._positions(hashes)
+        bits = (self._bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bits.nbytes
@@ -0,0 +1,89 @@
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from fastapi import Request, Response
+
+from clients.response_cache import response_cache, CachedResponse
+
+
+def player_tag(username: str) -> str:
+    return f"player:{username}"
+
+
+def roster_tag(player_id: str = None) -> str:
+    """Tag of the roster below `player_id`, or of the whole club roster when no id is given."""
+    return f"roster:{player_id}" if player_id else "roster"
+
+
+def ledger_tag(username: str) -> str:
+    return f"ledger:{username}"
+
+
+def response_cache_key(request: Request, username: str) -> str:
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    return f"{username}:{request.url.path}?{query}"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as the same entry may be served compressed or not
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def accepts_gzip(request: Request) -> bool:
+    """Whether Accept-Encoding allows gzip, by name or through `*`, with a non-zero q-value"""
+    qualities = {}
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, *params = (part.strip() for part in coding.split(";"))
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+    quality = qualities.get("gzip", qualities.get("x-gzip", qualities.get("*", 0.0)))
+    return quality > 0
+
+
+def cached_json_response(request: Request, username: str, tags: Iterable[str],
+                         build: Callable[[], Union[Tuple[bytes, List[str]],
+                                                   Tuple[bytes, List[str], Dict[str, str]]]]) -> Response:
+    """
+    Serve a JSON response for `username` from the response cache.
+
+    `build` is only called on a miss and returns the serialized body together with any tags
+    that are only known once the data has been read (e.g. the agents of a super agent), and
+    optionally the headers that go with the body (e.g. the cursor of the next page).
+    Polls whose If-None-Match matches the cached ETag get an empty 304.
+    """
+    key = response_cache_key(request, username)
+    entry = response_cache.get(key)
+    if entry is None:
+        version = response_cache.version()
+        body, extra_tags, *headers = build()
+        entry = response_cache.set(key, body, [*tags, *extra_tags], version, *headers)
+    return _to_response(request, entry)
+
+
+def _to_response(request: Request, entry: CachedResponse) -> Response:
+    headers = {
+        **entry.headers,
+        "ETag": entry.etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization, Accept-Encoding",
+    }
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    if entry.compressible and accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=entry.gzipped, media_type="application/json", headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
@@ -0,0 +1,178 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from logger import GGLogger
+
+logger = GGLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Office lock files and the usual partial-download suffixes
+_TEMPORARY_PREFIXES = ("~$", ".")
+_TEMPORARY_SUFFIXES = (".tmp", ".part", ".crdownload", ".download")
+
+FileStat = Tuple[int, int]
+
+
+class _Inotify:
+    """Minimal inotify binding over libc, one non-recursive watch on a single directory."""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """Names of the files that changed, or None when the kernel queue overflowed and events were lost."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names, offset = set(), 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """
+    Reports files in a directory once they are complete, through inotify or, where that is unavailable,
+    by polling the directory.
+
+    A changed file only counts as complete after its size and modification time stayed the same for
+    `settle_seconds`, so an export that is still being copied or downloaded is never picked up half written.
+    """
+
+    def __init__(self, directory: Path, pattern: str = "*.xlsx", settle_seconds: float = 2.0,
+                 poll_interval: float = 5.0, use_inotify: bool = True):
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self._reported: Dict[Path, FileStat] = {}
+        # Changed files waiting to settle: the stat they were last seen with and since when
+        self._candidates: Dict[Path, Tuple[FileStat, float]] = {}
+        self._stop = threading.Event()
+
+        self._inotify: Optional[_Inotify] = None
+        if use_inotify:
+            try:
+                self._inotify = _Inotify(self.directory)
+            except (OSError, AttributeError) as e:
+                logger.warning('inotify unavailable (%s), polling %s every %ss', e, self.directory, poll_interval)
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify else "polling"
+
+    def existing_files(self) -> List[Path]:
+        """Files already in the directory, marked as reported so only later changes are watched."""
+        files = []
+        for path in self._scan():
+            stat = self._stat(path)
+            if stat:
+                self._reported[path] = stat
+                files.append(path)
+        return files
+
+    def watch(self) -> Iterator[List[Path]]:
+        """Yield batches of complete new or rewritten files until stop() is called."""
+        try:
+            while not self._stop.is_set():
+                timeout = min(self.settle_seconds, self.poll_interval) if self._candidates else self.poll_interval
+                for path in self._changed(timeout):
+                    self._touch(path)
+                ready = self._settled()
+                if ready:
+                    yield ready
+        finally:
+            if self._inotify:
+                self._inotify.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def _changed(self, timeout: float) -> Iterable[Path]:
+        if not self._inotify:
+            self._stop.wait(timeout)
+            return self._scan()
+        # Wake up regularly to notice stop()
+        names = self._inotify.read(min(timeout, 1.0))
+        if names is None:
+            logger.warning('inotify queue overflowed, rescanning %s', self.directory)
+            return self._scan()
+        return [self.directory / name for name in names if self._matches(name)]
+
+    def _scan(self) -> List[Path]:
+        with os.scandir(self.directory) as entries:
+            return [Path(entry.path) for entry in entries if entry.is_file() and self._matches(entry.name)]
+
+    def _matches(self, name: str) -> bool:
+        return (fnmatch(name, self.pattern) and not name.startswith(_TEMPORARY_PREFIXES)
+                and not name.endswith(_TEMPORARY_SUFFIXES))
+
+    @staticmethod
+    def _stat(path: Path) -> Optional[FileStat]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _touch(self, path: Path):
+        stat = self._stat(path)
+        if stat is None or stat == self._reported.get(path):
+            self._candidates.pop(path, None)
+            return
+        if path not in self._candidates or self._candidates[path][0] != stat:
+            self._candidates[path] = (stat, time.monotonic())
+
+    def _settled(self) -> List[Path]:
+        now, ready = time.monotonic(), []
+        for path, (stat, since) in list(self._candidates.items()):
+            current = self._stat(path)
+            if current is None:
+                del self._candidates[path]
+            elif current != stat:
+                self._candidates[path] = (current, now)
+            elif now - since >= self.settle_seconds and stat[0] > 0:
+                del self._candidates[path]
+                self._reported[path] = stat
+                ready.append(path)
+        return ready
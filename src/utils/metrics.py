@@ -0,0 +1,183 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+INGEST_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(self._value)}"]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (last slot is +Inf), sum, count
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._series.items()]
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _format_value(bound)
+                labels = _format_labels(self.labelnames, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.register(Counter(
+    "gg_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_request_duration = registry.register(Histogram(
+    "gg_http_request_duration_seconds", "HTTP request latency", ("method", "route")))
+db_queries_per_request = registry.register(Histogram(
+    "gg_db_queries_per_request", "Database queries issued per HTTP request", ("route",), QUERY_COUNT_BUCKETS))
+db_time_per_request = registry.register(Histogram(
+    "gg_db_time_per_request_seconds", "Time spent in the database per HTTP request", ("route",)))
+db_queries_total = registry.register(Counter(
+    "gg_db_queries_total", "Database queries issued"))
+db_query_seconds_total = registry.register(Counter(
+    "gg_db_query_seconds_total", "Time spent executing database queries"))
+auth_user_cache_total = registry.register(Counter(
+    "gg_auth_user_cache_total", "get_current_user cache lookups", ("result",)))
+rate_limit_rejections_total = registry.register(Counter(
+    "gg_rate_limit_rejections_total", "Requests rejected by the rate limiter", ("scope",)))
+ingest_stage_duration = registry.register(Histogram(
+    "gg_ingest_stage_duration_seconds", "Duration of ingest stages", ("parser", "stage"), INGEST_BUCKETS))
+ingest_pipeline_items_total = registry.register(Counter(
+    "gg_ingest_pipeline_items_total", "Items handled by each ingest pipeline stage", ("stage", "outcome")))
+ingest_pipeline_stage_duration = registry.register(Histogram(
+    "gg_ingest_pipeline_stage_duration_seconds", "Time an ingest pipeline stage spends on one item", ("stage",),
+    INGEST_BUCKETS))
+event_streams_active = registry.register(Gauge(
+    "gg_event_streams_active", "Open /events streams"))
+events_total = registry.register(Counter(
+    "gg_events_total", "Events handed to /events streams, and dropped for slow ones", ("outcome",)))
+
+
+@dataclass
+class RequestDBStats:
+    queries: int = 0
+    seconds: float = 0.0
+
+
+# Set by the metrics middleware for the duration of an HTTP request
+request_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar("request_db_stats", default=None)
+
+
+# On the execution context, which goes away with its statement: a statement that raises never reaches
+# after_cursor_execute, and a start kept on the pooled connection would stay there
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._gg_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_gg_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    db_queries_total.inc()
+    db_query_seconds_total.inc(amount=elapsed)
+    stats = request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def instrument_engine(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,42 @@
+"""
+Money is held as integer cents everywhere below the API: the parser's arrays, the BIGINT columns and every
+sum and balance update in between. Sums are exact, so nothing is rounded after the parser.
+
+Amounts are only converted at the boundaries: report values into cents when a file is parsed, and cents back
+into currency units when a response is serialized or an amount comes in with a request.
+"""
+import math
+from typing import Annotated, Iterable, Optional, Union
+
+import numpy as np
+from pydantic import PlainSerializer
+
+CENTS = 100
+
+
+def to_cents(amount: Optional[float]) -> int:
+    """Currency units to cents, rounding half away from zero; a missing amount is 0"""
+    if amount is None:
+        return 0
+    # Rounding the product first undoes float noise such as 0.285 * 100 == 28.499999999999996
+    cents = round(float(amount) * CENTS, 6)
+    return int(math.copysign(math.floor(abs(cents) + 0.5), cents))
+
+
+def round_cents(cents: np.ndarray) -> np.ndarray:
+    """Fractional cents to whole int64 cents, rounding half away from zero; NaN is 0"""
+    cents = np.round(cents, 6)
+    return np.nan_to_num(np.trunc(cents + np.copysign(0.5, cents)), nan=0).astype(np.int64)
+
+
+def to_cents_array(amounts: Union[np.ndarray, Iterable]) -> np.ndarray:
+    """`to_cents` over a whole column at once, as int64; missing amounts are 0"""
+    return round_cents(np.asarray(amounts, dtype=np.float64) * CENTS)
+
+
+def from_cents(cents: Optional[int]) -> Optional[float]:
+    return None if cents is None else cents / CENTS
+
+
+# An amount in cents, written out in currency units when a schema is serialized to JSON
+Cents = Annotated[int, PlainSerializer(from_cents, return_type=float, when_used="json")]
@@ -0,0 +1,165 @@
+import json
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, UTC
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from pydantic_settings import BaseSettings
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from logger import GGLogger
+
+logger = GGLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class ProfilerSettings(BaseSettings):
+    sql_profile: bool = False
+    sql_profile_dir: str = "sql_profiles"
+    # Statements of the same shape issued at least this many times in one unit are flagged as N+1 suspects
+    sql_profile_repeat_threshold: int = 5
+
+
+@lru_cache
+def get_profiler_settings() -> ProfilerSettings:
+    load_dotenv()
+    return ProfilerSettings()
+
+
+def normalize_sql(statement: str) -> str:
+    """Reduce a statement to its shape: literals and bind parameters become `?`, IN lists collapse."""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class SQLProfile:
+    """Every statement executed during one request or script run, with its timing."""
+
+    def __init__(self, name: str, repeat_threshold: int):
+        self.name = name
+        self.repeat_threshold = repeat_threshold
+        self.started_at = datetime.now(UTC)
+        self.statements: List[tuple] = []  # (statement, parameters repr, seconds)
+
+    def record(self, statement: str, parameters, seconds: float):
+        self.statements.append((statement, repr(parameters), seconds))
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(seconds for _, _, seconds in self.statements)
+
+    def groups(self) -> List[Dict]:
+        grouped: Dict[str, Dict] = {}
+        executions = defaultdict(int)
+        for statement, parameters, seconds in self.statements:
+            shape = normalize_sql(statement)
+            group = grouped.setdefault(shape, {"sql": shape, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                                "duplicates": 0})
+            group["count"] += 1
+            group["total_ms"] += seconds * 1000
+            group["max_ms"] = max(group["max_ms"], seconds * 1000)
+            # Exactly the same statement with the same parameters, the result could have been reused
+            executions[(statement, parameters)] += 1
+            if executions[(statement, parameters)] > 1:
+                group["duplicates"] += 1
+        return sorted(grouped.values(), key=lambda g: g["total_ms"], reverse=True)
+
+    def repeated(self, groups: Optional[List[Dict]] = None) -> List[Dict]:
+        """Groups issued often enough to look like a query per row (N+1)."""
+        groups = self.groups() if groups is None else groups
+        return [group for group in groups if group["count"] >= self.repeat_threshold]
+
+    def summary_header(self) -> str:
+        groups = self.groups()
+        duplicates = sum(group["duplicates"] for group in groups)
+        return (f"queries={len(self.statements)}; time_ms={self.total_seconds * 1000:.1f}; "
+                f"shapes={len(groups)}; repeated={len(self.repeated(groups))}; duplicates={duplicates}")
+
+    def to_dict(self) -> Dict:
+        groups = self.groups()
+        return {
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "queries": len(self.statements),
+            "total_ms": round(self.total_seconds * 1000, 3),
+            "repeat_threshold": self.repeat_threshold,
+            "repeated": self.repeated(groups),
+            "groups": groups,
+            "statements": [{"sql": statement, "ms": round(seconds * 1000, 3)}
+                           for statement, _, seconds in self.statements],
+        }
+
+    def dump(self, directory: str) -> Path:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        safe_name = re.sub(r"[^\w.-]+", "_", self.name).strip("_") or "profile"
+        file = path / f"{self.started_at.strftime('%Y%m%dT%H%M%S%f')}_{safe_name}.json"
+        file.write_text(json.dumps(self.to_dict(), indent=2))
+        return file
+
+
+current_profile: ContextVar[Optional[SQLProfile]] = ContextVar("current_sql_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context rather than the pooled connection, so a statement that raises leaves nothing behind
+    if context is not None and current_profile.get() is not None:
+        context._gg_profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    start = getattr(context, "_gg_profile_start", None)
+    if profile is not None and start is not None:
+        profile.record(statement, parameters, time.perf_counter() - start)
+
+
+def instrument_engine(engine: Engine):
+    """Hook the profiler into the engine, only when profiling is enabled (SQL_PROFILE=true)."""
+    if get_profiler_settings().sql_profile:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def start_profile(name: str) -> SQLProfile:
+    return SQLProfile(name, get_profiler_settings().sql_profile_repeat_threshold)
+
+
+def report_profile(profile: SQLProfile) -> Path:
+    path = profile.dump(get_profiler_settings().sql_profile_dir)
+    for group in profile.repeated():
+        logger.warning("Repeated query in %s (%s times, %.1f ms): %s",
+                       profile.name, group["count"], group["total_ms"], group["sql"])
+    return path
+
+
+@contextmanager
+def profile_sql(name: str):
+    """Profile the statements of a script run, writing the JSON report on exit. A no-op unless enabled."""
+    if not get_profiler_settings().sql_profile:
+        yield None
+        return
+
+    profile = start_profile(name)
+    token = current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        current_profile.reset(token)
+        path = report_profile(profile)
+        logger.info("SQL profile for %s: %s (%s)", name, profile.summary_header(), path)